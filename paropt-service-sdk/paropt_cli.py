@@ -14,6 +14,10 @@ from paropt_sdk.client import ParoptClient
 FILE_TYPE_MSG = 'Files provided must end with .yaml, .yml, or .json'
 SECONDS_IN_DAY = 86400
 MAX_FAILS = 3
+# seconds the server may hold a progress request waiting for an update
+LONG_POLL_SECONDS = 30
+# seconds between progress requests while the job is still queued
+QUEUED_POLL_SECONDS = 5
 
 def printResponse(response: GlobusHTTPResponse):
   """Prints basic response info"""
@@ -29,8 +33,16 @@ def httpOK(response: GlobusHTTPResponse) -> bool:
   """Determines if response status code is in ok range"""
   return 200 <= response.http_status <= 299
 
+def printProgress(progress: dict):
+  """Prints a progress update of a run"""
+  eta = progress.get('eta')
+  eta_str = f', about {eta / 60:.1f} minutes left' if eta is not None else ''
+  print(f"Trials done: {progress.get('n_trials')} ({progress.get('n_failed')} failed), "
+        f"best outcome: {progress.get('best_outcome')} with {progress.get('best_parameters')}{eta_str}")
+
 def waitForJob(po: ParoptClient, job_id: str, max_wait: int, sleep_interval=1) -> bool:
-  """Wait for job to finish. Raises exception if timesout or fails to get response too many times
+  """Wait for job to finish, printing its progress after every trial. Raises exception if timesout or fails to get
+  response too many times
 
   Parameters
   ----------
@@ -41,7 +53,7 @@ def waitForJob(po: ParoptClient, job_id: str, max_wait: int, sleep_interval=1) -
   max_wait : int
     maximum number of minutes to wait. If negative, will wait for 24 hours
   sleep_interval : int
-    minutes to sleep between checks if the job is finished
+    minutes to wait after an unexpected response before checking again
   
   Returns
   -------
@@ -54,27 +66,35 @@ def waitForJob(po: ParoptClient, job_id: str, max_wait: int, sleep_interval=1) -
   # convert sleep interval to seconds
   sleep_interval_secs = sleep_interval * 60
   n_fails = 0
+  n_trials = 0
 
+  print("Job running, waiting for progress...")
   while time.time() < timeout and n_fails < MAX_FAILS:
-    print(f"Job running, going to sleep for {sleep_interval} minutes...")
-    time.sleep(sleep_interval_secs)
-    job_res = po.getJob(job_id)
+    # the server holds the request until the run makes progress, so updates show up as soon as they happen
+    wait = max(min(LONG_POLL_SECONDS, timeout - time.time()), 0)
+    job_res = po.getJobProgress(job_id, since=n_trials, wait=wait)
     if job_res.http_status == 200:
-      job_data = job_res.data.get('job', {})
-      job_status = job_data.get('job_status')
+      job_status = job_res.data.get('job_status')
+      progress = job_res.data.get('progress') or {}
+      if progress.get('n_trials', 0) > n_trials:
+        n_trials = progress['n_trials']
+        printProgress(progress)
       if job_status == 'finished':
         return True
       elif job_status == 'failed':
+        job_data = po.getJob(job_id).data.get('job', {})
         raise Exception(f'Server failed to run trials. See error info below (from server):\n'
                         f'{job_data.get("job_exc_info", "")}'.replace('\n', '\n| '))
-      else:
-        # still running
-        continue
+      elif job_status == 'queued' and wait > 0:
+        # progress isn't published before the job starts
+        time.sleep(min(QUEUED_POLL_SECONDS, wait))
+      continue
     else:
       # something unexpected happened
       n_fails += 1
       print("WARNING: Unexpected response:")
       printResponse(job_res)
+      time.sleep(sleep_interval_secs)
       continue
   
   # failed to finish job in max time or too many fails occurred
@@ -93,16 +113,59 @@ def loadYmlJson(file_path: str):
     else:
       return None
 
+def runSweep(args) -> int:
+  """Submit the experiments of a sweep file in one request, then wait for their jobs. Returns the exit code"""
+  sweep = loadYmlJson(args.sweep)
+  if not isinstance(sweep, list):
+    print(f'Sweep must be a list of experiment and optimizer paths. {FILE_TYPE_MSG}')
+    return 1
+  submissions = []
+  for entry in sweep:
+    experiment = loadYmlJson(entry['experiment'])
+    optimizer = loadYmlJson(entry['optimizer'])
+    if experiment == None or optimizer == None:
+      print(FILE_TYPE_MSG)
+      return 1
+    submissions.append({'experiment': experiment, 'run': optimizer})
+
+  try:
+    print("\n---- Creating client ----")
+    po = ParoptClient()
+
+    print(f"\n---- Submitting {len(submissions)} experiments ----")
+    batch_res = po.submitExperiments(submissions)
+    printResponse(batch_res)
+    if not httpOK(batch_res):
+      raise Exception("Failed to submit experiments:\n {}".format(batch_res.data))
+    job_ids = [result['job_id'] for result in batch_res.data['results'] if result['status'] == 'submitted']
+
+    print("\n---- Starting to wait for jobs to finish ----")
+    if args.maxwait != 0:
+      for job_id in job_ids:
+        print(f'Waiting for job {job_id}')
+        waitForJob(po, job_id, args.maxwait, args.sleepdur)
+      print('Successfully ran trials for experiments')
+    else:
+      print("Max wait == 0, not waiting for jobs to finish...")
+
+    print("\n---- Finished ----")
+    return 0 if len(job_ids) == len(submissions) else 1
+  except:
+    print("\n---- Error ----")
+    raise
+
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Python cli for interacting with paropt service')
   parser.add_argument('--experiment',
                       type=str,
-                      required=True,
-                      help='path to experiment yaml or json')
+                      help='path to experiment yaml or json; required without --sweep')
   parser.add_argument('--optimizer',
                       type=str,
-                      required=True,
-                      help='path to optimizer experiment or json')
+                      help='path to optimizer experiment or json; required without --sweep')
+  parser.add_argument('--sweep',
+                      type=str,
+                      default=None,
+                      help='path to yaml or json list of {experiment: <path>, optimizer: <path>} to submit in one request')
   parser.add_argument('--maxwait',
                       type=int,
                       default=0,
@@ -110,9 +173,18 @@ if __name__ == '__main__':
   parser.add_argument('--sleepdur',
                       type=int,
                       default=1,
-                      help='determines polling interval in minutes when maxwait != 0')
+                      help='minutes to wait before retrying after an unexpected response when maxwait != 0')
+  parser.add_argument('--export',
+                      type=str,
+                      default=None,
+                      help='path of a .parquet or .arrow file to download the experiment\'s trials to at the end')
   args = parser.parse_args()
 
+  if args.sweep != None:
+    sys.exit(runSweep(args))
+  if args.experiment == None or args.optimizer == None:
+    parser.error('--experiment and --optimizer are required without --sweep')
+
   # get experiment data
   experiment = loadYmlJson(args.experiment)
   if experiment == None:
@@ -149,10 +221,16 @@ if __name__ == '__main__':
     
     print("\n---- Starting to wait for job to finish ----")
     if args.maxwait != 0:
-      waitForJob(po, submitted_job_id, args.maxwait)
+      waitForJob(po, submitted_job_id, args.maxwait, args.sleepdur)
       print('Successfully ran trials for experiment')
     else:
       print("Max wait == 0, not waiting for job to finish...")
+
+    if args.export != None:
+      print("\n---- Exporting trials ----")
+      export_format = 'arrow' if args.export.endswith('.arrow') or args.export.endswith('.feather') else 'parquet'
+      po.exportTrials(exp_id, args.export, export_format)
+      print(f'Wrote trials to {args.export}')
       
     print("\n---- Finished ----")
 
@@ -63,13 +63,68 @@ class ParoptClient(BaseClient):
                          json_body=experiment,
                          headers={'content-type': 'application/json'})
 
+    def submitExperiments(self, submissions):
+        """Get or create many experiments and run each of them with one request
+        Args:
+            submissions (list): dicts with 'experiment', as for getOrCreateExperiment, and 'run', the optimizer
+                config as for runTrial
+        """
+        return self.post('/experiments/batch',
+                         json_body={'experiments': submissions},
+                         headers={'content-type': 'application/json'})
+
     def runTrial(self, experiment_id, optimizer):
         return self.post(f'/experiments/{experiment_id}/trials',
                          json_body=optimizer,
                          headers={'content-type': 'application/json'})
 
-    def getTrials(self, experiment_id):
-        return self.get(f'/experiments/{experiment_id}/trials')
+    def getTrials(self, experiment_id, **params):
+        """Get a page of trials of an experiment
+        Args:
+            experiment_id (int): id of experiment
+            params: query parameters, e.g. limit, cursor, since_trial_id, run_number, status, start_time, end_time,
+                min_outcome, max_outcome. See the service's README
+        """
+        return self.get(f'/experiments/{experiment_id}/trials', params=params)
+
+    def iterTrials(self, experiment_id, **params):
+        """Yield trials of an experiment, fetching the following pages as needed
+        Args:
+            experiment_id (int): id of experiment
+            params: same as for getTrials
+        """
+        while True:
+            page = self.getTrials(experiment_id, **params).data
+            for trial in page['trials']:
+                yield trial
+            if page.get('next_cursor') is None:
+                return
+            params = dict(params, cursor=page['next_cursor'])
+
+    def getExperimentSummary(self, experiment_id):
+        return self.get(f'/experiments/{experiment_id}/summary')
+
+    def exportTrials(self, experiment_id, path, export_format='parquet'):
+        """Download trials of an experiment as a parquet or arrow file, with one column per parameter
+        Args:
+            experiment_id (int): id of experiment
+            path (str): file to write
+            export_format (str): 'parquet' or 'arrow'
+        """
+        url = slash_join(self.base_url, f'/experiments/{experiment_id}/trials/export')
+        response = requests.get(url,
+                                params={'format': export_format},
+                                headers={'Authorization': self.authorizer.get_authorization_header()},
+                                stream=True,
+                                verify=False)
+        response.raise_for_status()
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+        return path
+
+    def getParameterImportance(self, experiment_id):
+        return self.get(f'/experiments/{experiment_id}/importance')
 
     def getRunningExperiments(self):
         return self.get('/jobs/running')
@@ -83,5 +138,23 @@ class ParoptClient(BaseClient):
     def getJob(self, job_id):
         return self.get(f'/jobs/{job_id}')
     
+    def getJobProgress(self, job_id, since=None, wait=None):
+        """Get progress of a job's run
+        Args:
+            job_id (str): id of job
+            since (int): number of trials already seen; with wait, the server responds once the run has done more
+                trials or ended
+            wait (float): maximum seconds for the server to wait for an update, at most 60
+        """
+        params = {}
+        if since is not None:
+            params['since'] = since
+        if wait is not None:
+            params['wait'] = wait
+        return self.get(f'/jobs/{job_id}/progress', params=params)
+
     def getExperimentJob(self, experiment_id):
-        return self.get(f'/experiments/{experiment_id}/job')
\ No newline at end of file
+        return self.get(f'/experiments/{experiment_id}/job')
+
+    def stopExperiment(self, experiment_id):
+        return self.post(f'/experiments/{experiment_id}/stop')
@@ -9,8 +9,9 @@ import os
 from threading import Thread 
 import json
 import traceback
+from datetime import datetime
 
-from flask import Blueprint, jsonify, request, abort, current_app
+from flask import Blueprint, request, abort, current_app, send_file, Response
 
 import psycopg2
 
@@ -18,6 +19,7 @@ import redis
 from rq import Queue, Connection
 
 from .utils import login_required
+from .responses import jsonResponse, compressResponse
 
 from .paropt_manager import ParoptManager
 
@@ -27,6 +29,11 @@ from paropt.storage import LocalFile, RelationalDB
 from paropt.optimizer import BayesianOptimizer, GridSearch
 
 api = Blueprint("api", __name__)
+api.after_request(compressResponse)
+
+TRIALS_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 500
+MAX_TRIALS_PAGE_SIZE = 10000
 
 @api.route('/experiments', methods=['POST'])
 @login_required
@@ -54,7 +61,7 @@ def getOrCreateExperiment():
         return "Must include json body and content type header to create experiment", 400
     try:
         experiment_dict = ParoptManager.getOrCreateExperiment(request_data)
-        return jsonify(experiment_dict), 200
+        return jsonResponse(experiment_dict), 200
     except psycopg2.OperationalError as e:
         print("DB Error: {}".format(e))
         print(traceback.format_exc())
@@ -64,6 +71,37 @@ def getOrCreateExperiment():
         print(traceback.format_exc())
         return "Failed to get/create experiment: {}".format(e), 500
 
+@api.route('/experiments/batch', methods=['POST'])
+@login_required
+def submitExperiments():
+    """Get or create many experiments and run each of them, e.g. to launch a sweep
+    Expects json body like below, with at most 500 experiments. Each experiment is as for `POST /experiments`
+    and each run as for `POST /experiments/<experiment_id>/trials`
+    ```
+    {
+        "experiments": [
+            {"experiment": <experiment>, "run": <run configuration>},
+            ...
+        ]
+    }
+    ```
+    Responds with a result per experiment, in order: `status` is `submitted` with the `job_id`, or `failed` with a `message`
+    """
+    request_data = request.get_json()
+    submissions = request_data.get('experiments') if isinstance(request_data, dict) else None
+    if not isinstance(submissions, list) or not all(isinstance(submission, dict) for submission in submissions):
+        return "Must include json body with a list of experiments and content type header to submit experiments", 400
+    if len(submissions) > MAX_BATCH_SIZE:
+        return "At most {} experiments can be submitted at once".format(MAX_BATCH_SIZE), 400
+    try:
+        results = ParoptManager.submitExperiments(submissions)
+    except psycopg2.OperationalError as e:
+        print("DB Error: {}".format(e))
+        print(traceback.format_exc())
+        return "Failed to get/create experiments due to database error. Please retry your request", 500
+    n_submitted = sum(result['status'] == 'submitted' for result in results)
+    return jsonResponse({'n_submitted': n_submitted, 'results': results}), 202 if n_submitted else 400
+
 @api.route('/experiments/<int:experiment_id>', methods=['GET'])
 @login_required
 def getExperiment(experiment_id):
@@ -73,14 +111,113 @@ def getExperiment(experiment_id):
         return "No experiment with id {}".format(experiment_id), 404
     # experiment_dict = experiment.asdict()
     experiment['job'] = ParoptManager.jobToDict(ParoptManager.getRunningExperiment(experiment_id))
-    return jsonify(experiment), 200
+    return jsonResponse(experiment), 200
 
 @api.route('/experiments/<int:experiment_id>/trials', methods=['GET'])
 @login_required
 def getTrials(experiment_id):
-    """Get all recorded trials for experiment"""
-    trials = ParoptManager.getTrials(experiment_id)
-    return jsonify(trials), 200
+    """Get recorded trials for experiment, ordered by id, a page at a time
+    Query parameters, all optional:
+    * `limit`: trials per page, at least 1, default 1000, at most 10000
+    * `cursor`: `next_cursor` of the previous page
+    * `since_trial_id`: only trials saved after the trial with this id, for fetching new trials
+    * `run_number`, `status` (`succeeded` or `failed`)
+    * `start_time`, `end_time`: ISO 8601 timestamps, end exclusive
+    * `min_outcome`, `max_outcome`: inclusive
+    Responds with `{"trials": [...], "next_cursor": <cursor of the next page or null>}`.
+    Supports `If-None-Match`: responds `304` when no trial was saved since the response with that `ETag`
+    """
+    try:
+        limit = min(_queryArg('limit', int, TRIALS_PAGE_SIZE), MAX_TRIALS_PAGE_SIZE)
+        cursors = [_queryArg(name, int) for name in ('cursor', 'since_trial_id')]
+        cursors = [cursor for cursor in cursors if cursor != None]
+        filters = {
+            'after_id': max(cursors) if cursors else None,
+            'run_number': _queryArg('run_number', int),
+            'start_time': _parseTime(request.args.get('start_time')),
+            'end_time': _parseTime(request.args.get('end_time')),
+            'status': request.args.get('status'),
+            'min_outcome': _queryArg('min_outcome', float),
+            'max_outcome': _queryArg('max_outcome', float),
+        }
+    except ValueError as e:
+        return "Invalid query parameter: {}".format(e), 400
+    if limit < 1:
+        return "Invalid query parameter: limit must be at least 1", 400
+    if filters['status'] not in (None, 'succeeded', 'failed'):
+        return "Unrecognized trial status: {}".format(filters['status']), 400
+
+    # the same url returns the same page until a trial is saved
+    etag = ParoptManager.getTrialsVersion(experiment_id)
+    # compressed responses carry the weak form of the ETag
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    trials, next_cursor = ParoptManager.getTrials(experiment_id, limit=limit, **filters)
+    response = jsonResponse({'trials': trials, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    return response, 200
+
+def _queryArg(name, arg_type, default=None):
+    """Like request.args.get with a type, but raises ValueError for a value that isn't of the type instead of
+    using the default"""
+    value = request.args.get(name)
+    if value == None:
+        return default
+    try:
+        return arg_type(value)
+    except ValueError:
+        raise ValueError(f'invalid {name} {value}')
+
+def _parseTime(value):
+    """Parse an ISO 8601 timestamp without timezone, e.g. 2019-06-01T12:00:00 or 2019-06-01"""
+    if value == None:
+        return None
+    for time_format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError(f'invalid timestamp {value}')
+
+@api.route('/experiments/<int:experiment_id>/summary', methods=['GET'])
+@login_required
+def getExperimentSummary(experiment_id):
+    """Get best trial, trial and failure counts, running time and convergence of the experiment and each run"""
+    summary = ParoptManager.getExperimentSummary(experiment_id)
+    if summary == None:
+        return "No trials for experiment with id {}".format(experiment_id), 404
+    return jsonResponse(summary), 200
+
+@api.route('/experiments/<int:experiment_id>/trials/export', methods=['GET'])
+@login_required
+def exportTrials(experiment_id):
+    """Download all recorded trials for experiment as a table with one column per parameter
+    Use the `format` query parameter to choose between `parquet` (default) and `arrow`
+    """
+    export_format = request.args.get('format', 'parquet')
+    if export_format not in ('parquet', 'arrow'):
+        return "Unrecognized export format: {}".format(export_format), 400
+    path = ParoptManager.exportTrials(experiment_id, export_format)
+    if path == None:
+        return "No experiment with id {}".format(experiment_id), 404
+    export_file = open(path, 'rb')
+    # the open file is still readable after removing it
+    os.remove(path)
+    return send_file(export_file,
+                     mimetype='application/octet-stream',
+                     as_attachment=True,
+                     attachment_filename=f'experiment_{experiment_id}_trials.{export_format}')
+
+@api.route('/experiments/<int:experiment_id>/importance', methods=['GET'])
+@login_required
+def getParameterImportance(experiment_id):
+    """Get importance of each parameter for the outcome of the experiment, computed from its trials"""
+    importance = ParoptManager.getParameterImportance(experiment_id)
+    if importance == None:
+        return "No experiment with id {}".format(experiment_id), 404
+    return jsonResponse(importance), 200
 
 @api.route('/experiments/<int:experiment_id>/trials', methods=['POST'])
 @login_required
@@ -92,8 +229,13 @@ def runTrials(experiment_id):
         "optimizer": {
             "type": "bayesopt" | "grid",
             [optimizer_specific_params]
-        }
+        },
+        "prune_after": <number of trials before pruning unimportant parameters, optional>,
+        "prune_threshold": <importance below which parameters are pruned, optional, default 0.05>,
+        "priority": "high" | "default" | "low" (optional, default "default")
     }
+    Jobs go to a queue per compute type and priority. Submissions are rejected when the compute type already
+    has its maximum number of queued and running jobs (MAX_EC2_JOBS and MAX_LOCAL_JOBS)
     ```
     """
     request_data = request.get_json()
@@ -101,39 +243,43 @@ def runTrials(experiment_id):
 
     result = ParoptManager.runTrials(experiment_id, request_data)
     if result['status'] == 'submitted':
-        return jsonify(result), 202
-    return jsonify(result), 400
+        return jsonResponse(result), 202
+    return jsonResponse(result), 400
 
 @api.route('/jobs/running', methods=['GET'])
 @login_required
 def getRunningExperiments():
     """Get currently running experiments"""
     running_exps = ParoptManager.getRunningExperiments()
-    running_exps = [ParoptManager.jobToDict(job) for job in running_exps]
-    return jsonify(running_exps)
+    running_exps = [ParoptManager.jobToDict(job, refresh=False) for job in running_exps]
+    return jsonResponse(running_exps)
 
 @api.route('/jobs/failed', methods=['GET'])
 @login_required
 def getFailedExperiments():
     """Get failed experiments"""
     failed_exps = ParoptManager.getFailedExperiments()
-    failed_exps = [ParoptManager.jobToDict(job) for job in failed_exps]
-    return jsonify(failed_exps)
+    failed_exps = [ParoptManager.jobToDict(job, refresh=False) for job in failed_exps]
+    return jsonResponse(failed_exps)
 
 @api.route('/jobs/queued', methods=['GET'])
 @login_required
 def getQueuedExperiments():
     """Get queued jobs"""
     queued_exps = ParoptManager.getQueuedJobs()
-    queued_exps = [ParoptManager.jobToDict(job) for job in queued_exps]
-    return jsonify(queued_exps)
+    queued_exps = [ParoptManager.jobToDict(job, refresh=False) for job in queued_exps]
+    return jsonResponse(queued_exps)
 
 @api.route('/experiments/<int:experiment_id>/stop', methods=['POST'])
 @login_required
 def stopExperiment(experiment_id):
-    """Stop a running experiment"""
+    """Stop the queued or running job of an experiment
+    A running job kills its current trial and keeps the trials completed so far
+    """
     stop_res = ParoptManager.stopExperiment(experiment_id)
-    return jsonify(stop_res)
+    if stop_res['status'] == 'failed':
+        return jsonResponse(stop_res), 404
+    return jsonResponse(stop_res), 202
 
 @api.route('/experiments/<int:experiment_id>/job', methods=['GET'])
 @login_required
@@ -141,9 +287,9 @@ def getExperimentJob(experiment_id):
     job = ParoptManager.getExperimentJob(experiment_id)
     job_dict = ParoptManager.jobToDict(job)
     if job == None:
-        return jsonify({'status': 'missing', 'job': job_dict}), 404
+        return jsonResponse({'status': 'missing', 'job': job_dict}), 404
     else:
-        return jsonify({'status': 'success', 'job': job_dict}), 200
+        return jsonResponse({'status': 'success', 'job': job_dict}), 200
 
 @api.route('/jobs/<string:job_id>', methods=['GET'])
 @login_required
@@ -151,6 +297,33 @@ def getJob(job_id):
     job = ParoptManager.getJob(job_id)
     job_dict = ParoptManager.jobToDict(job)
     if job == None:
-        return jsonify({'status': 'missing', 'job': job_dict}), 404
+        return jsonResponse({'status': 'missing', 'job': job_dict}), 404
     else:
-        return jsonify({'status': 'success', 'job': job_dict}), 200
+        return jsonResponse({'status': 'success', 'job': job_dict}), 200
+
+@api.route('/jobs/<string:job_id>/progress', methods=['GET'])
+@login_required
+def getJobProgress(job_id):
+    """Get progress of a job's run: trials done and failed, best outcome and parameters, and estimated time remaining
+    Long-polls when given `since` (number of trials already seen) and `wait` (seconds, at most 60):
+    responds as soon as the run has done more trials or ended, or after `wait` seconds
+    """
+    since = request.args.get('since', type=int)
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    progress = ParoptManager.getJobProgress(job_id, since=since, wait=wait)
+    if progress == None:
+        return jsonResponse({'status': 'missing', 'job_id': job_id}), 404
+    return jsonResponse(progress), 200
+
+@api.route('/jobs/<string:job_id>/progress/stream', methods=['GET'])
+@login_required
+def streamJobProgress(job_id):
+    """Stream progress of a job's run as server-sent events
+    Sends a `progress` event with the current progress, one after every trial, and an `end` event when the run ends.
+    Each open stream holds a server worker, so clients that can't keep a connection open should long-poll instead
+    """
+    if ParoptManager.getJob(job_id) == None:
+        return jsonResponse({'status': 'missing', 'job_id': job_id}), 404
+    return Response(ParoptManager.streamJobProgress(job_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
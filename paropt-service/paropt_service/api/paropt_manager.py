@@ -1,24 +1,31 @@
 import multiprocessing
 import atexit
+import json
 import os
+import tempfile
 import time
+import uuid
 
 from flask import current_app
 
 import redis
-from rq import Queue, Connection
+from rq import Queue, get_current_job
 from rq.registry import StartedJobRegistry, FailedJobRegistry, DeferredJobRegistry
 from rq.job import Job
 from rq.exceptions import NoSuchJobError
 
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, in_production, getAWSConfig
+from config import (DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_RECYCLE,
+                    MAX_JOBS_PER_COMPUTE, EXECUTOR_IDLE_TIMEOUT, in_production, getAWSConfig)
 
 import parsl
 
 import paropt
 from paropt.runner import ParslRunner
 from paropt.storage import LocalFile, RelationalDB
+from paropt.storage.export import exportTrials
 from paropt.optimizer import BayesianOptimizer, GridSearch, RandomSearch, CoordinateSearch
+from paropt.stopping import stoppingPolicyFromConfig
+from paropt.analysis import parameterImportance
 from paropt.runner.parsl import *
 from paropt.storage.entities import Parameter, Experiment, EC2Compute, LocalCompute
 
@@ -44,12 +51,16 @@ def getOptimizer(optimizer_config):
         return BayesianOptimizer(n_init=2, n_iter=2)
 
     optimizer_type = optimizer_config.get('type')
+    try:
+        stopping_policy = stoppingPolicyFromConfig(get_from_dic(optimizer_config, 'stopping'))
+    except:
+        return None
     if optimizer_type == 'grid':
         num_configs_per_param = optimizer_config.get('num_configs_per_param')
         try:
             # num_configs_per_param = int(num_configs_per_param)
             num_configs_per_param = list(num_configs_per_param)
-            return GridSearch(num_configs_per_param=num_configs_per_param)
+            return GridSearch(num_configs_per_param=num_configs_per_param, stopping_policy=stopping_policy)
         except:
             return None
 
@@ -72,6 +83,14 @@ def getOptimizer(optimizer_config):
         n_init = get_from_dic(optimizer_config, 'n_init')
         alpha = get_from_dic(optimizer_config, 'alpha')
         kappa = get_from_dic(optimizer_config, 'kappa')
+        warm_start = bool(get_from_dic(optimizer_config, 'warm_start'))
+        warm_start_weight = get_from_dic(optimizer_config, 'warm_start_weight')
+        warm_start_weight = 0.5 if warm_start_weight is None else float(warm_start_weight)
+        cost_aware = bool(get_from_dic(optimizer_config, 'cost_aware'))
+        n_candidates = get_from_dic(optimizer_config, 'n_candidates')
+        n_candidates = 1000 if n_candidates is None else int(n_candidates)
+        outcome_transform = get_from_dic(optimizer_config, 'outcome_transform')
+        outcome_transform = 'standardize' if outcome_transform is None else str(outcome_transform)
         if n_init is not None:
             n_init = int(n_init)
         if alpha is not None:
@@ -80,7 +99,9 @@ def getOptimizer(optimizer_config):
             kappa = float(kappa)
         try:
             return BayesianOptimizer(n_init=n_init, n_iter=n_iter, alpha=alpha, kappa=kappa, 
-                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps)
+                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps, stopping_policy=stopping_policy,
+                warm_start=warm_start, warm_start_weight=warm_start_weight,
+                cost_aware=cost_aware, n_candidates=n_candidates, outcome_transform=outcome_transform)
         except:
             return None
     elif optimizer_type == 'random':
@@ -89,7 +110,7 @@ def getOptimizer(optimizer_config):
             random_seed = int(random_seed)
         try:
             return RandomSearch(n_iter=n_iter, random_seed=random_seed,
-                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps)
+                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps, stopping_policy=stopping_policy)
         except:
             return None
     elif optimizer_type =='coordinate':
@@ -98,7 +119,7 @@ def getOptimizer(optimizer_config):
             random_seed = int(random_seed)
         try:
             return CoordinateSearch(n_iter=n_iter, random_seed=random_seed,
-                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps)
+                budget=budget, converge_thres=converge_thres, converge_steps=converge_steps, stopping_policy=stopping_policy)
         except:
             return None
 
@@ -119,24 +140,121 @@ def getObjective(obj_config):
         return obj_info
 
 
+# jobs are routed to a queue per compute type and priority, so long EC2 campaigns and short local runs don't
+# wait on each other, and workers can be dedicated to some of the queues
+COMPUTE_TYPES = ['local', 'ec2']
+# in the order workers take jobs from them
+PRIORITIES = ['high', 'default', 'low']
+# queue used before jobs were routed, still drained by workers
+LEGACY_QUEUE = 'default'
+# set of ids of the queued and running jobs of a compute type
+ACTIVE_JOBS_KEY = 'paropt:active_jobs:{}'
+# experiment id to id of its enqueued or running job
+EXPERIMENT_JOB_KEY = 'paropt:experiment_job:{}'
+# set to ask the run of a job to stop, holding the reason
+STOP_JOB_KEY = 'paropt:stop_job:{}'
+STOP_JOB_TTL = 24 * 3600
+# pub/sub channel where a job's runner publishes its progress after every trial, as json
+PROGRESS_CHANNEL = 'paropt:progress:{}'
+# published on a job's progress channel when its run ends
+PROGRESS_END = {'event': 'end'}
+# seconds a claim of an experiment lasts before its job is enqueued, see _claimExperiment
+CLAIM_TTL = 60
+# job statuses after which an experiment can be run again
+DONE_JOB_STATUSES = ('finished', 'failed')
+# deletes a key only if it still holds the given value, so a job doesn't clear the mapping of a newer job
+_DELETE_IF_EQUAL = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def queueName(compute_type, priority):
+    return f'{compute_type}-{priority}'
+
+
+def queueNames(queue_sets=None):
+    """Names of queues, in the order workers should take jobs from them
+    Args:
+        queue_sets([]str): compute types (all of their queues) or queue names; by default all queues
+    Returns:
+        names([]str): higher priorities first, then the legacy queue
+    """
+    if not queue_sets:
+        queue_sets = COMPUTE_TYPES + [LEGACY_QUEUE]
+    names = []
+    for priority in PRIORITIES:
+        names += [queueName(queue_set, priority) for queue_set in queue_sets if queue_set in COMPUTE_TYPES]
+    names += [queue_set for queue_set in queue_sets if queue_set not in COMPUTE_TYPES]
+    return names
+
+
 class ParoptManager():
     """Manages paropt tasks and storage records using Redis queue and paropt storage"""
     _started = False
     db_storage = None
+    redis_pool = None
+    executor_cache = None
 
     @classmethod
     def start(cls):
         if cls._started:
             return
-        cls.db_storage = RelationalDB(
-            'postgresql',
-            DB_USER,
-            DB_PASSWORD,
-            DB_HOST,
-            DB_NAME
-        )
+        cls.db_storage = cls.getStorage()
         cls._started = True
 
+    @classmethod
+    def getStorage(cls):
+        """Storage shared by everything in this process, so its engine and connection pool are reused by every job
+        
+        Trials are written behind (see RelationalDB); runs flush their trials when they end. Workers forking a
+        process per job inherit the storage without its connections.
+        """
+        if cls.db_storage == None:
+            cls.db_storage = RelationalDB(
+                'postgresql',
+                DB_USER,
+                DB_PASSWORD,
+                DB_HOST,
+                DB_NAME,
+                write_behind=True,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_POOL_MAX_OVERFLOW,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True
+            )
+        return cls.db_storage
+
+    @classmethod
+    def enableExecutorCache(cls, idle_timeout=EXECUTOR_IDLE_TIMEOUT):
+        """Keep parsl executors loaded between jobs run by this process, see ExecutorCache
+        
+        Only for processes that run jobs themselves (simple workers): executors loaded in a forked job process
+        would be left running when it exits.
+        """
+        if idle_timeout <= 0 or cls.executor_cache != None:
+            return
+        cls.executor_cache = ExecutorCache(idle_timeout=idle_timeout)
+        atexit.register(cls.executor_cache.close)
+
+    @classmethod
+    def getRedis(cls):
+        """Redis client using a connection pool shared by everything in this process
+        
+        The pool creates connections as needed and reuses them across requests; after a fork it resets itself,
+        so processes never share a connection.
+        """
+        if cls.redis_pool == None:
+            cls.redis_pool = redis.ConnectionPool.from_url(current_app.config['REDIS_URL'])
+        return redis.Redis(connection_pool=cls.redis_pool)
+
+    @classmethod
+    def _fetchJobs(cls, conn, job_ids):
+        """Fetch jobs with one pipelined round-trip, skipping jobs that no longer exist"""
+        return [job for job in Job.fetch_many(job_ids, connection=conn) if job != None]
+
     @classmethod
     def runTrials(cls, experiment_id, run_config):
         """Put experiment into job queue to be run
@@ -151,32 +269,31 @@ class ParoptManager():
         if not cls._started:
             raise Exception("ParoptManager not started")
 
-        # debugging get job (should be requested based on experiment id)
-        job = cls.getExperimentJob(experiment_id)
-        if job != None:
-            return {'status': 'failed', 'message': 'Experiment already enqueued or running'}
-
         # check if experiment exists
         experiment = cls.getExperimentDict(experiment_id)
         if experiment == None:
-            return {'status': 'failed', 'message': "Experiment not found with id {}".format(id)}
+            return {'status': 'failed', 'message': "Experiment not found with id {}".format(experiment_id)}
         
-        optimizer = getOptimizer(run_config.get('optimizer'))
-        obj_config = getObjective(run_config.get('objective'))
-        if optimizer == None:
-            tmp = run_config.get('optimizer')
-            return {'status': 'failed', 'message': f'Invalid run configuration provided {tmp}, code: {optimizer[1]}'}
+        run, error = cls._prepareRun(experiment, run_config)
+        if error != None:
+            return {'status': 'failed', 'message': error}
         
         # submit job to redis
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])):
-            q = Queue()
-            job = q.enqueue(
-                f=cls._startRunner,
-                args=(experiment, optimizer, obj_config),
-                result_ttl=3600,
-                job_timeout=-1,
-                ttl=-1,
-                meta={'experiment_id': str(experiment_id)})
+        conn = cls.getRedis()
+        job_id = str(uuid.uuid4())
+        if not cls._claimExperiment(conn, experiment_id, job_id):
+            return {'status': 'failed', 'message': 'Experiment already enqueued or running'}
+        if not cls._admitJob(conn, run['compute_type'], job_id):
+            cls._releaseExperiment(conn, experiment_id, job_id)
+            return {'status': 'failed', 'message': cls._limitMessage(run['compute_type'])}
+        try:
+            job = cls._createJob(conn, job_id, experiment, run)
+            Queue(job.origin, connection=conn).enqueue_job(job)
+            cls._confirmClaim(conn, experiment_id)
+        except:
+            cls._releaseJob(conn, run['compute_type'], job_id)
+            cls._releaseExperiment(conn, experiment_id, job_id)
+            raise
 
         response_object = {
             'status': 'submitted',
@@ -184,6 +301,191 @@ class ParoptManager():
         }
         return response_object
 
+    @classmethod
+    def computeType(cls, experiment_dict):
+        """Type of compute an experiment's job runs on, which decides its queue. Production runs everything on EC2"""
+        return 'ec2' if in_production else 'local'
+
+    @classmethod
+    def _admitJob(cls, conn, compute_type, job_id):
+        """Count a job against the limit of its compute type
+        Returns:
+            admitted(bool): False if the compute type already has its maximum number of queued and running jobs
+        """
+        return len(cls._admitJobs(conn, compute_type, [job_id])) == 1
+
+    @classmethod
+    def _admitJobs(cls, conn, compute_type, job_ids):
+        """Count jobs against the limit of their compute type, rejecting those over it
+        Returns:
+            admitted([]str): ids of the admitted jobs, the first of job_ids
+        """
+        key = ACTIVE_JOBS_KEY.format(compute_type)
+        pipe = conn.pipeline()
+        pipe.sadd(key, *job_ids)
+        pipe.scard(key)
+        _, n_jobs = pipe.execute()
+        limit = MAX_JOBS_PER_COMPUTE.get(compute_type, 0)
+        if not limit or n_jobs <= limit:
+            return job_ids
+        # drop jobs that ended without releasing themselves (e.g. their worker died) before rejecting
+        active_ids = [member.decode() for member in conn.smembers(key) if member.decode() not in job_ids]
+        for active_id, job in zip(active_ids, Job.fetch_many(active_ids, connection=conn)):
+            if job == None or job.get_status() in DONE_JOB_STATUSES:
+                conn.srem(key, active_id)
+        n_over = max(conn.scard(key) - limit, 0)
+        if n_over == 0:
+            return job_ids
+        n_admitted = max(len(job_ids) - n_over, 0)
+        conn.srem(key, *job_ids[n_admitted:])
+        return job_ids[:n_admitted]
+
+    @classmethod
+    def _releaseJob(cls, conn, compute_type, job_id):
+        conn.srem(ACTIVE_JOBS_KEY.format(compute_type), job_id)
+
+    @classmethod
+    def _registryJobIds(cls, conn, registry_class):
+        job_ids = []
+        for name in queueNames():
+            job_ids += registry_class(name, connection=conn).get_job_ids()
+        return job_ids
+
+    @classmethod
+    def _prepareRun(cls, experiment, run_config):
+        """Validate a run configuration and build what its job needs
+        Args:
+            experiment(dict): experiment to run
+            run_config(dict): see runTrials
+        Returns:
+            run(dict): optimizer, obj_config, runner_config, priority and compute_type; None if invalid
+            error(str): why the run configuration is invalid; None if valid
+        """
+        optimizer = getOptimizer(run_config.get('optimizer'))
+        if optimizer == None:
+            tmp = run_config.get('optimizer')
+            return None, f'Invalid run configuration provided {tmp}'
+        priority = run_config.get('priority', 'default')
+        if priority not in PRIORITIES:
+            return None, f'Invalid priority {priority}, must be one of {PRIORITIES}'
+        return {
+            'optimizer': optimizer,
+            'obj_config': getObjective(run_config.get('objective')),
+            'runner_config': {
+                'prune_after': run_config.get('prune_after'),
+                'prune_threshold': run_config.get('prune_threshold', 0.05),
+            },
+            'priority': priority,
+            'compute_type': cls.computeType(experiment),
+        }, None
+
+    @classmethod
+    def _createJob(cls, conn, job_id, experiment, run):
+        """Create the job running an experiment, to be enqueued to the queue named by its origin"""
+        return Job.create(
+            cls._startRunner,
+            args=(experiment, run['optimizer'], run['obj_config'], run['runner_config']),
+            connection=conn,
+            id=job_id,
+            origin=queueName(run['compute_type'], run['priority']),
+            result_ttl=3600,
+            timeout=-1,
+            ttl=-1,
+            meta={'experiment_id': str(experiment['id']), 'compute_type': run['compute_type'], 'priority': run['priority']})
+
+    @classmethod
+    def _limitMessage(cls, compute_type):
+        return f'Limit of {MAX_JOBS_PER_COMPUTE[compute_type]} queued or running {compute_type} jobs reached, retry later'
+
+    @classmethod
+    def submitExperiments(cls, submissions):
+        """Get or create many experiments and enqueue a run of each
+        Experiments are got or created in one database transaction, and their jobs enqueued with one Redis pipeline.
+        Args:
+            submissions([]dict): each with 'experiment', the experiment dict as for getOrCreateExperiment, and
+                'run', the run configuration as for runTrials
+        Returns:
+            results([]dict): for each submission in order, 'status' ('submitted' or 'failed'), 'experiment'
+                (the stored experiment as a dict, missing if the experiment dict was invalid), and 'job_id'
+                or 'message'
+        """
+        if not cls._started:
+            raise Exception("ParoptManager not started")
+
+        results = [{'status': 'failed'} for _ in submissions]
+        experiments = []
+        for result, submission in zip(results, submissions):
+            try:
+                experiments.append(cls.dictToExperiment(dict(submission['experiment'])))
+            except Exception as e:
+                result['message'] = f'Invalid experiment: {e}'
+                experiments.append(None)
+        session = cls.db_storage.Session()
+        try:
+            stored = cls.db_storage.getOrCreateExperiments(session, [experiment for experiment in experiments if experiment != None])
+            stored = iter([experiment.asdict() for experiment, _ in stored])
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        # validate runs, and skip experiments submitted more than once in the batch
+        pending = []
+        experiment_ids = set()
+        for result, submission, experiment in zip(results, submissions, experiments):
+            if experiment == None:
+                continue
+            result['experiment'] = next(stored)
+            run, error = cls._prepareRun(result['experiment'], submission.get('run') or {})
+            if error != None:
+                result['message'] = error
+            elif result['experiment']['id'] in experiment_ids:
+                result['message'] = 'Experiment submitted more than once in the batch'
+            else:
+                experiment_ids.add(result['experiment']['id'])
+                pending.append((result, run, str(uuid.uuid4())))
+        if not pending:
+            return results
+
+        conn = cls.getRedis()
+        pipe = conn.pipeline()
+        for result, _, job_id in pending:
+            pipe.set(EXPERIMENT_JOB_KEY.format(result['experiment']['id']), job_id, nx=True, ex=CLAIM_TTL)
+        claimed = pipe.execute()
+        admitted = []
+        for (result, run, job_id), was_claimed in zip(pending, claimed):
+            # a claim fails if the experiment has a job or a stale mapping, which _claimExperiment clears
+            if was_claimed or cls._claimExperiment(conn, result['experiment']['id'], job_id):
+                admitted.append((result, run, job_id))
+            else:
+                result['message'] = 'Experiment already enqueued or running'
+        for compute_type in set(run['compute_type'] for _, run, _ in admitted):
+            job_ids = [job_id for _, run, job_id in admitted if run['compute_type'] == compute_type]
+            rejected = set(job_ids) - set(cls._admitJobs(conn, compute_type, job_ids))
+            for result, run, job_id in admitted:
+                if job_id in rejected:
+                    result['message'] = cls._limitMessage(compute_type)
+                    cls._releaseExperiment(conn, result['experiment']['id'], job_id)
+            admitted = [item for item in admitted if item[2] not in rejected]
+
+        pipe = conn.pipeline()
+        try:
+            for result, run, job_id in admitted:
+                job = cls._createJob(conn, job_id, result['experiment'], run)
+                Queue(job.origin, connection=conn).enqueue_job(job, pipeline=pipe)
+                pipe.persist(EXPERIMENT_JOB_KEY.format(result['experiment']['id']))
+            pipe.execute()
+        except:
+            for result, run, job_id in admitted:
+                cls._releaseJob(conn, run['compute_type'], job_id)
+                cls._releaseExperiment(conn, result['experiment']['id'], job_id)
+            raise
+        for result, _, job_id in admitted:
+            result['status'] = 'submitted'
+            result['job_id'] = job_id
+        return results
+
     @classmethod
     def getRunningExperiments(cls):
         """Returns experiments currently being run
@@ -191,72 +493,103 @@ class ParoptManager():
         Returns:
             jobs(list): list of jobs that are being run
         """
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])) as conn:
-            registry = StartedJobRegistry('default', connection=conn)
-            return [Job.fetch(id, connection=conn) for id in registry.get_job_ids()]
+        conn = cls.getRedis()
+        return cls._fetchJobs(conn, cls._registryJobIds(conn, StartedJobRegistry))
     
     @classmethod
     def getFailedExperiments(cls):
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])) as conn:
-            registry = FailedJobRegistry('default', connection=conn)
-            return [Job.fetch(id, connection=conn) for id in registry.get_job_ids()]
+        conn = cls.getRedis()
+        return cls._fetchJobs(conn, cls._registryJobIds(conn, FailedJobRegistry))
     
     @classmethod
     def getDeferredExperiments(cls):
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])) as conn:
-            registry = DeferredJobRegistry('default', connection=conn)
-            return [Job.fetch(id, connection=conn) for id in registry.get_job_ids()]
+        conn = cls.getRedis()
+        return cls._fetchJobs(conn, cls._registryJobIds(conn, DeferredJobRegistry))
     
     @classmethod
     def getQueuedJobs(cls):
-        """Get a list of currently enqueued jobs"""
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])):
-            q = Queue()
-            return q.jobs # Gets a list of enqueued job instances
+        """Get a list of currently enqueued jobs, highest priority first"""
+        conn = cls.getRedis()
+        job_ids = []
+        for name in queueNames():
+            job_ids += Queue(name, connection=conn).get_job_ids()
+        return cls._fetchJobs(conn, job_ids)
     
     @classmethod
     def getExperimentJob(cls, experiment_id):
         """Get job of an experiment - either enqueued or running"""
+        return cls._getExperimentJob(cls.getRedis(), experiment_id)
 
-        # check running jobs
-        running_jobs = cls.getRunningExperiments()
-        for job in running_jobs:
-            current_app.logger.info('Currently running: {}'.format(job))
-            if job.get_status() != 'finished' and job.meta.get('experiment_id') == str(experiment_id):
-                return job
-
-        # check queued jobs
-        queued_jobs = cls.getQueuedJobs()
-        for job in queued_jobs:
-            current_app.logger.info('Enqueued job: {}'.format(job))
-            if job.get_status() != 'finished' and job.meta.get('experiment_id') == str(experiment_id):
-                return job
-        
-        # job not found
-        return None
-    
     @classmethod
-    def getJob(cls, job_id):
-        with Connection(redis.from_url(current_app.config['REDIS_URL'])) as conn:
+    def _getExperimentJob(cls, conn, experiment_id):
+        """Get the job in the experiment to job mapping, clearing the mapping if the job is gone or done
+        (e.g. its worker died before the job could clear it)"""
+        job_id = conn.get(EXPERIMENT_JOB_KEY.format(experiment_id))
+        if job_id == None:
+            return None
+        job_id = job_id.decode()
+        try:
+            job = Job.fetch(job_id, connection=conn)
+        except NoSuchJobError:
             job = None
-            try:
-                job = Job.fetch(job_id, connection=conn)
-            except NoSuchJobError:
-                pass
-            except:
-                raise
-            return job
+        if job == None and conn.ttl(EXPERIMENT_JOB_KEY.format(experiment_id)) > 0:
+            # claimed by a submission that hasn't enqueued its job yet
+            return None
+        if job == None or job.get_status() in DONE_JOB_STATUSES:
+            cls._releaseExperiment(conn, experiment_id, job_id)
+            return None
+        return job
+
+    @classmethod
+    def _claimExperiment(cls, conn, experiment_id, job_id):
+        """Atomically map the experiment to job_id, unless it's mapped to a job that's still enqueued or running
+        The claim expires after CLAIM_TTL seconds unless made permanent with _confirmClaim once the job is enqueued,
+        so a submission failing in between doesn't block the experiment
+        Returns:
+            claimed(bool): True if the experiment is now mapped to job_id
+        """
+        key = EXPERIMENT_JOB_KEY.format(experiment_id)
+        if conn.set(key, job_id, nx=True, ex=CLAIM_TTL):
+            return True
+        # the mapped job may be stale, in which case it's cleared and the claim retried once
+        if cls._getExperimentJob(conn, experiment_id) != None:
+            return False
+        return bool(conn.set(key, job_id, nx=True, ex=CLAIM_TTL))
+
+    @classmethod
+    def _confirmClaim(cls, conn, experiment_id):
+        """Make the claim of an experiment permanent once its job is enqueued, it's removed when the job ends"""
+        conn.persist(EXPERIMENT_JOB_KEY.format(experiment_id))
+
+    @classmethod
+    def _releaseExperiment(cls, conn, experiment_id, job_id):
+        """Remove the experiment to job mapping if it's still mapped to job_id"""
+        conn.eval(_DELETE_IF_EQUAL, 1, EXPERIMENT_JOB_KEY.format(experiment_id), job_id)
+
+    @classmethod
+    def getJob(cls, job_id):
+        job = None
+        try:
+            job = Job.fetch(job_id, connection=cls.getRedis())
+        except NoSuchJobError:
+            pass
+        return job
     
     @classmethod
-    def jobToDict(cls, job):
-        """Returns job as dict"""
+    def jobToDict(cls, job, refresh=True):
+        """Returns job as dict
+        Args:
+            job(Job): job to convert
+            refresh(bool): read the status and result from Redis again. Listings pass False, since the jobs were
+                just fetched with them and refreshing costs a round-trip per job
+        """
         if job == None:
             return {}
         else:
             return {
                 'job_id': job.get_id(),
-                'job_status': job.get_status(),
-                'job_result': job.result,
+                'job_status': job.get_status() if refresh else job._status,
+                'job_result': job.result if refresh else job._result,
                 'job_meta': job.meta,
                 'job_exc_info': job.exc_info
             }
@@ -269,30 +602,128 @@ class ParoptManager():
         Returns:
             experiment(Job): is None if not currently running
         """
-        jobs = cls.getRunningExperiments()
-        for job in jobs:
-            if job.get_status() != 'finished' and job.meta.get('experiment_id') == str(experiment_id):
-                return job
+        job = cls.getExperimentJob(experiment_id)
+        if job != None and job.get_status() == 'started':
+            return job
         return None
 
     @classmethod
-    def getTrials(cls, experiment_id):
+    def getTrials(cls, experiment_id, limit=None, **filters):
         """Gets previous trials for experiment
+        Args:
+            experiment_id(str): id of experiment
+            limit(int): maximum number of trials to return
+            filters: after_id, run_number, start_time, end_time, status, min_outcome, max_outcome,
+                see RelationalDB.iterTrialRows
+        Returns:
+            trials([]dict): List of trials in dict representation, ordered by id
+            next_cursor(int): after_id of the next page; None if there are no more trials
+        """
+        if limit != None and limit < 1:
+            raise Exception(f'limit must be at least 1, got {limit}')
+        session = cls.db_storage.Session()
+        try:
+            # one more than the limit tells whether there's a next page
+            trials_dicts = list(cls.db_storage.iterTrialRows(
+                session, experiment_id, limit=limit + 1 if limit != None else None, **filters))
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        next_cursor = None
+        if limit != None and len(trials_dicts) > limit:
+            trials_dicts = trials_dicts[:limit]
+            next_cursor = trials_dicts[-1]['id']
+        return trials_dicts, next_cursor
+
+    @classmethod
+    def getTrialsVersion(cls, experiment_id):
+        """Gets a string that changes whenever a trial of the experiment is saved
         Args:
             experiment_id(str): id of experiment
         Returns:
-            trials([]dict): List of trials in dict representation
+            version(str)
         """
         session = cls.db_storage.Session()
         try:
+            n_trials, max_id = cls.db_storage.getTrialsVersion(session, experiment_id)
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return f'{experiment_id}-{n_trials}-{max_id}'
+
+    @classmethod
+    def getParameterImportance(cls, experiment_id):
+        """Gets importance of each parameter for the outcome of an experiment
+        Args:
+            experiment_id(str): id of experiment
+        Returns:
+            importance(dict): parameter name to importance, summing to 1; empty if there are too few trials.
+                None if the experiment doesn't exist
+        """
+        session = cls.db_storage.Session()
+        try:
+            experiment = cls.db_storage.getExperiment(session, experiment_id)
+            if experiment == None:
+                return None
             trials = cls.db_storage.getTrials(session, experiment_id)
-            trials_dicts = [trial.asdict() for trial in trials]
+            importance = parameterImportance(trials, experiment.parameters)
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return importance
+
+    @classmethod
+    def getExperimentSummary(cls, experiment_id):
+        """Gets summary of the trials of an experiment and each of its runs
+        Args:
+            experiment_id(str): id of experiment
+        Returns:
+            summary(dict): experiment summary with the run summaries under 'runs'; None if the experiment has no trials
+        """
+        session = cls.db_storage.Session()
+        try:
+            summary = cls.db_storage.getExperimentSummary(session, experiment_id)
+            if summary == None:
+                return None
+            summary_dict = summary.asdict()
+            summary_dict['runs'] = [run.asdict() for run in cls.db_storage.getRunSummaries(session, experiment_id)]
         except:
             session.rollback()
             raise
         finally:
             session.close()
-        return trials_dicts
+        return summary_dict
+
+    @classmethod
+    def exportTrials(cls, experiment_id, export_format='parquet'):
+        """Export trials of an experiment to a temporary file
+        Args:
+            experiment_id(str): id of experiment
+            export_format(str): 'parquet' or 'arrow'
+        Returns:
+            path(str): path of the file, which the caller removes. None if the experiment doesn't exist
+        """
+        session = cls.db_storage.Session()
+        fd, path = tempfile.mkstemp(suffix=f'.{export_format}')
+        os.close(fd)
+        try:
+            if cls.db_storage.getExperiment(session, experiment_id) == None:
+                os.remove(path)
+                return None
+            exportTrials(cls.db_storage, session, [experiment_id], path, export_format=export_format)
+        except:
+            session.rollback()
+            os.remove(path)
+            raise
+        finally:
+            session.close()
+        return path
 
     @classmethod
     def dictToExperiment(cls, experiment_dict):
@@ -303,7 +734,7 @@ class ParoptManager():
             experiment(Experiment): constructed Experiment
         """
         experiment_params = [Parameter(**param) for param in experiment_dict.pop('parameters')]
-        if in_production:
+        if cls.computeType(experiment_dict) == 'ec2':
             compute = EC2Compute(**experiment_dict.pop('compute'))
         else:
             compute = LocalCompute(**experiment_dict.pop('compute'))
@@ -351,19 +782,137 @@ class ParoptManager():
     @classmethod
     def stopExperiment(cls, experiment_id):
         """Stops running an experiment
+        A queued job is removed from the queue. A running job is asked to stop: its runner notices within a second or
+        so, kills the running trial's script, keeps the trials completed so far and shuts down its parsl executors
         Args:
             experiment_id(str): experiment to stop
+        Returns:
+            result(dict): 'status' is 'stopping' for a running job, 'cancelled' for a queued one, 'failed' if there's no job
+        """
+        conn = cls.getRedis()
+        job = cls._getExperimentJob(conn, experiment_id)
+        if job == None:
+            return {'status': 'failed', 'message': f'Experiment {experiment_id} is not enqueued or running'}
+        # set even for queued jobs, in case the job starts before it's removed from the queue
+        conn.set(STOP_JOB_KEY.format(job.get_id()), 'Stopped by user', ex=STOP_JOB_TTL)
+        if job.get_status() == 'started':
+            return {'status': 'stopping', 'job': cls.jobToDict(job)}
+        job_dict = cls.jobToDict(job)
+        job.delete()
+        cls._releaseJob(conn, job.meta.get('compute_type'), job.get_id())
+        cls._releaseExperiment(conn, experiment_id, job.get_id())
+        return {'status': 'cancelled', 'job': job_dict}
+
+    @classmethod
+    def getJobProgress(cls, job_id, since=None, wait=0):
+        """Gets the progress of a job's run, optionally waiting for it to change (long-polling)
+        Args:
+            job_id(str): id of job
+            since(int): number of trials the client already knows about; if the run hasn't done more
+                trials and isn't done, waits for the next progress update
+            wait(float): maximum seconds to wait for an update
+        Returns:
+            progress(dict): job_status and progress of the run, see ParslRunner.getProgress; None if no such job
+        """
+        conn = cls.getRedis()
+        pubsub = conn.pubsub(ignore_subscribe_messages=True)
+        # subscribe before reading the snapshot, so an update published in between isn't missed
+        pubsub.subscribe(PROGRESS_CHANNEL.format(job_id))
+        try:
+            snapshot = cls._progressSnapshot(conn, job_id)
+            if snapshot == None or since == None or wait <= 0 or snapshot['job_status'] in DONE_JOB_STATUSES:
+                return snapshot
+            if (snapshot['progress'] or {}).get('n_trials', 0) > since:
+                return snapshot
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                message = pubsub.get_message(timeout=deadline - time.time())
+                if message != None:
+                    return cls._progressSnapshot(conn, job_id)
+            return snapshot
+        finally:
+            pubsub.close()
+
+    @classmethod
+    def streamJobProgress(cls, job_id, heartbeat=15):
+        """Yields progress updates of a job's run as server-sent events until the run ends, or its job is gone
+        Args:
+            job_id(str): id of job
+            heartbeat(float): seconds between comments sent to keep the connection open when there are no updates
         """
-        return {'message': 'this functionality is not implemented yet'}
+        conn = cls.getRedis()
+        pubsub = conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(PROGRESS_CHANNEL.format(job_id))
+        try:
+            snapshot = cls._progressSnapshot(conn, job_id)
+            if snapshot == None:
+                return
+            yield f'event: progress\ndata: {json.dumps(snapshot)}\n\n'
+            if snapshot['job_status'] in DONE_JOB_STATUSES:
+                return
+            while True:
+                message = pubsub.get_message(timeout=heartbeat)
+                if message == None:
+                    # the end isn't published when the job's worker dies, so check the job is still running
+                    snapshot = cls._progressSnapshot(conn, job_id, cleanup=True)
+                    if snapshot == None or snapshot['job_status'] in DONE_JOB_STATUSES:
+                        if snapshot != None:
+                            yield f'event: progress\ndata: {json.dumps(snapshot)}\n\n'
+                        yield 'event: end\ndata: {}\n\n'
+                        return
+                    yield ': heartbeat\n\n'
+                    continue
+                progress = json.loads(message['data'])
+                if progress == PROGRESS_END:
+                    yield 'event: end\ndata: {}\n\n'
+                    return
+                yield f'event: progress\ndata: {json.dumps({"job_status": "started", "progress": progress})}\n\n'
+        finally:
+            pubsub.close()
 
     @classmethod
-    def _startRunner(cls, experiment_dict, optimizer, obj_config):
+    def _progressSnapshot(cls, conn, job_id, cleanup=False):
+        """Status and progress of a job, None if no such job
+        Args:
+            cleanup(bool): first fail the job if it's started but its worker died, see StartedJobRegistry.cleanup
+        """
+        try:
+            job = Job.fetch(job_id, connection=conn)
+        except NoSuchJobError:
+            return None
+        if cleanup and job.get_status() == 'started':
+            StartedJobRegistry(job.origin, connection=conn).cleanup()
+            return cls._progressSnapshot(conn, job_id)
+        return {'job_status': job.get_status(), 'progress': job.meta.get('progress')}
+
+    @classmethod
+    def _progressCallback(cls, job):
+        """Returns a function saving the progress of a job's run in its meta and publishing it to clients"""
+        channel = PROGRESS_CHANNEL.format(job.get_id())
+        def progressCallback(progress):
+            job.meta['progress'] = progress
+            job.save_meta()
+            job.connection.publish(channel, json.dumps(progress))
+        return progressCallback
+
+    @classmethod
+    def _stopCheck(cls, job):
+        """Returns a function telling the runner of a job whether to stop, see stopExperiment"""
+        key = STOP_JOB_KEY.format(job.get_id())
+        def stopCheck():
+            reason = job.connection.get(key)
+            return reason.decode() if reason != None else None
+        return stopCheck
+
+    @classmethod
+    def _startRunner(cls, experiment_dict, optimizer, obj_config, runner_config=None):
         """Runs an experiment with paropt. This is the function used for job queueing
 
         Args:
             experiment_dict(dict): dict representation of experiment to run.
                 Although it's a dict, the experiment it represents should already exist in the database.
             optimizer(Optimizer): Optimizer instance to use for running the experiment
+            runner_config(dict): extra ParslRunner arguments, e.g. prune_after and prune_threshold
         
         Returns:
             result(dict): result of the run
@@ -372,26 +921,37 @@ class ParoptManager():
             Exception: when the runner fails, it will raise an exception with the message from the result
         """
         paropt.setConsoleLogger()
+        job = get_current_job()
         experiment = cls.dictToExperiment(experiment_dict)
-        storage = RelationalDB(
-            'postgresql',
-            DB_USER,
-            DB_PASSWORD,
-            DB_HOST,
-            DB_NAME
-        )
-
-        po = ParslRunner(
-            obj_func=getattr(paropt.runner.parsl, obj_config['obj_name']),
-            # obj_func=timeCmdLimit,
-            optimizer=optimizer,
-            obj_func_params=obj_config['obj_params'], 
-            storage=storage,
-            experiment=experiment,
-            logs_root_dir='/var/log/paropt')
-        po.run(debug=True)
-        # cleanup launched instances
-        po.cleanup()
+        storage = cls.getStorage()
+
+        po = None
+        try:
+            po = ParslRunner(
+                obj_func=getattr(paropt.runner.parsl, obj_config['obj_name']),
+                # obj_func=timeCmdLimit,
+                optimizer=optimizer,
+                obj_func_params=obj_config['obj_params'], 
+                storage=storage,
+                experiment=experiment,
+                logs_root_dir='/var/log/paropt',
+                stop_check=cls._stopCheck(job) if job != None else None,
+                progress_callback=cls._progressCallback(job) if job != None else None,
+                executor_cache=cls.executor_cache,
+                **(runner_config or {}))
+            po.run(debug=True)
+        finally:
+            # cleanup launched instances, also when the run failed or was stopped
+            if po != None:
+                po.cleanup()
+            # write any trials still queued by the storage, it stays open for the next job
+            storage.flush()
+            # the experiment can be run again once this job is finished or failed
+            if job != None:
+                job.connection.delete(STOP_JOB_KEY.format(job.get_id()))
+                cls._releaseJob(job.connection, job.meta.get('compute_type'), job.get_id())
+                job.connection.publish(PROGRESS_CHANNEL.format(job.get_id()), json.dumps(PROGRESS_END))
+                cls._releaseExperiment(job.connection, experiment_dict['id'], job.get_id())
 
         if po.run_result['success'] == False:
             raise Exception(po.run_result['message'])
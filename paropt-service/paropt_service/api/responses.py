@@ -0,0 +1,70 @@
+import gzip
+import json
+
+from flask import current_app, request
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller responses aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(obj):
+    # same datetime format as flask's jsonify
+    if hasattr(obj, 'utctimetuple'):
+        return http_date(obj.utctimetuple())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Serialize data to JSON bytes, with orjson when it's installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode()
+
+
+def jsonResponse(data, status=200):
+    """Faster replacement for jsonify, for responses that can be large such as trial listings"""
+    return current_app.response_class(dumps(data), status=status, mimetype='application/json')
+
+
+def compressResponse(response):
+    """Compress the response with brotli or gzip, whichever the client accepts and is available
+
+    Used as an after_request handler. Streamed responses (files, server-sent events) and small ones are left as is.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # the compressed body is a different representation, so a strong ETag can't be reused for it
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
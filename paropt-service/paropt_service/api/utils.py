@@ -1,8 +1,75 @@
 from functools import wraps
+from collections import OrderedDict
+import hashlib
 import os
+import threading
+import time
 from flask import session, request, redirect, url_for
 
-from config import _load_funcx_client, in_production
+from config import (_load_funcx_client, in_production,
+                    TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, TOKEN_CACHE_NEGATIVE_TTL)
+
+class TokenCache():
+  """LRU cache of token introspection results with per-entry expiry, safe to share between threads
+
+  Tokens are keyed by their sha256, so the cache never holds usable tokens.
+  """
+  def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, negative_ttl=TOKEN_CACHE_NEGATIVE_TTL):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self._entries = OrderedDict() # token hash to (expiry, active)
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+  def get(self, token):
+    """Returns whether the token is active, or None if it isn't cached"""
+    key = self._key(token)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry == None:
+        return None
+      expiry, active = entry
+      if time.time() >= expiry:
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return active
+
+  def put(self, token, introspection):
+    """Cache the result of introspecting a token, until the token expires for active ones"""
+    now = time.time()
+    active = introspection.get('active', False) == True
+    if active:
+      expiry = now + self.ttl
+      if introspection.get('exp') != None:
+        expiry = min(expiry, introspection['exp'])
+    else:
+      expiry = now + self.negative_ttl
+    key = self._key(token)
+    with self._lock:
+      self._entries[key] = (expiry, active)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+    return active
+
+_token_cache = TokenCache()
+_auth_client = None
+
+def isTokenActive(token):
+  """Introspect a bearer token with Globus Auth, using cached results when possible"""
+  global _auth_client
+  active = _token_cache.get(token)
+  if active != None:
+    return active
+  if _auth_client == None:
+    _auth_client = _load_funcx_client()
+  data = _auth_client.oauth2_token_introspect(token)
+  return _token_cache.put(token, data)
 
 def login_required(f):
   @wraps(f)
@@ -17,9 +84,7 @@ def login_required(f):
     elif 'Authorization' in request.headers:
       at = request.headers.get('Authorization').replace('Bearer', '').strip()
       if at:
-        client = _load_funcx_client()
-        data = client.oauth2_token_introspect(at)
-        if data.get('active', False) != True:
+        if not isTokenActive(at):
           return "Invalid token - token not active for client", 401
         else: # valid token
           return f(*args, **kwargs)
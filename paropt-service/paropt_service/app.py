@@ -5,12 +5,12 @@ import sys
 from flask import (Flask, request, flash, redirect, session, url_for)
 
 import redis
-from rq import Connection, Worker, Queue
+from rq import Connection, Worker, SimpleWorker, Queue
 from rq.registry import StartedJobRegistry
 from rq.job import Job
 
 from api.api import api
-from api.paropt_manager import ParoptManager
+from api.paropt_manager import ParoptManager, queueNames, COMPUTE_TYPES
 from config import SECRET_KEY, _load_funcx_client, SERVER_DOMAIN, GLOBUS_CLIENT
 
 
@@ -110,7 +110,6 @@ def logout():
 app.secret_key = SECRET_KEY
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['REDIS_URL'] = 'redis://redis:6379/0'
-app.config['QUEUES'] = ['default']
 
 def setupAWS():
     # launch a small parsl job on AWS to initialize parsl's AWS VPC stuff
@@ -185,11 +184,16 @@ def setupAWS():
     from shutil import copyfile
     copyfile("awsproviderstate.json", f'{container_state_file_dir}/awsproviderstate.json') 
 
-def startWorker(redis_url, queues):
+def startWorker(redis_url, queues, simple=False):
+    """Start a worker. A simple worker runs jobs in its own process instead of forking one per job,
+    so jobs reuse its storage connections and the parsl executors of the previous job on the same compute;
+    a job crashing the process takes the worker down with it."""
     ParoptManager.start()
+    if simple:
+        ParoptManager.enableExecutorCache()
     redis_connection = redis.from_url(redis_url)
     with Connection(redis_connection):
-        worker = Worker(queues)
+        worker = SimpleWorker(queues) if simple else Worker(queues)
         worker.work()
 
 if __name__ == "__main__":
@@ -198,6 +202,10 @@ if __name__ == "__main__":
     group.add_argument('--server', action='store_true', help='run as server')
     group.add_argument('--workers', type=int, help='number of workers to start')
     group.add_argument('--setupaws', action='store_true', help='launch a single small job to setup awsproviderstate.json; intended to be used with `docker run ...` before first run of production server')
+    parser.add_argument('--simple-worker', action='store_true', help='run jobs in the worker processes instead of forking a process per job')
+    parser.add_argument('--queues', nargs='+', default=None,
+                        help=f'compute types ({", ".join(COMPUTE_TYPES)}) or queue names workers take jobs from, '
+                             'e.g. `--queues local` for a pool dedicated to local jobs; by default all queues')
     args = parser.parse_args()
 
     if args.server:
@@ -214,15 +222,19 @@ if __name__ == "__main__":
         redis_url = app.config['REDIS_URL']
         # clear previously started started jobs - if shut down while running a job, the job will remain in StartedJobsRegistry
         # when it's restarted, which is a problem because it's not actually running anymore
+        # workers take jobs from higher priority queues first
+        queues = queueNames(args.queues)
+        print(f'Starting {args.workers} workers for queues {queues}')
         with Connection(redis.from_url(redis_url)) as conn:
-            registry = StartedJobRegistry('default', connection=conn)
-            for job_id in registry.get_job_ids():
-                registry.remove(Job.fetch(job_id, connection=conn))
+            for queue in queues:
+                registry = StartedJobRegistry(queue, connection=conn)
+                for job_id in registry.get_job_ids():
+                    registry.remove(Job.fetch(job_id, connection=conn))
 
         procs = []
         for i in range(args.workers):
             procs.append(Process(target=startWorker,
-                                 args=(redis_url, app.config['QUEUES'])))
+                                 args=(redis_url, queues, args.simple_worker)))
             procs[i].start()
         for proc in procs:
             proc.join()
@@ -52,11 +52,32 @@ GLOBUS_CLIENT = os.environ.get('globus_client', '')
 GLOBUS_CLIENT_NATIVE = os.environ.get('globus_client_native', '')
 
 SECRET_KEY = os.environ.get('secret_key')
+# base url of Globus Auth, e.g. a local stand-in for testing; defaults to the real service
+GLOBUS_AUTH_URL = os.environ.get('GLOBUS_AUTH_URL')
+# introspection results of bearer tokens are cached for at most TOKEN_CACHE_TTL seconds (and never past the
+# token's expiry), invalid tokens for TOKEN_CACHE_NEGATIVE_TTL seconds
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_NEGATIVE_TTL = int(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', 30))
 
 DB_HOST = os.environ.get('DB_HOST')
 DB_USER = os.environ.get('DB_USER')
 DB_NAME = os.environ.get('DB_NAME')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
+# connection pool of the storage shared by everything in a server or worker process
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 3600))
+
+# maximum number of queued and running jobs per compute type, 0 for no limit. Submissions over the limit are rejected
+MAX_JOBS_PER_COMPUTE = {
+  'ec2': int(os.environ.get('MAX_EC2_JOBS', 0)),
+  'local': int(os.environ.get('MAX_LOCAL_JOBS', 0)),
+}
+
+# seconds simple workers keep parsl executors (and their EC2 blocks) loaded after a job for the next job on the
+# same compute, 0 to shut them down after every job
+EXECUTOR_IDLE_TIMEOUT = int(os.environ.get('EXECUTOR_IDLE_TIMEOUT', 600))
 
 _prod = in_production
 
@@ -78,8 +99,10 @@ def _load_funcx_client():
   """
   # TODO: REMOVE THE TRUE
   if _prod or True:
+      kwargs = {'base_url': GLOBUS_AUTH_URL} if GLOBUS_AUTH_URL != None else {}
       app = globus_sdk.ConfidentialAppAuthClient(GLOBUS_CLIENT,
-                                                  GLOBUS_KEY)
+                                                  GLOBUS_KEY,
+                                                  **kwargs)
   else:
       app = globus_sdk.ConfidentialAppAuthClient('', '')
   return app
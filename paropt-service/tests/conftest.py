@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# the service's modules import each other from its package directory, e.g. `from config import ...`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'paropt_service'))
+
+@pytest.fixture
+def conn(monkeypatch):
+  """In-memory Redis used by ParoptManager"""
+  fakeredis = pytest.importorskip('fakeredis')
+  from api.paropt_manager import ParoptManager
+  conn = fakeredis.FakeRedis()
+  monkeypatch.setattr(ParoptManager, 'getRedis', classmethod(lambda cls: conn))
+  return conn
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+  """SQLite storage used by ParoptManager"""
+  from paropt.storage import SQLiteDB
+  from api.paropt_manager import ParoptManager
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'))
+  monkeypatch.setattr(ParoptManager, 'db_storage', storage)
+  return storage
+
+@pytest.fixture
+def client():
+  """Test client of an app serving the api like the service's"""
+  import flask
+  from api.api import api
+  app = flask.Flask(__name__)
+  app.register_blueprint(api, url_prefix='/api/v1')
+  return app.test_client()
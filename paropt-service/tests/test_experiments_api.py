@@ -0,0 +1,98 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('fakeredis')
+pytest.importorskip('rq')
+pytest.importorskip('parsl')
+pytest.importorskip('sqlalchemy')
+
+from rq import Queue
+
+from paropt.storage.entities import Experiment
+
+from api.paropt_manager import ParoptManager, EXPERIMENT_JOB_KEY, queueName
+
+RUN = {'optimizer': {'type': 'grid', 'num_configs_per_param': [2]}, 'objective': {'obj_name': 'timeCmd'}}
+
+@pytest.fixture
+def manager(storage, conn, monkeypatch):
+  monkeypatch.setattr(ParoptManager, '_started', True)
+
+def _experiment(tool_name):
+  return {
+    'tool_name': tool_name,
+    'parameters': [{'name': 'x', 'minimum': 0, 'maximum': 10}],
+    'command_template_string': 'echo ${x}',
+    'compute': {'max_threads': 1},
+  }
+
+def _submit(client, submissions, expected_status):
+  response = client.post('/api/v1/experiments/batch', json={'experiments': submissions})
+  assert response.status_code == expected_status
+  return response.get_json()
+
+def test_submit_batch(client, storage, conn, manager):
+  existing = ParoptManager.getOrCreateExperiment(_experiment('b'))
+  invalid = _experiment('c')
+  del invalid['parameters']
+
+  result = _submit(client, [
+    {'experiment': _experiment('a'), 'run': RUN},
+    {'experiment': _experiment('b'), 'run': RUN},
+    {'experiment': _experiment('a'), 'run': RUN},
+    {'experiment': invalid, 'run': RUN},
+    {'experiment': _experiment('d'), 'run': {'priority': 'urgent'}},
+  ], 202)
+
+  assert result['n_submitted'] == 2
+  statuses = [(submitted['status'], submitted.get('message', '')) for submitted in result['results']]
+  assert [status for status, _ in statuses] == ['submitted', 'submitted', 'failed', 'failed', 'failed']
+  assert statuses[2][1] == 'Experiment submitted more than once in the batch'
+  assert statuses[3][1].startswith('Invalid experiment')
+  assert statuses[4][1].startswith('Invalid priority')
+  results = result['results']
+  assert results[1]['experiment']['id'] == existing['id']
+  assert results[2]['experiment']['id'] == results[0]['experiment']['id']
+  assert 'experiment' not in results[3]
+
+  # the experiments are stored, including the one whose run was invalid, and the jobs enqueued and mapped
+  session = storage.Session()
+  try:
+    assert sorted(tool_name for tool_name, in session.query(Experiment.tool_name)) == ['a', 'b', 'd']
+  finally:
+    session.close()
+  job_ids = Queue(queueName('local', 'default'), connection=conn).get_job_ids()
+  assert job_ids == [results[0]['job_id'], results[1]['job_id']]
+  for submitted in results[:2]:
+    assert conn.get(EXPERIMENT_JOB_KEY.format(submitted['experiment']['id'])).decode() == submitted['job_id']
+    assert conn.ttl(EXPERIMENT_JOB_KEY.format(submitted['experiment']['id'])) == -1
+
+  # both are still enqueued
+  result = _submit(client, [{'experiment': _experiment(tool_name), 'run': RUN} for tool_name in 'ab'], 400)
+  assert result['n_submitted'] == 0
+  assert all(submitted['message'] == 'Experiment already enqueued or running' for submitted in result['results'])
+
+def test_submit_batch_created_concurrently(client, storage, conn, manager, monkeypatch):
+  from paropt.storage import relational_db
+
+  # another worker creates one of the experiments after they were looked up, before they're written
+  begin_write = relational_db.beginWrite
+  def beginWrite(session):
+    monkeypatch.setattr(relational_db, 'beginWrite', begin_write)
+    ParoptManager.getOrCreateExperiment(_experiment('b'))
+    begin_write(session)
+  monkeypatch.setattr(relational_db, 'beginWrite', beginWrite)
+
+  result = _submit(client, [{'experiment': _experiment(tool_name), 'run': RUN} for tool_name in 'ab'], 202)
+  assert result['n_submitted'] == 2
+  session = storage.Session()
+  try:
+    stored = dict(session.query(Experiment.tool_name, Experiment.id))
+  finally:
+    session.close()
+  assert [submitted['experiment']['id'] for submitted in result['results']] == [stored['a'], stored['b']]
+
+def test_invalid_batch(client, manager):
+  for body in (None, {}, {'experiments': {}}, {'experiments': [1]}):
+    assert client.post('/api/v1/experiments/batch', json=body).status_code == 400
+  assert client.post('/api/v1/experiments/batch', json={'experiments': [{}] * 501}).status_code == 400
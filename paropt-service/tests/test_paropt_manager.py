@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+pytest.importorskip('fakeredis')
+pytest.importorskip('rq')
+pytest.importorskip('parsl')
+
+from rq import Queue
+from rq.registry import StartedJobRegistry
+
+from api.paropt_manager import ParoptManager, PROGRESS_CHANNEL, PROGRESS_END
+
+def _startedJob(conn, progress=None, ttl=60):
+  """A job as its worker leaves it when it starts running, registered as started for ttl seconds"""
+  job = Queue('local-normal', connection=conn).enqueue(print)
+  job.meta['progress'] = progress
+  job.save_meta()
+  job.set_status('started')
+  StartedJobRegistry(job.origin, connection=conn).add(job, ttl)
+  return job
+
+def _events(messages):
+  """Names and data of the server-sent events, and the number of heartbeats, in the stream's messages"""
+  events = []
+  n_heartbeats = 0
+  for message in messages:
+    if message.startswith(':'):
+      n_heartbeats += 1
+      continue
+    event, data = message.strip().split('\n')
+    events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+  return events, n_heartbeats
+
+def test_stream_ends_with_run(conn):
+  job = _startedJob(conn, progress={'n_trials': 1})
+  stream = ParoptManager.streamJobProgress(job.get_id(), heartbeat=0.01)
+  messages = [next(stream)]
+  channel = PROGRESS_CHANNEL.format(job.get_id())
+  conn.publish(channel, json.dumps({'n_trials': 2}))
+  conn.publish(channel, json.dumps(PROGRESS_END))
+  messages += list(stream)
+
+  events, _ = _events(messages)
+  assert events == [
+    ('progress', {'job_status': 'started', 'progress': {'n_trials': 1}}),
+    ('progress', {'job_status': 'started', 'progress': {'n_trials': 2}}),
+    ('end', {}),
+  ]
+
+def test_stream_of_ended_job(conn):
+  job = _startedJob(conn, progress={'n_trials': 3})
+  job.set_status('finished')
+
+  events, _ = _events(ParoptManager.streamJobProgress(job.get_id(), heartbeat=0.01))
+  assert events == [('progress', {'job_status': 'finished', 'progress': {'n_trials': 3}})]
+  assert list(ParoptManager.streamJobProgress('missing', heartbeat=0.01)) == []
+
+def test_stream_ends_when_worker_dies(conn):
+  # a dead worker stops extending the time its job is registered as started, and never publishes the end
+  job = _startedJob(conn, progress={'n_trials': 1}, ttl=0)
+
+  events, n_heartbeats = _events(ParoptManager.streamJobProgress(job.get_id(), heartbeat=0.01))
+  assert events[0] == ('progress', {'job_status': 'started', 'progress': {'n_trials': 1}})
+  assert events[1] == ('progress', {'job_status': 'failed', 'progress': {'n_trials': 1}})
+  assert events[2:] == [('end', {})]
+  assert n_heartbeats == 0
+
+def test_stream_ends_when_job_is_deleted(conn):
+  job = _startedJob(conn)
+  stream = ParoptManager.streamJobProgress(job.get_id(), heartbeat=0.01)
+  next(stream)
+  assert next(stream) == ': heartbeat\n\n'
+  job.delete()
+
+  events, _ = _events(stream)
+  assert events == [('end', {})]
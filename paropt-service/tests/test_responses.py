@@ -0,0 +1,82 @@
+import gzip
+import json
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from api import responses
+from api.responses import jsonResponse, compressResponse, MIN_COMPRESS_SIZE
+
+LARGE = {'trials': [{'id': i, 'outcome': -1.5 * i} for i in range(MIN_COMPRESS_SIZE)]}
+SMALL = {'trials': []}
+
+@pytest.fixture
+def client():
+  app = flask.Flask(__name__)
+  app.after_request(compressResponse)
+
+  @app.route('/large')
+  def large():
+    response = jsonResponse(LARGE)
+    response.set_etag('v1')
+    return response
+
+  @app.route('/small')
+  def small():
+    return jsonResponse(SMALL)
+
+  @app.route('/error')
+  def error():
+    return jsonResponse(LARGE, status=500)
+
+  @app.route('/stream')
+  def stream():
+    return app.response_class((json.dumps(LARGE) for _ in range(2)), mimetype='text/event-stream')
+
+  return app.test_client()
+
+def test_gzip(client, monkeypatch):
+  monkeypatch.setattr(responses, 'brotli', None)
+  response = client.get('/large', headers={'Accept-Encoding': 'br, gzip'})
+  assert response.headers['Content-Encoding'] == 'gzip'
+  assert 'Accept-Encoding' in response.headers['Vary']
+  assert json.loads(gzip.decompress(response.get_data())) == LARGE
+
+def test_brotli(client):
+  brotli = pytest.importorskip('brotli')
+  response = client.get('/large', headers={'Accept-Encoding': 'gzip, br'})
+  assert response.headers['Content-Encoding'] == 'br'
+  assert json.loads(brotli.decompress(response.get_data())) == LARGE
+  # the client's preference wins over ours
+  response = client.get('/large', headers={'Accept-Encoding': 'gzip;q=1.0, br;q=0.5'})
+  assert response.headers['Content-Encoding'] == 'gzip'
+
+def test_not_accepted(client):
+  for headers in ({}, {'Accept-Encoding': 'identity'}, {'Accept-Encoding': 'deflate'}):
+    response = client.get('/large', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(response.get_data()) == LARGE
+
+def test_size_threshold(client):
+  response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+  assert 'Content-Encoding' not in response.headers
+  assert json.loads(response.get_data()) == SMALL
+
+def test_error_not_compressed(client):
+  response = client.get('/error', headers={'Accept-Encoding': 'gzip'})
+  assert response.status_code == 500
+  assert 'Content-Encoding' not in response.headers
+  assert json.loads(response.get_data()) == LARGE
+
+def test_stream_not_compressed(client):
+  response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+  assert 'Content-Encoding' not in response.headers
+  assert response.get_data() == 2 * json.dumps(LARGE).encode()
+
+def test_weak_etag(client):
+  response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+  assert response.headers['ETag'] == 'W/"v1"'
+  response = client.get('/large')
+  assert response.headers['ETag'] == '"v1"'
@@ -0,0 +1,110 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('globus_sdk')
+
+import config
+from api import utils
+from api.utils import TokenCache, isTokenActive
+
+class FakeClock():
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = FakeClock()
+  monkeypatch.setattr(utils.time, 'time', clock)
+  return clock
+
+class IntrospectHandler(BaseHTTPRequestHandler):
+  """Stand-in for Globus Auth token introspection, answering with the server's responses by token"""
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+    token = parse_qs(body)['token'][0]
+    self.server.requests.append(token)
+    status, data = self.server.responses[token].pop(0)
+    payload = json.dumps(data).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  def log_message(self, *args):
+    pass
+
+@pytest.fixture
+def auth_server(monkeypatch):
+  server = HTTPServer(('127.0.0.1', 0), IntrospectHandler)
+  server.requests = []
+  server.responses = {}
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  monkeypatch.setattr(config, 'GLOBUS_AUTH_URL', f'http://127.0.0.1:{server.server_port}/')
+  monkeypatch.setattr(config, 'GLOBUS_CLIENT', 'client')
+  monkeypatch.setattr(config, 'GLOBUS_KEY', 'secret')
+  monkeypatch.setattr(utils, '_auth_client', None)
+  monkeypatch.setattr(utils, '_token_cache', TokenCache(max_size=10, ttl=300, negative_ttl=30))
+  yield server
+  server.shutdown()
+  server.server_close()
+
+def test_ttl_capped_at_token_expiry(clock):
+  cache = TokenCache(max_size=10, ttl=300, negative_ttl=30)
+  assert cache.put('token', {'active': True, 'exp': clock.now + 10}) == True
+  clock.now += 9
+  assert cache.get('token') == True
+  clock.now += 1
+  assert cache.get('token') == None
+
+def test_ttl(clock):
+  cache = TokenCache(max_size=10, ttl=300, negative_ttl=30)
+  cache.put('token', {'active': True, 'exp': clock.now + 3600})
+  clock.now += 299
+  assert cache.get('token') == True
+  clock.now += 1
+  assert cache.get('token') == None
+
+def test_negative_caching(clock):
+  cache = TokenCache(max_size=10, ttl=300, negative_ttl=30)
+  assert cache.put('token', {'active': False}) == False
+  clock.now += 29
+  assert cache.get('token') == False
+  clock.now += 1
+  assert cache.get('token') == None
+
+def test_lru_eviction(clock):
+  cache = TokenCache(max_size=2, ttl=300, negative_ttl=30)
+  cache.put('a', {'active': True})
+  cache.put('b', {'active': True})
+  # a is now the most recently used
+  assert cache.get('a') == True
+  cache.put('c', {'active': True})
+  assert cache.get('b') == None
+  assert cache.get('a') == True
+  assert cache.get('c') == True
+
+def test_introspection_cached(auth_server):
+  auth_server.responses['good'] = [(200, {'active': True})]
+  auth_server.responses['bad'] = [(200, {'active': False})]
+  for _ in range(3):
+    assert isTokenActive('good') == True
+    assert isTokenActive('bad') == False
+  assert sorted(auth_server.requests) == ['bad', 'good']
+
+def test_introspection_errors_not_cached(auth_server):
+  auth_server.responses['token'] = [(400, {'error': 'invalid_request'}), (200, {'active': True})]
+  with pytest.raises(Exception):
+    isTokenActive('token')
+  assert isTokenActive('token') == True
+  assert isTokenActive('token') == True
+  assert auth_server.requests == ['token', 'token']
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('rq')
+pytest.importorskip('parsl')
+pytest.importorskip('sqlalchemy')
+
+from paropt.storage.entities import Experiment, Parameter, ParameterConfig, Trial, LocalCompute
+from paropt.storage.entities.trial import FAILED_TRIAL_OUTCOME
+
+from api.paropt_manager import ParoptManager
+
+# outcome, run number and day of June 2019 of each trial
+TRIALS = [(-3.0, 1, 1), (FAILED_TRIAL_OUTCOME, 1, 2), (-1.0, 1, 3), (-2.0, 2, 4), (-5.0, 2, 5)]
+
+@pytest.fixture
+def experiment(storage):
+  session = storage.Session()
+  try:
+    experiment, _, _ = storage.getOrCreateExperiment(session, Experiment(
+      tool_name='tool',
+      parameters=[Parameter(name='x', minimum=0, maximum=10)],
+      command_template_string='echo ${x}',
+      compute=LocalCompute(max_threads=1)))
+    for x, (outcome, run_number, day) in enumerate(TRIALS):
+      _saveTrial(storage, session, experiment, x, outcome, run_number, datetime(2019, 6, day))
+    return experiment
+  finally:
+    session.close()
+
+def _saveTrial(storage, session, experiment, x, outcome, run_number=1, timestamp=None):
+  storage.saveResult(session, Trial(
+    experiment_id=experiment.id,
+    run_number=run_number,
+    outcome=outcome,
+    timestamp=timestamp,
+    parameter_configs=[ParameterConfig(parameter=experiment.parameters[0], value=x)],
+    obj_parameters={'running_time': 1.0}))
+
+def _getTrials(client, experiment, expected_status=200, **args):
+  response = client.get(f'/api/v1/experiments/{experiment.id}/trials', query_string=args)
+  assert response.status_code == expected_status
+  return response
+
+def _outcomes(response):
+  return [trial['outcome'] for trial in response.get_json()['trials']]
+
+def test_pages(client, experiment):
+  outcomes = []
+  args = {'limit': 2}
+  for n_trials in (2, 2, 1):
+    page = _getTrials(client, experiment, **args).get_json()
+    assert len(page['trials']) == n_trials
+    outcomes += [trial['outcome'] for trial in page['trials']]
+    args['cursor'] = page['next_cursor']
+  assert page['next_cursor'] is None
+  assert outcomes == [outcome for outcome, _, _ in TRIALS]
+  assert [config['value'] for config in page['trials'][0]['parameter_configs']] == [4]
+
+  # a page that ends with the last trial has no next page
+  assert _getTrials(client, experiment, limit=5).get_json()['next_cursor'] is None
+  trials, next_cursor = ParoptManager.getTrials(experiment.id, limit=4)
+  assert [trial['outcome'] for trial in trials] == outcomes[:4]
+  assert next_cursor == trials[-1]['id']
+
+def test_since_trial_id(client, storage, experiment):
+  trials = _getTrials(client, experiment).get_json()['trials']
+  since = trials[2]['id']
+  assert _outcomes(_getTrials(client, experiment, since_trial_id=since)) == [-2.0, -5.0]
+  # paging through new trials, the greater of the two applies
+  assert _outcomes(_getTrials(client, experiment, since_trial_id=since, cursor=trials[3]['id'])) == [-5.0]
+  assert _outcomes(_getTrials(client, experiment, since_trial_id=trials[-1]['id'])) == []
+
+  session = storage.Session()
+  try:
+    _saveTrial(storage, session, experiment, 7, -0.5)
+  finally:
+    session.close()
+  assert _outcomes(_getTrials(client, experiment, since_trial_id=trials[-1]['id'])) == [-0.5]
+
+def test_filters(client, experiment):
+  assert _outcomes(_getTrials(client, experiment, status='failed')) == [FAILED_TRIAL_OUTCOME]
+  assert _outcomes(_getTrials(client, experiment, status='succeeded')) == [-3.0, -1.0, -2.0, -5.0]
+  assert _outcomes(_getTrials(client, experiment, min_outcome=-3, max_outcome=-1)) == [-3.0, -1.0, -2.0]
+  assert _outcomes(_getTrials(client, experiment, max_outcome=-5)) == [-5.0]
+  assert _outcomes(_getTrials(client, experiment, run_number=2)) == [-2.0, -5.0]
+  assert _outcomes(_getTrials(client, experiment, start_time='2019-06-02', end_time='2019-06-04T00:00:00')) == \
+    [FAILED_TRIAL_OUTCOME, -1.0]
+  assert _outcomes(_getTrials(client, experiment, status='succeeded', run_number=1, limit=1)) == [-3.0]
+
+def test_invalid_arguments(client, experiment):
+  for args in ({'limit': 0}, {'limit': 'a'}, {'cursor': '1.5'}, {'min_outcome': 'low'}, {'status': 'running'},
+               {'start_time': 'yesterday'}):
+    _getTrials(client, experiment, expected_status=400, **args)
+  with pytest.raises(Exception, match='limit must be at least 1'):
+    ParoptManager.getTrials(experiment.id, limit=0)
+
+def test_not_modified(client, storage, experiment):
+  response = _getTrials(client, experiment)
+  etag = response.headers['ETag']
+
+  # until a trial is saved, also for the weak ETag of compressed responses
+  for headers in ({'If-None-Match': etag}, {'If-None-Match': f'W/{etag}'}):
+    response = client.get(f'/api/v1/experiments/{experiment.id}/trials', headers=headers)
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.get_data() == b''
+  response = client.get(f'/api/v1/experiments/{experiment.id}/trials', headers={'If-None-Match': '"other"'})
+  assert response.status_code == 200
+
+  session = storage.Session()
+  try:
+    _saveTrial(storage, session, experiment, 7, -0.5)
+  finally:
+    session.close()
+  response = client.get(f'/api/v1/experiments/{experiment.id}/trials', headers={'If-None-Match': etag})
+  assert response.status_code == 200
+  assert response.headers['ETag'] != etag
+  assert _outcomes(response)[-1] == -0.5
@@ -0,0 +1,7 @@
+from .importance import parameterImportance, permutationImportance, getIncumbentValues
+
+__all__ = [
+  'parameterImportance',
+  'permutationImportance',
+  'getIncumbentValues',
+]
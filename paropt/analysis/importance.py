@@ -0,0 +1,119 @@
+import logging
+import warnings
+
+import numpy as np
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern
+
+from paropt.storage.entities import ParameterConfig, PARAMETER_TYPE_FLOAT, FAILED_TRIAL_OUTCOME
+
+logger = logging.getLogger(__name__)
+
+MIN_TRIALS = 5 # fewer trials than this can't tell important parameters apart
+MAX_TRIALS = 1000 # GP fitting is cubic in the number of trials, use a random subset above this
+
+
+def _trialValues(trial):
+    """
+    Outcome and parameter name to value of a Trial, or of a trial dict in the format of Trial.asdict(),
+    e.g. from RelationalDB.iterTrialRows(), which doesn't load ORM objects
+    """
+    if isinstance(trial, dict):
+        return trial['outcome'], {config['parameter_name']: config['value'] for config in trial['parameter_configs']}
+    return trial.outcome, {config.parameter.name: config.value for config in trial.parameter_configs}
+
+
+def trialsToArrays(trials, parameters):
+    """
+    Given trials (Trials or trial dicts) and the experiment's parameters, return (X, y) arrays with one row per trial
+    and one column per parameter, in the order of parameters. Failed trials and trials missing a parameter are skipped.
+    """
+    names = [parameter.name for parameter in parameters]
+    X, y = [], []
+    for trial in trials:
+        outcome, values = _trialValues(trial)
+        if outcome == FAILED_TRIAL_OUTCOME:
+            continue
+        if all(name in values for name in names):
+            X.append([values[name] for name in names])
+            y.append(outcome)
+    return np.array(X, dtype=float).reshape(-1, len(names)), np.array(y, dtype=float)
+
+
+def permutationImportance(X, y, bounds, n_repeats=10, random_state=None):
+    """
+    Fit a GP surrogate on (X, y) and compute how much its predictions degrade when the values of
+    each parameter are shuffled across trials. Returns importances normalized to sum to 1.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        parameter values, one row per trial
+    y : np.ndarray
+        outcomes
+    bounds : np.ndarray
+        (minimum, maximum) of each parameter, used to scale parameters to the unit interval
+    """
+    random_state = np.random.RandomState(random_state)
+    if len(y) > MAX_TRIALS:
+        subset = random_state.choice(len(y), MAX_TRIALS, replace=False)
+        X, y = X[subset], y[subset]
+
+    span = bounds[:, 1] - bounds[:, 0]
+    span[span == 0] = 1
+    X = (X - bounds[:, 0]) / span
+    y = (y - y.mean()) / (y.std() or 1.0)
+
+    gp = GaussianProcessRegressor(kernel=Matern(nu=2.5), alpha=1e-6, normalize_y=False,
+                                  n_restarts_optimizer=5, random_state=random_state)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        gp.fit(X, y)
+    baseline = np.mean((gp.predict(X) - y) ** 2)
+
+    importances = np.zeros(X.shape[1])
+    for dim in range(X.shape[1]):
+        errors = []
+        for _ in range(n_repeats):
+            X_permuted = X.copy()
+            X_permuted[:, dim] = random_state.permutation(X_permuted[:, dim])
+            errors.append(np.mean((gp.predict(X_permuted) - y) ** 2))
+        importances[dim] = max(np.mean(errors) - baseline, 0)
+
+    total = importances.sum()
+    if total == 0:
+        return np.full(X.shape[1], 1.0 / X.shape[1])
+    return importances / total
+
+
+def parameterImportance(trials, parameters, n_repeats=10, random_state=None):
+    """
+    Importance of each parameter for the outcome of the given trials, e.g. trials of an experiment from storage.
+
+    Returns
+    -------
+    importance : dict
+        parameter name to importance, summing to 1. Empty if there are fewer than MIN_TRIALS trials.
+    """
+    X, y = trialsToArrays(trials, parameters)
+    if len(y) < MIN_TRIALS:
+        logger.info(f'Not enough trials ({len(y)}) to compute parameter importance, need {MIN_TRIALS}')
+        return {}
+    bounds = np.array([[parameter.minimum, parameter.maximum] for parameter in parameters], dtype=float)
+    importances = permutationImportance(X, y, bounds, n_repeats=n_repeats, random_state=random_state)
+    return {parameter.name: float(importance) for parameter, importance in zip(parameters, importances)}
+
+
+def getIncumbentValues(trials, parameters=None):
+    """
+    Parameter values of the trial with the best outcome, typed according to the parameters.
+    The experiment's parameters are required for trial dicts, which don't have the type of each parameter.
+    """
+    best_trial = max((trial for trial in trials if _trialValues(trial)[0] != FAILED_TRIAL_OUTCOME),
+                     key=lambda trial: _trialValues(trial)[0])
+    if not isinstance(best_trial, dict):
+        return ParameterConfig.configsToDict(best_trial.parameter_configs)
+    types = {parameter.name: parameter.type for parameter in parameters}
+    _, values = _trialValues(best_trial)
+    # same typing as ParameterConfig.configsToDict()
+    return {name: value if types[name] == PARAMETER_TYPE_FLOAT else int(round(value)) for name, value in values.items()}
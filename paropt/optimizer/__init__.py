@@ -2,10 +2,15 @@ from .bayesian_optimizer import BayesianOptimizer
 from .grid_search import GridSearch
 from .coordinate_search import CoordinateSearch
 from .random_search import RandomSearch
+from .outcome_transform import Standardize, LogTransform, RankGaussian, ChainedTransform
 
 __all__ = [
   "BayesianOptimizer",
   "GridSearch",
   "CoordinateSearch",
   "RandomSearch",
+  "Standardize",
+  "LogTransform",
+  "RankGaussian",
+  "ChainedTransform",
 ]
\ No newline at end of file
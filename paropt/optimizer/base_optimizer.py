@@ -1,11 +1,61 @@
+import logging
+from collections import namedtuple
 from collections.abc import Iterable
 from abc import abstractmethod
 
+logger = logging.getLogger(__name__)
+
+# compact copy of a Trial kept by optimizers instead of the ORM object, so long runs don't hold on to
+# every Trial and ParameterConfig. params is a dict of parameter name to value
+TrialRecord = namedtuple('TrialRecord', ['params', 'outcome', 'run_number', 'experiment_id', 'obj_parameters'])
+
 class BaseOptimizer(Iterable):
+  # set by the optimizers from their stopping_policy, budget, and converge_thres/converge_steps arguments
+  stopping_policy = None
+  # StopDecision of the policy that stopped the optimizer, None while running
+  stop_decision = None
+  # parameter name to value, for parameters that are no longer searched (see freezeParameters())
+  frozen_parameters = {}
+
   @abstractmethod
   def getMax():
     pass
-  
+
   @abstractmethod
   def register():
     pass
+
+  @staticmethod
+  def _trialToRecord(trial):
+    if isinstance(trial, TrialRecord):
+      return trial
+    return TrialRecord(
+      params={config.parameter.name: config.value for config in trial.parameter_configs},
+      outcome=trial.outcome,
+      run_number=trial.run_number,
+      experiment_id=trial.experiment_id,
+      obj_parameters=trial.obj_parameters or {})
+
+  def freezeParameters(self, frozen_parameters):
+    """
+    Stop searching the given parameters, keyed by name, and use the given value for them in all further configs.
+    Used by the runner to prune parameters with little influence on the outcome.
+    """
+    logger.info(f'Freezing parameters: {frozen_parameters}')
+    self.frozen_parameters = dict(self.frozen_parameters, **frozen_parameters)
+
+  def _updateStoppingPolicy(self, trial, counts=True):
+    """
+    Update the stopping policy with a trial. Trials that don't count towards the policy (e.g. loaded from
+    previous runs) are only observed. Sets stop_flag and stop_decision when the policy decides to stop.
+    """
+    if self.stopping_policy is None:
+      return
+    if not counts:
+      self.stopping_policy.observe(trial)
+      return
+    decision = self.stopping_policy.update(trial, self)
+    if decision is not None and self.stop_decision is None:
+      logger.info(f'Stopping: {decision}')
+      self.stop_decision = decision
+      self.stop_flag = True
@@ -1,18 +1,30 @@
 import logging
+import warnings
 from random import randint
 
+import numpy as np
+
 from bayes_opt import BayesianOptimization
 from bayes_opt import UtilityFunction
+from bayes_opt.util import acq_max
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern
 
 from .base_optimizer import BaseOptimizer
-from paropt.storage.entities import Parameter, ParameterConfig, Trial
+from .trial_history import TrialHistory
+from .outcome_transform import getOutcomeTransform
+from paropt.storage.entities import Parameter, ParameterConfig
+from paropt.stopping import StopDecision, buildStoppingPolicy
 
 logger = logging.getLogger(__name__)
 
 MAX_RETRY_SUGGEST = 10
+MIN_COST_OBSERVATIONS = 2 # number of trials with a known running time needed before using cost-aware acquisition
 
 class BayesianOptimizer(BaseOptimizer):
-    def __init__(self, n_init, n_iter, alpha=1e-6, kappa=2.5, utility=None, budget=None, converge_thres=None, converge_steps=None):
+    def __init__(self, n_init, n_iter, alpha=1e-6, kappa=2.5, utility=None, budget=None, converge_thres=None, converge_steps=None,
+                 warm_start=False, warm_start_weight=0.5, cost_aware=False, n_candidates=1000, outcome_transform='standardize',
+                 stopping_policy=None):
 # These parameters are initialized by the runner
         # updated by setExperiment()
         
@@ -32,47 +44,181 @@ class BayesianOptimizer(BaseOptimizer):
         self.parameters_by_name = None
         self.n_init = n_init
         self.n_iter = n_iter
-        self.budget = budget
-        self.converge_thres = converge_thres
-        self.converge_steps = converge_steps
-        self.converge_steps_count = 0
+        self.stopping_policy = buildStoppingPolicy(stopping_policy, budget, converge_thres, converge_steps)
         self.stop_flag = False
 
-        self.using_budget_flag = False # check whether the current trial use budget
-        self.using_converge_flag = False # check whether the current tirl need to consider in convergence
+        self.using_stopping_flag = False # check whether the current trial counts towards the stopping policy
         self.previous_trials = []
         self.n_initted = 0
         self.n_itered = 0
         self.previous_trials_loaded = False
 
-        self.all_trials = []
-        self.visited_config = {} # store a string of config, and value is the index in previous_trials
+        self.history = None # TrialHistory of registered trials of this experiment, created by setExperiment()
+        self.max_trial = None # best trial of this experiment, related trials used for warm start are excluded
+
+        # warm start from trials of related experiments (see setRelatedTrials())
+        self.warm_start = warm_start
+        self.warm_start_weight = warm_start_weight
+        self.related_trials = []
+        self.sample_weights = [] # trust in each point registered into the model, in registration order (1 for own trials)
+
+        # transform applied to outcomes before fitting the model, e.g. 'log,standardize' (see outcome_transform.py).
+        # The GP's normalize_y only standardizes internally, its predictions and so the expected improvement are
+        # in units of its targets: standardizing them too makes expectedImprovement() independent of the outcomes' scale
+        self.outcome_transform = getOutcomeTransform(outcome_transform)
+
+        # cost-aware acquisition: rank candidates by expected improvement per second of running time
+        self.cost_aware = cost_aware
+        self.n_candidates = n_candidates
+        self.cost_model = None # fit on the running times in history
+        self.predicted_cost = None # predicted running time (seconds) of the last suggestion
     
     def setExperiment(self, experiment):
         """
         This is called by the runner after the experiment is properly initialized
         """
         self.parameters_by_name = {parameter.name: parameter for parameter in experiment.parameters}
+        # the GP's alpha is set on every fit (see _fitModel), so it isn't passed here: bayes_opt releases
+        # without the alpha argument work as well
         self.optimizer = BayesianOptimization(
             f=None,
             pbounds=Parameter.parametersToDict(experiment.parameters),
-            alpha=self.alpha,
             verbose=2,
             random_state=randint(1, 100),
         )
         self.experiment_id = experiment.id
-        self.previous_trials = experiment.trials
+        # keep values only, the runner releases the loaded trials
+        self.previous_trials = [self._trialToRecord(trial) for trial in experiment.trials]
+        self.history = TrialHistory(experiment.parameters, experiment_id=experiment.id)
+
+    def setRelatedTrials(self, related_experiments):
+        """
+        Seed the surrogate with trials from related experiments (see RelationalDB.getRelatedTrials()).
+        Related points are registered with extra GP noise so they shape the model without being trusted
+        as much as trials of this experiment. The trust is the task similarity weight:
+        warm_start_weight scaled by the parameter overlap, where a weight of 1 treats related trials like our own
+        and a weight near 0 makes them almost uninformative.
+        """
+        self.related_trials = []
+        for related in related_experiments:
+            weight = self.warm_start_weight * related['overlap']
+            if weight <= 0:
+                continue
+            for params_dict, outcome in related['trials']:
+                if self._inBounds(params_dict):
+                    self.related_trials.append((params_dict, outcome, min(weight, 1.0)))
+        logger.info(f'Warm starting with {len(self.related_trials)} trials from {len(related_experiments)} related experiments')
+
+    def freezeParameters(self, frozen_parameters):
+        """Also collapse the bounds of frozen parameters so the acquisition only searches the remaining ones"""
+        super().freezeParameters(frozen_parameters)
+        self.optimizer.set_bounds({name: (value, value) for name, value in frozen_parameters.items()})
+
+    def _inBounds(self, params_dict):
+        for name, param in self.parameters_by_name.items():
+            if name not in params_dict or not param.minimum <= params_dict[name] <= param.maximum:
+                return False
+        return True
+
+    def _loadRelated(self):
+        space = self.optimizer._space
+        for params_dict, outcome, weight in self.related_trials:
+            if space.params_to_array(params_dict) in space:
+                logger.info(f"Related config already registered, ignoring; config: {params_dict}, outcome: {outcome}")
+                continue
+            self.optimizer.register(params=params_dict, target=outcome)
+            self.sample_weights.append(weight)
+
+    def _fitModel(self):
+        """
+        Fit the GP on the transformed outcomes of all registered points and return the best transformed outcome.
+        Points from related experiments get extra noise: (1 - weight) / weight times the variance of the targets.
+        """
+        space = self.optimizer._space
+        gp = self.optimizer._gp
+        targets = self.outcome_transform(space.target)
+        weights = np.array(self.sample_weights)
+        target_var = 1.0 if getattr(gp, 'normalize_y', False) else max(targets.var(), self.alpha)
+        gp.alpha = self.alpha + (1.0 - weights) / weights * target_var
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            gp.fit(space.params, targets)
+        return targets.max()
+
+    def _suggest(self):
+        """Get a suggestion from the model fit on transformed outcomes"""
+        space = self.optimizer._space
+        self.predicted_cost = None
+        if len(space) == 0:
+            return space.array_to_params(space.random_sample())
+
+        y_max = self._fitModel()
+        suggestion = acq_max(
+            ac=self.utility.utility,
+            gp=self.optimizer._gp,
+            y_max=y_max,
+            bounds=space.bounds,
+            random_state=self.optimizer._random_state,
+        )
+        config_dict = space.array_to_params(suggestion)
+        if self.cost_aware and np.count_nonzero(self._costObservations()) >= MIN_COST_OBSERVATIONS:
+            config_dict = self._suggestCostAware(config_dict, y_max)
+        return config_dict
+
+    def _randomCandidates(self):
+        bounds = self.optimizer._space.bounds
+        return self.optimizer._random_state.uniform(bounds[:, 0], bounds[:, 1], size=(self.n_candidates, bounds.shape[0]))
+
+    def expectedImprovement(self):
+        """
+        Largest expected improvement of random candidate configs under the current model, in units of the
+        transformed outcome. Used by the ExpectedImprovementThreshold stopping policy; None before the model is fit.
+        """
+        if not self.previous_trials_loaded or len(self.optimizer._space) == 0:
+            return None
+        y_max = self._fitModel()
+        ei = UtilityFunction(kind='ei', kappa=self.kappa, xi=0.0).utility(self._randomCandidates(), self.optimizer._gp, y_max)
+        return float(ei.max())
+
+    def _costObservations(self):
+        """Mask of trials in history with a known running time, the observations of the cost model"""
+        running_times = self.history.running_times
+        with np.errstate(invalid='ignore'):
+            return running_times > 0
+
+    def _fitCostModel(self):
+        if self.cost_model is None:
+            self.cost_model = GaussianProcessRegressor(
+                kernel=Matern(nu=2.5),
+                alpha=self.alpha,
+                normalize_y=True,
+                n_restarts_optimizer=5,
+                random_state=self.optimizer._random_state,
+            )
+            observed = self._costObservations()
+            self.cost_model.fit(self.history.params[observed], np.log(self.history.running_times[observed]))
+        return self.cost_model
+
+    def _suggestCostAware(self, config_dict, y_max):
+        """
+        Rank random candidates, plus the model's own suggestion, by expected improvement per predicted second
+        of running time. Relies on the objective GP having just been fit by _fitModel().
+        """
+        space = self.optimizer._space
+        candidates = np.vstack([space.params_to_array(config_dict), self._randomCandidates()])
+
+        ei = UtilityFunction(kind='ei', kappa=self.kappa, xi=0.0).utility(candidates, self.optimizer._gp, y_max)
+        cost = np.exp(self._fitCostModel().predict(candidates))
+        best = np.argmax(ei / cost)
+        self.predicted_cost = float(cost[best])
+        logger.info(f'Cost-aware suggestion: expected improvement {ei[best]}, predicted running time {self.predicted_cost}s')
+        return space.array_to_params(candidates[best])
     
     def _trialParamsToDict(self, trial):
-        params_dict = {}
-        for parameter_config in trial.parameter_configs:
-            params_dict[parameter_config.parameter.name] = parameter_config.value
-        return params_dict
+        return dict(trial.params)
 
     def _load(self):
-        if self.previous_trials == []:
-            return
-
+        # own trials first, so related points at configs this experiment already ran are the ones skipped
         for trial in self.previous_trials:
             params_dict = self._trialParamsToDict(trial)
             logger.info(f'Registering: {params_dict}, {trial.outcome}')
@@ -86,6 +232,7 @@ class BayesianOptimizer(BaseOptimizer):
                 logger.warning(
                     f"Config already registered, ignoring; config: {params_dict}, outcome: {trial.outcome}"
                 )
+        self._loadRelated()
     
     def _configDictToParameterConfigs(self, config_dict):
         """
@@ -97,40 +244,19 @@ class BayesianOptimizer(BaseOptimizer):
             param = self.parameters_by_name.get(name, None)
             if param == None:
                 raise Exception('Parameter with name "{}" not found in optimizer'.format(name))
+            value = self.frozen_parameters.get(name, value)
             # TODO: This should return ParameterConfig values with the proper type (e.g. int, float)
             parameter_configs.append(ParameterConfig(parameter=param, value=value))
         return parameter_configs
 
-    def _parameterConfigToString(self, parameter_configs):
-        """
-        transfer parameter configuration into string for hash
-        {A: 10, B: 100} ==> '#A#10#B#100'
-        """
-        cur_config = ''
-        for key, value in ParameterConfig.configsToDict(parameter_configs).items():
-            cur_config += f'#{key}#{value}'
-        return cur_config
-
-    def _update_visited_config(self, parameter_configs):
-        """
-        given a new parameter configuration, update the visited_config dictionary, save key (string) and value (int , index in all_trials)
-        """
-        cur_config = self._parameterConfigToString(parameter_configs)
-        if cur_config in self.visited_config:
-            logger.warning(f'trying to update seen configuration in bayesian_optimizer._update_visited_config, existing one is {self._trialParamsToDict(self.all_trials[self.visited_config[cur_config]])}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
-
-        else:
-            self.visited_config[cur_config] = len(self.all_trials) - 1
-
     def _getTrialWithParameterConfigs(self, parameter_configs):
-        """Given a list of parameter configs, it returns a trial from previous_trials or None if not found"""
-        # TODO: this should check self.previous_trials to find a trial that used the provided configs
-        # FIXME: This function is unimplemented, functionally acting like every parameter config is unique
-        cur_config = self._parameterConfigToString(parameter_configs)
-        if cur_config in self.visited_config:
-            logger.warning(f'find existing trial in bayesian_optimizer._getTrialWithParameterConfigs, existing one is {self._trialParamsToDict(self.all_trials[self.visited_config[cur_config]])}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
-            return self.all_trials[self.visited_config[cur_config]]
-        return None
+        """Given a list of parameter configs, it returns the registered trial that used the same configs or None if not found"""
+        row = self.history.find(self._parameterConfigsToConfigDict(parameter_configs))
+        if row is None:
+            return None
+        trial = self.history.get(row)
+        logger.warning(f'find existing trial in bayesian_optimizer._getTrialWithParameterConfigs, existing one is {trial.params}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
+        return trial
 
     def _suggestUniqueParameterConfigs(self):
         """Returns an untested list of parameter configs
@@ -144,25 +270,19 @@ class BayesianOptimizer(BaseOptimizer):
             - if the set of configurations have been used before,
                 register the point and get another suggestion
         """
-        config_dict = self.optimizer.suggest(self.utility)
+        config_dict = self._suggest()
         param_configs = self._configDictToParameterConfigs(config_dict)
         trial = self._getTrialWithParameterConfigs(param_configs)
         n_suggests = 0
         while trial != None and n_suggests < MAX_RETRY_SUGGEST:
-            self.using_budget_flag = False
+            self.using_stopping_flag = False
             # logger.info(f"Retrying suggest: Non-unique set of ParameterConfigs: {param_configs}")
             # This set of configurations have been used before
             # register a new trail with same outcome but with our suggested (float) values
-            dup_trial = Trial(
-                parameter_configs=param_configs,
-                outcome=trial.outcome,
-                run_number=trial.run_number,
-                experiment_id=trial.experiment_id,
-                obj_parameters={},
-            )
+            dup_trial = trial._replace(params=self._parameterConfigsToConfigDict(param_configs), obj_parameters={})
             self.register(dup_trial)
             # get another suggestion from updated model
-            config_dict = self.optimizer.suggest(self.utility)
+            config_dict = self._suggest()
             param_configs = self._configDictToParameterConfigs(config_dict)
             trial = self._getTrialWithParameterConfigs(param_configs)
             n_suggests += 1
@@ -171,7 +291,7 @@ class BayesianOptimizer(BaseOptimizer):
             logger.warning(f'Meet maximum retry suggest {MAX_RETRY_SUGGEST}')
             raise Exception(f"BayesOpt failed to find untested config after {n_suggests} attempts. "
                                             f"Consider increasing the utility function kappa value")
-        self.using_budget_flag = True
+        self.using_stopping_flag = True
         return param_configs
     
     def _parameterConfigsToConfigDict(self, parameter_configs):
@@ -191,81 +311,63 @@ class BayesianOptimizer(BaseOptimizer):
         else:
             if self.n_initted < self.n_init:
                 self.n_initted += 1
-                config_dict = self.optimizer.suggest(self.utility)
+                config_dict = self._suggest()
                 next_config = self._configDictToParameterConfigs(config_dict)
-                self.using_budget_flag = True
-                self.using_converge_flag = False
+                self.using_stopping_flag = True
                 return next_config
             if not self.previous_trials_loaded:
-                self.using_budget_flag = False
-                self.using_converge_flag = False
+                self.using_stopping_flag = False
                 self.previous_trials_loaded = True
                 self._load()
             if self.n_itered < self.n_iter:
                 self.n_itered += 1
                 next_config = self._suggestUniqueParameterConfigs()
-                self.using_budget_flag = True
-                self.using_converge_flag = True
+                remaining = getattr(self.stopping_policy, 'remaining', None)
+                if remaining is not None and self.predicted_cost is not None and self.predicted_cost > remaining:
+                    # don't dispatch a trial which is projected to overrun the remaining budget
+                    self.stop_decision = StopDecision(
+                        'ProjectedBudget',
+                        f'Predicted running time {self.predicted_cost:.1f}s exceeds remaining budget {remaining:.1f}s',
+                        self.stopping_policy.n_trials)
+                    logger.info(f'Stopping: {self.stop_decision}')
+                    self.stop_flag = True
+                    raise StopIteration
+                self.using_stopping_flag = True
                 return next_config
             else:
                 raise StopIteration
     
 
-    def _update_converge(self, trial):
-        best_out = self.getMax()
-        if trial.outcome / float(best_out['target']) <= self.converge_thres:
-            self.converge_steps_count = 0
-        else:
-            self.converge_steps_count += 1
-        
-        if self.converge_steps_count >= self.converge_steps:
-            logger.exception(f'Meet creteria of converging')
-            return -1
-        else:
-            return 0
-
-
-    def _update_budget(self, trial):
-        self.budget -= -trial.outcome*86400 # count in second
-        if self.budget <= 0:
-            logger.exception(f'Reach budget')
-            return -1
-        else:
-            return 0
-
-
     def register(self, trial):
         """
         If previous trials have not been loaded, store result in previous trials to allow
         the init samples to be truly random. If they have been loaded, we can immediately register
         the result into the model.
         """
-        # save to all trials and update visited_config dictionary
-        self.all_trials.append(trial)
-        self._update_visited_config(self._configDictToParameterConfigs(self._trialParamsToDict(trial)))
-        
-        
-        if self.using_budget_flag and self.budget is not None:
-            return_code = self._update_budget(trial)
-            if return_code == -1:
-                self.stop_flag = True
+        trial = self._trialToRecord(trial)
 
-        if self.using_converge_flag and self.converge_thres is not None and self.converge_steps is not None:
-            return_code = self._update_converge(trial)
-            if return_code == -1:
-                self.stop_flag = True
+        if self.max_trial is None or trial.outcome > self.max_trial.outcome:
+            self.max_trial = trial
 
         if not self.previous_trials_loaded:
             self.previous_trials.append(trial)
-            return
-        self.optimizer.register(
-            params=self._parameterConfigsToConfigDict(trial.parameter_configs),
-            target=trial.outcome,
-        )
-        
-
-
+        else:
+            self.optimizer.register(
+                params=trial.params,
+                target=trial.outcome,
+            )
+            self.sample_weights.append(1.0)
+            self.history.add(trial)
+            # refit with the new running time when next needed
+            self.cost_model = None
 
+        # update after registering so policies using the model see this trial
+        self._updateStoppingPolicy(trial, counts=self.using_stopping_flag)
 
     def getMax(self):
-        return self.optimizer.max
\ No newline at end of file
+        if self.max_trial is None:
+            return {}
+        return {
+            'target': self.max_trial.outcome,
+            'params': dict(self.max_trial.params),
+        }
\ No newline at end of file
@@ -6,7 +6,9 @@ from bayes_opt import BayesianOptimization
 from bayes_opt import UtilityFunction
 
 from .base_optimizer import BaseOptimizer
-from paropt.storage.entities import Parameter, ParameterConfig, Trial
+from .trial_history import TrialHistory
+from paropt.storage.entities import Parameter, ParameterConfig
+from paropt.stopping import buildStoppingPolicy
 
 from sys import maxsize
 
@@ -24,27 +26,45 @@ class CoordinateSearchOptimizer():
             np.random.seed = self.random_seed
         self.max_outcome = -maxsize
         self.max_outcome_parameters = None
-        self.num_dim = len(pbounds.keys())
+        self.frozen = {} # parameter name to value, for parameters that are no longer searched
+        self.dim_names = list(self.pbounds.keys()) # dimensions searched one at a time, frozen ones excluded
+        self.num_dim = len(self.dim_names)
         self.cur_dim = np.random.randint(self.num_dim)
-        self.cur_dim_name = list(self.pbounds.keys())[self.cur_dim]
+        self.cur_dim_name = self.dim_names[self.cur_dim]
+        self.suggested_queue = None
+
+    def freeze(self, frozen_parameters):
+        """Stop cycling through the given parameters, and use the given value for them in every suggestion"""
+        self.frozen.update(frozen_parameters)
+        self.dim_names = [name for name in self.pbounds if name not in self.frozen]
+        self.num_dim = len(self.dim_names)
+        if self.num_dim > 0:
+            self.cur_dim = self.cur_dim % self.num_dim
+            self.cur_dim_name = self.dim_names[self.cur_dim]
+        # queued suggestions still use the previous values
         self.suggested_queue = None
 
     def suggest(self):
         if self.max_outcome_parameters is None:
             suggested_dict = {name: np.random.uniform(low=ran[0], high=ran[1]) for name, ran in self.pbounds.items()}
+            suggested_dict.update(self.frozen)
             return suggested_dict
 
+        if self.num_dim == 0:
+            # every parameter is frozen, there's nothing left to search
+            return dict(self.max_outcome_parameters, **self.frozen)
+
         if self.suggested_queue is None or len(self.suggested_queue) == 0:
             # create suggested_queue based on current max_outcome_parameters and cur_dim, update cur_dim and curdim_name
             self.suggested_queue = []
             for val in range(self.pbounds[self.cur_dim_name][0], self.pbounds[self.cur_dim_name][1] + 1):
-                tmp = {config.parameter.name: config.value for config in self.max_outcome_parameters}
+                tmp = dict(self.max_outcome_parameters, **self.frozen)
                 tmp[self.cur_dim_name] = val
                 self.suggested_queue.append(tmp)
             logger.info(f'\n###############current suggested_queue: {self.suggested_queue}, \ncur_dim: {self.cur_dim}, \ncur_dim_name: {self.cur_dim_name}')
             # suggested_dict = {name: np.random.uniform(low=ran[0], high=ran[1]) for name, ran in self.pbounds.items()}
             self.cur_dim = (self.cur_dim+1) % self.num_dim
-            self.cur_dim_name = list(self.pbounds.keys())[self.cur_dim]
+            self.cur_dim_name = self.dim_names[self.cur_dim]
 
         suggested_dict = self.suggested_queue[0]
         self.suggested_queue = self.suggested_queue[1:]
@@ -56,7 +76,7 @@ class CoordinateSearchOptimizer():
         update best
         """
         if trial.outcome > self.max_outcome:
-            self.max_outcome_parameters = trial.parameter_configs
+            self.max_outcome_parameters = trial.params
             self.max_outcome = trial.outcome
 
     def max(self):
@@ -64,7 +84,7 @@ class CoordinateSearchOptimizer():
 
 
 class CoordinateSearch(BaseOptimizer):
-    def __init__(self, n_init=1, n_iter=20, random_seed=None, budget=None, converge_thres=None, converge_steps=None):
+    def __init__(self, n_init=1, n_iter=20, random_seed=None, budget=None, converge_thres=None, converge_steps=None, stopping_policy=None):
 # These parameters are initialized by the runner
         # updated by setExperiment()
         self.optimizer = None
@@ -74,22 +94,17 @@ class CoordinateSearch(BaseOptimizer):
         self.parameters_by_name = None
         self.n_init = n_init # current only 1 works
         self.n_iter = n_iter
-        self.budget = budget
-        self.converge_thres = converge_thres
-        self.converge_steps = converge_steps
-        self.converge_steps_count = 0
+        self.stopping_policy = buildStoppingPolicy(stopping_policy, budget, converge_thres, converge_steps)
         self.stop_flag = False
 
-        self.using_budget_flag = False # check whether the current trial use budget
-        self.using_converge_flag = False # check whether the current tirl need to consider in convergence
+        self.using_stopping_flag = False # check whether the current trial counts towards the stopping policy
 
         self.n_initted = 0
         self.n_itered = 0
         self.previous_trials = []
         self.previous_trials_loaded = False
 
-        self.all_trials = []
-        self.visited_config = {} # store a string of config, and value is the index in previous_trials
+        self.history = None # TrialHistory of registered trials of this experiment, created by setExperiment()
     
     def setExperiment(self, experiment):
         """
@@ -98,13 +113,17 @@ class CoordinateSearch(BaseOptimizer):
         self.parameters_by_name = {parameter.name: parameter for parameter in experiment.parameters}
         self.optimizer = CoordinateSearchOptimizer(pbounds=Parameter.parametersToDict(experiment.parameters), random_seed=self.random_seed)
         self.experiment_id = experiment.id
-        self.previous_trials = experiment.trials
+        # keep values only, the runner releases the loaded trials
+        self.previous_trials = [self._trialToRecord(trial) for trial in experiment.trials]
+        self.history = TrialHistory(experiment.parameters, experiment_id=experiment.id)
     
+    def freezeParameters(self, frozen_parameters):
+        """Also take frozen parameters out of the dimensions the optimizer cycles through"""
+        super().freezeParameters(frozen_parameters)
+        self.optimizer.freeze(frozen_parameters)
+
     def _trialParamsToDict(self, trial):
-        params_dict = {}
-        for parameter_config in trial.parameter_configs:
-            params_dict[parameter_config.parameter.name] = parameter_config.value
-        return params_dict
+        return dict(trial.params)
 
     def _load(self):
         if self.previous_trials == []:
@@ -130,40 +149,19 @@ class CoordinateSearch(BaseOptimizer):
             param = self.parameters_by_name.get(name, None)
             if param == None:
                 raise Exception('Parameter with name "{}" not found in optimizer'.format(name))
+            value = self.frozen_parameters.get(name, value)
             # TODO: This should return ParameterConfig values with the proper type (e.g. int, float)
             parameter_configs.append(ParameterConfig(parameter=param, value=value))
         return parameter_configs
 
-    def _parameterConfigToString(self, parameter_configs):
-        """
-        transfer parameter configuration into string for hash
-        {A: 10, B: 100} ==> '#A#10#B#100'
-        """
-        cur_config = ''
-        for key, value in ParameterConfig.configsToDict(parameter_configs).items():
-            cur_config += f'#{key}#{value}'
-        return cur_config
-
-    def _update_visited_config(self, parameter_configs):
-        """
-        given a new parameter configuration, update the visited_config dictionary, save key (string) and value (int , index in all_trials)
-        """
-        cur_config = self._parameterConfigToString(parameter_configs)
-        if cur_config in self.visited_config:
-            logger.warning(f'trying to update seen configuration in CoordinateSearch_optimizer._update_visited_config, existing one is {self._trialParamsToDict(self.all_trials[self.visited_config[cur_config]])}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
-
-        else:
-            self.visited_config[cur_config] = len(self.all_trials) - 1
-
     def _getTrialWithParameterConfigs(self, parameter_configs):
-        """Given a list of parameter configs, it returns a trial from previous_trials or None if not found"""
-        # TODO: this should check self.previous_trials to find a trial that used the provided configs
-        # FIXME: This function is unimplemented, functionally acting like every parameter config is unique
-        cur_config = self._parameterConfigToString(parameter_configs)
-        if cur_config in self.visited_config:
-            logger.warning(f'find existing trial in CoordinateSearch_optimizer._getTrialWithParameterConfigs, existing one is {self._trialParamsToDict(self.all_trials[self.visited_config[cur_config]])}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
-            return self.all_trials[self.visited_config[cur_config]]
-        return None
+        """Given a list of parameter configs, it returns the registered trial that used the same configs or None if not found"""
+        row = self.history.find(self._parameterConfigsToConfigDict(parameter_configs))
+        if row is None:
+            return None
+        trial = self.history.get(row)
+        logger.warning(f'find existing trial in CoordinateSearch_optimizer._getTrialWithParameterConfigs, existing one is {trial.params}, new one is {self._parameterConfigsToConfigDict(parameter_configs)}')
+        return trial
 
     def _suggestUniqueParameterConfigs(self):
         """Returns an untested list of parameter configs
@@ -182,17 +180,11 @@ class CoordinateSearch(BaseOptimizer):
         trial = self._getTrialWithParameterConfigs(param_configs)
         n_suggests = 0
         while trial != None and n_suggests < MAX_RETRY_SUGGEST:
-            self.using_budget_flag = False
+            self.using_stopping_flag = False
             # logger.info(f"Retrying suggest: Non-unique set of ParameterConfigs: {param_configs}")
             # This set of configurations have been used before
             # register a new trail with same outcome but with our suggested (float) values
-            dup_trial = Trial(
-                parameter_configs=param_configs,
-                outcome=trial.outcome,
-                run_number=trial.run_number,
-                experiment_id=trial.experiment_id,
-                obj_parameters={},
-            )
+            dup_trial = trial._replace(params=self._parameterConfigsToConfigDict(param_configs), obj_parameters={})
             self.register(dup_trial)
             # get another suggestion from updated model
             config_dict = self.optimizer.suggest()
@@ -204,7 +196,7 @@ class CoordinateSearch(BaseOptimizer):
             logger.warning(f'Meet maximum retry suggest {MAX_RETRY_SUGGEST}')
             raise Exception(f"BayesOpt failed to find untested config after {n_suggests} attempts. "
                                             f"Consider increasing the utility function kappa value")
-        self.using_budget_flag = True
+        self.using_stopping_flag = True
         return param_configs
     
     def _parameterConfigsToConfigDict(self, parameter_configs):
@@ -226,71 +218,36 @@ class CoordinateSearch(BaseOptimizer):
                 self.n_initted += 1
                 config_dict = self.optimizer.suggest()
                 next_config = self._configDictToParameterConfigs(config_dict)
-                self.using_budget_flag = True
-                self.using_converge_flag = False
+                self.using_stopping_flag = True
                 return next_config
             if not self.previous_trials_loaded:
-                self.using_budget_flag = False
-                self.using_converge_flag = False
+                self.using_stopping_flag = False
                 self.previous_trials_loaded = True
                 self._load()
             if self.n_itered < self.n_iter:
                 self.n_itered += 1
                 next_config = self._suggestUniqueParameterConfigs()
-                self.using_budget_flag = True
-                self.using_converge_flag = True
+                self.using_stopping_flag = True
                 return next_config
             else:
                 raise StopIteration
 
 
-    def _update_converge(self, trial):
-        best_out_param, best_out = self.getMax()
-        if trial.outcome / float(best_out) <= self.converge_thres:
-            self.converge_steps_count = 0
-        else:
-            self.converge_steps_count += 1
-        
-        if self.converge_steps_count >= self.converge_steps:
-            logger.exception(f'Meet creteria of converging')
-            return -1
-        else:
-            return 0
-
-
-    def _update_budget(self, trial):
-        self.budget -= -trial.outcome*86400 # count in second
-        if self.budget <= 0:
-            logger.exception(f'Reach budget')
-            return -1
-        else:
-            return 0
-
-
     def register(self, trial):
         """
         If previous trials have not been loaded, store result in previous trials to allow
         the init samples to be truly random. If they have been loaded, we can immediately register
         the result into the model.
         """
-        # save to all trials and update visited_config dictionary
-        self.all_trials.append(trial)
-        self._update_visited_config(self._configDictToParameterConfigs(self._trialParamsToDict(trial)))
-
-        if self.using_budget_flag and self.budget is not None:
-            return_code = self._update_budget(trial)
-            if return_code == -1:
-                self.stop_flag = True
-
-        if self.using_converge_flag and self.converge_thres is not None and self.converge_steps is not None:
-            return_code = self._update_converge(trial)
-            if return_code == -1:
-                self.stop_flag = True
+        trial = self._trialToRecord(trial)
 
         if not self.previous_trials_loaded:
             self.previous_trials.append(trial)
-            return
-        self.optimizer.register(trial)
+        else:
+            self.optimizer.register(trial)
+            self.history.add(trial)
+
+        self._updateStoppingPolicy(trial, counts=self.using_stopping_flag)
 
     def getMax(self):
         return self.optimizer.max_outcome_parameters, self.optimizer.max_outcome
\ No newline at end of file
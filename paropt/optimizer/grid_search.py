@@ -3,15 +3,19 @@ import itertools
 from sys import maxsize
 
 from paropt.storage.entities import Parameter, ParameterConfig
+from paropt.stopping import buildStoppingPolicy
 import logging
 
 logger = logging.getLogger(__name__)
 class GridSearch(BaseOptimizer):
-    def __init__(self, num_configs_per_param):
+    def __init__(self, num_configs_per_param, stopping_policy=None):
         """
         Class for evenly searching the parameter search space. Performs NO optimization.
         """
+        self.stopping_policy = buildStoppingPolicy(stopping_policy)
+        self.stop_flag = False
         self.max_outcome = -maxsize
+        self.max_outcome_parameters = None
         self.grid_parameter_configs = []
         self.num_configs_per_param = num_configs_per_param
         # if self.num_configs_per_param < 2:
@@ -44,12 +48,21 @@ class GridSearch(BaseOptimizer):
             self.grid_parameter_configs.append(parameter_configs)
 
     def __iter__(self):
-        return iter(self.grid_parameter_configs)
+        for parameter_configs in self.grid_parameter_configs:
+            if self.stop_flag:
+                return
+            # skip configs that don't use the value of a frozen parameter
+            if any(config.parameter.name in self.frozen_parameters and config.value != self.frozen_parameters[config.parameter.name]
+                   for config in parameter_configs):
+                continue
+            yield parameter_configs
     
     def register(self, trial):
         if trial.outcome > self.max_outcome:
-            self.max_outcome_parameters = trial.parameter_configs
+            # a dict of parameter name to value like the other optimizers, not the trial's ParameterConfigs
+            self.max_outcome_parameters = self._trialToRecord(trial).params
             self.max_outcome = trial.outcome
+        self._updateStoppingPolicy(trial)
 
     def getMax(self):
         return self.max_outcome_parameters, self.max_outcome
\ No newline at end of file
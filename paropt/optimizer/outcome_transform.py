@@ -0,0 +1,95 @@
+import numpy as np
+from scipy.stats import norm
+
+
+class OutcomeTransform():
+    """
+    Maps raw outcomes to the values the surrogate model is fit on. Transforms must preserve the
+    ordering of outcomes (the optimizers maximize), and are refit on all outcomes every time the model is fit.
+    Raw outcomes are never modified - they are what gets stored and reported.
+    """
+    def __call__(self, outcomes):
+        return self.transform(np.asarray(outcomes, dtype=float))
+
+    def transform(self, outcomes):
+        raise NotImplementedError
+
+
+class Identity(OutcomeTransform):
+    def transform(self, outcomes):
+        return outcomes
+
+
+class Standardize(OutcomeTransform):
+    """Shift and scale outcomes to zero mean and unit variance"""
+    def transform(self, outcomes):
+        std = outcomes.std()
+        if std == 0:
+            std = 1.0
+        return (outcomes - outcomes.mean()) / std
+
+
+class LogTransform(OutcomeTransform):
+    """
+    Log scale outcomes, e.g. for runtimes that span orders of magnitude.
+    Negative outcomes (negated runtimes) become -log(-y), positive ones log(y), and a mix of both
+    sign(y) * log(1 + |y|) so that the ordering of outcomes is always kept.
+    """
+    def transform(self, outcomes):
+        if np.all(outcomes < 0):
+            return -np.log(-outcomes)
+        if np.all(outcomes > 0):
+            return np.log(outcomes)
+        return np.sign(outcomes) * np.log1p(np.abs(outcomes))
+
+
+class RankGaussian(OutcomeTransform):
+    """
+    Gaussian copula transform: replace outcomes by the normal quantiles of their ranks.
+    Robust to outliers such as a few very slow configurations; ties get the same value.
+    """
+    def transform(self, outcomes):
+        n = len(outcomes)
+        order = np.argsort(outcomes, kind='mergesort')
+        ranks = np.empty(n)
+        ranks[order] = np.arange(n)
+        # average the ranks of tied outcomes
+        _, inverse, counts = np.unique(outcomes, return_inverse=True, return_counts=True)
+        ranks = np.bincount(inverse, weights=ranks)[inverse] / counts[inverse]
+        return norm.ppf((ranks + 0.5) / n)
+
+
+class ChainedTransform(OutcomeTransform):
+    """Apply several transforms in order"""
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def transform(self, outcomes):
+        for outcome_transform in self.transforms:
+            outcomes = outcome_transform.transform(outcomes)
+        return outcomes
+
+
+TRANSFORMS_BY_NAME = {
+    'identity': Identity,
+    'standardize': Standardize,
+    'log': LogTransform,
+    'rank': RankGaussian,
+}
+
+def getOutcomeTransform(spec):
+    """
+    Get a transform from its spec: None, an OutcomeTransform instance, or a comma separated string of
+    transform names applied in order, e.g. 'log,standardize'
+    """
+    if spec is None:
+        return Identity()
+    if isinstance(spec, OutcomeTransform):
+        return spec
+    names = [name.strip() for name in spec.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TRANSFORMS_BY_NAME]
+    if unknown:
+        raise Exception(f'Unknown outcome transform(s) {unknown}, expected one of {list(TRANSFORMS_BY_NAME)}')
+    if len(names) == 1:
+        return TRANSFORMS_BY_NAME[names[0]]()
+    return ChainedTransform([TRANSFORMS_BY_NAME[name]() for name in names])
@@ -0,0 +1,97 @@
+import logging
+
+import numpy as np
+
+from paropt.storage.entities import PARAMETER_TYPE_INT
+
+from .base_optimizer import TrialRecord
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 256
+
+
+class TrialHistory():
+    """
+    Parameter values and outcomes of an experiment's trials, in arrays that grow by doubling.
+    Columns are ordered by parameter name, like the arrays of bayes_opt's TargetSpace, so views
+    can be passed to surrogate models as they are.
+
+    Configs are indexed by a tuple of their values, with integer parameters rounded the way they are
+    used in scripts, so finding a trial with the same config doesn't allocate ParameterConfigs or strings.
+    """
+    def __init__(self, parameters, experiment_id=None, capacity=INITIAL_CAPACITY):
+        parameters = sorted(parameters, key=lambda parameter: parameter.name)
+        self.names = [parameter.name for parameter in parameters]
+        self.experiment_id = experiment_id
+        self._is_int = np.array([parameter.type == PARAMETER_TYPE_INT for parameter in parameters], dtype=bool)
+
+        self._params = np.empty((capacity, len(self.names)))
+        self._outcomes = np.empty(capacity)
+        self._running_times = np.empty(capacity)
+        self._run_numbers = np.empty(capacity, dtype=int)
+        self._index = {} # config key to row of the first trial with that config
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def params(self):
+        """Parameter values, one row per trial (a view, don't modify)"""
+        return self._params[:self._n]
+
+    @property
+    def outcomes(self):
+        return self._outcomes[:self._n]
+
+    @property
+    def running_times(self):
+        """running_time objective parameter of each trial, nan when unknown"""
+        return self._running_times[:self._n]
+
+    def toArray(self, params_dict):
+        return np.fromiter((params_dict[name] for name in self.names), dtype=float, count=len(self.names))
+
+    def _key(self, values):
+        return tuple(int(round(value)) if is_int else float(value) for value, is_int in zip(values, self._is_int))
+
+    def _grow(self):
+        capacity = 2 * self._params.shape[0]
+        for attr in ('_params', '_outcomes', '_running_times', '_run_numbers'):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, attr, new)
+
+    def add(self, trial):
+        """Add a TrialRecord, returns its row. Trials with an already seen config are stored but not indexed"""
+        if self._n == self._params.shape[0]:
+            self._grow()
+        row = self._n
+        self._params[row] = self.toArray(trial.params)
+        self._outcomes[row] = trial.outcome
+        running_time = (trial.obj_parameters or {}).get('running_time')
+        self._running_times[row] = running_time if running_time is not None else np.nan
+        self._run_numbers[row] = trial.run_number if trial.run_number is not None else -1
+        key = self._key(self._params[row])
+        if key in self._index:
+            logger.warning(f'Registering already seen config {trial.params}, existing one is {self.get(self._index[key]).params}')
+        else:
+            self._index[key] = row
+        self._n += 1
+        return row
+
+    def find(self, params_dict):
+        """Row of the first trial with the same config, or None"""
+        return self._index.get(self._key(params_dict[name] for name in self.names))
+
+    def get(self, row):
+        """TrialRecord of a row"""
+        running_time = self._running_times[row]
+        return TrialRecord(
+            params=dict(zip(self.names, self._params[row].tolist())),
+            outcome=float(self._outcomes[row]),
+            run_number=int(self._run_numbers[row]),
+            experiment_id=self.experiment_id,
+            obj_parameters={} if np.isnan(running_time) else {'running_time': float(running_time)})
@@ -20,13 +20,17 @@ class RunConfig():
     (optional) script intended to be run before the main command script
   finish_script_content : str
     (optional) script intended to be run after the main command script
+  cancel_file : str
+    (optional) path the runner creates when the run is stopped; the running script should be killed once it exists
   """
   def __init__(self,
                command_script_content,
                experiment_dict,
                setup_script_content=None,
-               finish_script_content=None):
+               finish_script_content=None,
+               cancel_file=None):
     self.command_script_content = command_script_content
     self.experiment_dict = experiment_dict
     self.setup_script_content = setup_script_content
     self.finish_script_content = finish_script_content
+    self.cancel_file = cancel_file
@@ -1,5 +1,6 @@
 from .parsl_runner import ParslRunner
 from .config import parslConfigFromCompute as local_config
+from .executor_cache import ExecutorCache
 from .lib import timeCommand as timeCmd
 # from .lib import timeCommandLimitTime as timeCmdLimit
 from .lib import variantCallerAccu as variantCallerAccu
@@ -8,6 +9,7 @@ from .lib import searchMatrix as searchMatrix
 __all__ = [
   'ParslRunner',
   'local_config',
+  'ExecutorCache',
   'timeCmd',
   # 'timeCmdLimit',
   'variantCallerAccu',
@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+
+import parsl
+
+logger = logging.getLogger(__name__)
+
+# seconds a loaded DFK is kept without a run using it before its executors and blocks are shut down
+IDLE_TIMEOUT = 600
+
+
+class ExecutorCache():
+    """Keeps parsl loaded between runs on the same compute, so they reuse warm executors and blocks
+
+    Loading a parsl config for EC2 launches an instance and installs paropt on it, which takes minutes. Runs given
+    the cache acquire the loaded DataFlowKernel instead: it's reused when the compute (by its asdict()) is the same
+    as the previous run's, and replaced otherwise. Once released, the DFK is shut down after idle_timeout seconds
+    unless another run acquires it.
+
+    Parsl only has one loaded DFK per process, so the cache holds one, used by one run at a time. It must live
+    in a process that outlives its runs, e.g. an rq SimpleWorker; a process exiting with a loaded DFK leaves its
+    blocks running, so call close() before exiting. Executors keep the run_dir of the run that loaded them.
+    """
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._key = None
+        self._dfk = None
+        self._in_use = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def computeKey(compute):
+        return json.dumps(compute.asdict(), sort_keys=True)
+
+    def acquire(self, compute, parsl_config):
+        """Returns a loaded DFK for the compute, reusing the cached one when it was loaded for the same compute"""
+        key = self.computeKey(compute)
+        with self._lock:
+            if self._in_use:
+                raise Exception('ExecutorCache is already in use by another run')
+            self._cancelTimer()
+            if self._dfk is not None and key != self._key:
+                logger.info(f'Compute changed, shutting down executors for {self._key}')
+                self._shutdown()
+            if self._dfk is None:
+                logger.info(f'Loading parsl for {key}')
+                self._dfk = parsl.load(parsl_config)
+                self._key = key
+            else:
+                logger.info(f'Reusing loaded parsl for {key}')
+            self._in_use = True
+            return self._dfk
+
+    def release(self, reusable=True):
+        """Give back the DFK at the end of a run. Pass reusable=False when its executors may still be busy
+        (e.g. a trial was cancelled) to shut them down right away"""
+        with self._lock:
+            self._in_use = False
+            if not reusable:
+                self._shutdown()
+                return
+            self._timer = threading.Timer(self.idle_timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def close(self):
+        """Shut down the cached DFK"""
+        with self._lock:
+            self._cancelTimer()
+            self._shutdown()
+
+    def _expire(self):
+        with self._lock:
+            if self._in_use or self._timer is None:
+                return
+            logger.info(f'Executors idle for {self.idle_timeout}s, shutting down')
+            self._timer = None
+            self._shutdown()
+
+    def _cancelTimer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _shutdown(self):
+        if self._dfk is None:
+            return
+        try:
+            self._dfk.cleanup()
+        finally:
+            self._dfk = None
+            self._key = None
+            parsl.clear()
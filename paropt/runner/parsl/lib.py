@@ -1,5 +1,59 @@
+import os
+import signal
+import subprocess
+import time
+
 from parsl.app.app import python_app
 
+# result of a script killed because its run was stopped
+CANCELLED_STDOUT = 'Cancelled'
+
+
+class ScriptCancelled(Exception):
+    pass
+
+
+def waitScript(proc, timeout=None, cancel_file=None, poll_interval=1.0):
+    """Wait for a script started with start_new_session=True, returning its output. Kills the script's whole
+    process group when it times out or when cancel_file exists, so commands it started don't outlive it.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        the script ran longer than timeout seconds
+    ScriptCancelled
+        cancel_file was created while the script was running
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            # communicate keeps reading output, so a script writing a lot doesn't block on a full pipe
+            outs, _ = proc.communicate(timeout=poll_interval)
+            return outs
+        except subprocess.TimeoutExpired:
+            pass
+        if cancel_file is not None and os.path.exists(cancel_file):
+            killScript(proc)
+            raise ScriptCancelled(f'Cancelled by {cancel_file}')
+        if deadline is not None and time.monotonic() >= deadline:
+            killScript(proc)
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+
+
+def killScript(proc, grace_period=5):
+    """Terminate the process group of a script, killing it if it's still running after grace_period seconds"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            proc.communicate(timeout=grace_period)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+
 @python_app
 def timeCommand(runConfig, **kwargs):
     """Time the main command script. Exits early on failure at any step (setup, main, finish)
@@ -21,10 +75,14 @@ def timeCommand(runConfig, **kwargs):
     import time
     import sys
 
+    from paropt.runner.parsl.lib import waitScript, ScriptCancelled, CANCELLED_STDOUT
+
     if 'timeout' in kwargs:
         timeout = kwargs['timeout']
     else:
         timeout = sys.maxsize
+    # created by the runner to kill the running script when the run is stopped
+    cancel_file = getattr(runConfig, 'cancel_file', None)
     def timeScript(script_name, script_content):
         """Helper for writing and running a script"""
         script_path = '{}_{}'.format(script_name, time.time())
@@ -35,9 +93,8 @@ def timeCommand(runConfig, **kwargs):
         obj_parameters = {'running_time': timeout}
         try:
             start_time = time.time()
-            proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            timeout_returncode = proc.wait(timeout=timeout)
-            outs, errs = proc.communicate()
+            proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+            outs = waitScript(proc, timeout=timeout, cancel_file=cancel_file)
             total_time = time.time() - start_time
             obj_parameters = {'running_time': total_time}
 
@@ -62,7 +119,8 @@ def timeCommand(runConfig, **kwargs):
         #     return res
 
         # make neg b/c our optimizer is maximizing
-        # divide by number of seconds in day to scale down for bayes opt
+        # divide by number of seconds in day - kept so outcomes stay comparable with previously stored trials,
+        # the optimizers normalize outcomes themselves and count budgets with obj_parameters['running_time']
         res['obj_output'] = -float(res['obj_output']) / 86400
         main_res = res
         if main_res['returncode'] != 0:
@@ -80,6 +138,9 @@ def timeCommand(runConfig, **kwargs):
         
         # return the timing result
         return main_res
+    except ScriptCancelled:
+        # the run was stopped while one of the scripts was running, which isn't a failure of the script
+        return {'returncode': -1, 'stdout': CANCELLED_STDOUT, 'obj_output': 0, 'obj_parameters': {}}
     except Exception as e:
         # this should not be reached - Indicates a bug in code
         return {'returncode': -1,
@@ -107,14 +168,19 @@ def searchMatrix(runConfig):
     import subprocess
     import time
 
+    from paropt.runner.parsl.lib import waitScript, ScriptCancelled, CANCELLED_STDOUT
+
+    # created by the runner to kill the running script when the run is stopped
+    cancel_file = getattr(runConfig, 'cancel_file', None)
+
     def runScript(script_name, script_content):
         """Helper for writing and running a script"""
         script_path = '{}_{}'.format(script_name, time.time())
         with open(script_path, 'w') as f:
             f.write(script_content)
         # start_time = time.time()
-        proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        outs, errs = proc.communicate()
+        proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        outs = waitScript(proc, cancel_file=cancel_file)
         # total_time = time.time() - start_time
         res = float(outs.decode('utf-8'))
         obj_parameters = {'running_time': res}
@@ -151,6 +217,9 @@ def searchMatrix(runConfig):
         
         # return the timing result
         return main_res
+    except ScriptCancelled:
+        # the run was stopped while one of the scripts was running, which isn't a failure of the script
+        return {'returncode': -1, 'stdout': CANCELLED_STDOUT, 'obj_output': 0, 'obj_parameters': {}}
     except Exception as e:
         # this should not be reached - Indicates a bug in code
         return {'returncode': -1,
@@ -180,10 +249,14 @@ def variantCallerAccu(runConfig, **kwargs):
     import sys
     import math
 
+    from paropt.runner.parsl.lib import waitScript, ScriptCancelled, CANCELLED_STDOUT
+
     if 'timeout' in kwargs and kwargs['timeout'] != 0:
         timeout = kwargs['timeout']
     else:
         timeout = sys.maxsize
+    # created by the runner to kill the running script when the run is stopped
+    cancel_file = getattr(runConfig, 'cancel_file', None)
 
     def sigmoid(x):
         return 1/(1+math.exp(-x))
@@ -211,9 +284,8 @@ def variantCallerAccu(runConfig, **kwargs):
         ret_dic = {'returncode': None, 'stdout': None, 'obj_output': None, 'obj_parameters': None}
         try:
             start_time = time.time()
-            proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            timeout_returncode = proc.wait(timeout=timeout)
-            outs, errs = proc.communicate()
+            proc = subprocess.Popen(['bash', script_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+            outs = waitScript(proc, timeout=timeout, cancel_file=cancel_file)
             total_time = time.time() - start_time
             
             ret_dic['returncode'] = proc.returncode
@@ -244,6 +316,8 @@ def variantCallerAccu(runConfig, **kwargs):
             ret_dic['returncode'] = timeout_returncode
             return ret_dic
             # return {'returncode': timeout_returncode, 'stdout': f'Timeout', 'obj_output': timeout_output, 'obj_parameters': obj_parameters} # run time = -1 means timeout
+        except ScriptCancelled:
+            raise
         except:
             return ret_dic
             # return {'returncode': proc.returncode, 'stdout': outs.decode('utf-8'), 'obj_output': total_time, 'obj_parameters': obj_parameters}
@@ -281,6 +355,9 @@ def variantCallerAccu(runConfig, **kwargs):
         
         # return the timing result
         return main_res
+    except ScriptCancelled:
+        # the run was stopped while one of the scripts was running, which isn't a failure of the script
+        return {'returncode': -1, 'stdout': CANCELLED_STDOUT, 'obj_output': 0, 'obj_parameters': {}}
     except Exception as e:
         # this should not be reached - Indicates a bug in code
         return {'returncode': -1,
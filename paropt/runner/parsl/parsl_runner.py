@@ -1,3 +1,4 @@
+import concurrent.futures
 import logging
 import os
 import time
@@ -7,13 +8,24 @@ from string import Template
 import parsl
 
 from paropt import setFileLogger
-from paropt.storage import LocalFile
-from paropt.storage.entities import Trial, ParameterConfig
+from paropt.analysis import parameterImportance, getIncumbentValues
+from paropt.storage import SQLiteDB
+from paropt.stopping import StopDecision
+from paropt.storage.entities import Trial, ParameterConfig, FAILED_TRIAL_OUTCOME
 import paropt.runner
 from paropt.runner.parsl.config import parslConfigFromCompute
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait for a cancelled trial's script to be killed before giving up on its future
+CANCEL_GRACE_PERIOD = 10
+
+
+class RunStopped(Exception):
+    """Raised while waiting for a trial when the run's stop_check asks it to stop"""
+    pass
+
+
 class ParslRunner:
     def __init__(self,
                 obj_func,
@@ -21,19 +33,60 @@ class ParslRunner:
                 obj_func_params=None, 
                 storage=None,
                 experiment=None,
-                logs_root_dir='.'):
+                logs_root_dir='.',
+                stopping_policy=None,
+                prune_after=None,
+                prune_threshold=0.05,
+                stop_check=None,
+                poll_interval=1.0,
+                progress_callback=None,
+                executor_cache=None):
 
         self.obj_func = obj_func
         self.obj_func_params = obj_func_params
         self._dfk = None
         self.optimizer = optimizer
-        self.storage = storage if storage != None else LocalFile()
-        self.session = storage.Session()
+        # checked after every trial in addition to the optimizer's own stopping policy, e.g. a wall clock budget
+        self.stopping_policy = stopping_policy
+        self.stop_decision = None
+        # after prune_after trials in this run, freeze parameters with importance below prune_threshold
+        # at their best value so the optimizer only searches the ones that matter
+        self.prune_after = prune_after
+        self.prune_threshold = prune_threshold
+        self.n_completed = 0
+        self.pruned_parameters = {}
+        # called between trials and every poll_interval seconds while waiting for one, returns a reason
+        # (e.g. 'Stopped by user') when the run should stop. The running trial's script is then killed
+        # and completed trials are kept
+        self.stop_check = stop_check
+        self.poll_interval = poll_interval
+        # called with the run's progress (see getProgress) after every trial, e.g. to publish it to clients
+        self.progress_callback = progress_callback
+        # ExecutorCache to reuse parsl executors loaded by previous runs on the same compute; cleanup() then
+        # gives them back to the cache instead of shutting them down
+        self.executor_cache = executor_cache
+        self._trial_cancelled = False
+        self.n_trials = 0
+        self.n_failed = 0
+        self.best_outcome = None
+        self.best_parameters = None
+        self.start_time = None
+        if not os.path.exists(logs_root_dir):
+            raise Exception(f'Logs directory does not exist: {logs_root_dir}')
+        # without storage, keep results in an embedded database next to the logs
+        self.storage = storage if storage != None else SQLiteDB(f'{logs_root_dir}/paropt.db')
+        self.session = self.storage.Session()
 
         # get or create the experiment
-        self.experiment, last_run_number, _ = storage.getOrCreateExperiment(self.session, experiment)
+        self.experiment, last_run_number, _ = self.storage.getOrCreateExperiment(self.session, experiment)
         self.run_number = last_run_number + 1
         self.optimizer.setExperiment(self.experiment)
+        # optimizers keep compact copies of previous trials, don't keep the ORM objects loaded for the whole run
+        self.session.expire(self.experiment, ['trials'])
+        if getattr(self.optimizer, 'warm_start', False):
+            self.optimizer.setRelatedTrials(self.storage.getRelatedTrials(self.session, self.experiment))
+        # end the setup's transaction rather than keeping it open until the first trial is saved
+        self.session.commit()
         self.command = experiment.command_template_string
 
         # setup compute
@@ -42,8 +95,6 @@ class ParslRunner:
 
         # setup paropt info directories
         self.paropt_dir = f'{logs_root_dir}/optinfo'
-        if not os.path.exists(logs_root_dir):
-            raise Exception(f'Logs directory does not exist: {logs_root_dir}')
         os.makedirs(self.paropt_dir, exist_ok=True)
         
         # setup directory and files for this run
@@ -55,10 +106,16 @@ class ParslRunner:
         # set parsl's logging directory
         self.parsl_config.run_dir = f'{self.exp_run_dir}/parsl'
         os.makedirs(self.templated_scripts_dir, exist_ok=True)
+        # created to kill the running trial's script when the run is stopped, see paropt.runner.parsl.lib
+        self.cancel_file = f'{self.exp_run_dir}/cancel'
+        if os.path.exists(self.cancel_file):
+            os.remove(self.cancel_file)
 
         self.run_result = {
             'success': True,
-            'message': {}
+            'message': {},
+            'stop': None,
+            'pruned_parameters': {}
         }
     
     def __repr__(self):
@@ -77,6 +134,149 @@ class ParslRunner:
         if res['stdout'] == 'Timeout':
             raise Exception(f"Timeout:\n\tParameterConfigs: {params}\n\tOutput: {res['stdout']}")
 
+    def _updateStoppingPolicy(self, trial):
+        """Update the runner's stopping policy with a trial, returns True if the run should stop"""
+        if self.stopping_policy is None:
+            return False
+        decision = self.stopping_policy.update(trial, self.optimizer)
+        if decision is not None:
+            logger.info(f'Stopping: {decision}')
+            self.stop_decision = decision
+            return True
+        return False
+
+    def _recordStopDecision(self):
+        """Record why the run ended in run_result"""
+        decision = self.stop_decision or getattr(self.optimizer, 'stop_decision', None)
+        if decision is not None:
+            self.run_result['stop'] = decision.asdict()
+        else:
+            self.run_result['stop'] = {'policy': None, 'reason': 'Optimizer finished suggesting configurations'}
+
+    def _checkStop(self):
+        """Returns True if stop_check asks the run to stop, recording why"""
+        if self.stop_check is None or self.stop_decision is not None:
+            return self.stop_decision is not None
+        reason = self.stop_check()
+        if not reason:
+            return False
+        logger.info(f'Stopping: {reason}')
+        self.stop_decision = StopDecision('stop_requested', str(reason), self.n_completed)
+        return True
+
+    def _waitResult(self, future):
+        """Wait for a trial's result, cancelling the trial if the run is stopped meanwhile"""
+        while True:
+            try:
+                return future.result(timeout=self.poll_interval)
+            except concurrent.futures.TimeoutError:
+                pass
+            if self._checkStop():
+                self._cancelTrial(future)
+                raise RunStopped(self.stop_decision.reason)
+
+    def _cancelTrial(self, future):
+        """Kill the script of a running trial. Scripts on remote executors are killed with their blocks by cleanup()"""
+        self._trial_cancelled = True
+        with open(self.cancel_file, 'w') as f:
+            f.write(self.stop_decision.reason)
+        try:
+            future.cancel()
+        except NotImplementedError:
+            # parsl apps can't be cancelled once submitted
+            pass
+        try:
+            future.result(timeout=CANCEL_GRACE_PERIOD)
+        except Exception:
+            logger.warning(f'Trial still running {CANCEL_GRACE_PERIOD}s after cancelling it')
+
+    def _expectedTrials(self):
+        """Number of trials the optimizer will suggest in this run if it isn't stopped early, None if unknown"""
+        n_iter = getattr(self.optimizer, 'n_iter', None)
+        if n_iter is None:
+            return None
+        return getattr(self.optimizer, 'n_init', 0) + n_iter
+
+    def getProgress(self):
+        """Trials done and failed so far in this run, the best outcome and its parameters, and the estimated
+        seconds remaining (None when the number of trials to run isn't known)"""
+        elapsed = time.time() - self.start_time if self.start_time is not None else 0
+        expected = self._expectedTrials()
+        eta = None
+        if expected is not None and self.n_trials > 0:
+            eta = elapsed / self.n_trials * max(expected - self.n_trials, 0)
+        return {
+            'experiment_id': self.experiment.id,
+            'run_number': self.run_number,
+            'n_trials': self.n_trials,
+            'n_failed': self.n_failed,
+            'expected_trials': expected,
+            'best_outcome': self.best_outcome,
+            'best_parameters': self.best_parameters,
+            'elapsed': elapsed,
+            'eta': eta,
+        }
+
+    def _reportProgress(self, trial):
+        """Update the run's progress with a saved trial and pass it to progress_callback"""
+        self.n_trials += 1
+        if trial.outcome == FAILED_TRIAL_OUTCOME:
+            self.n_failed += 1
+        elif self.best_outcome is None or trial.outcome > self.best_outcome:
+            self.best_outcome = trial.outcome
+            self.best_parameters = ParameterConfig.configsToDict(trial.parameter_configs)
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(self.getProgress())
+        except Exception:
+            # progress is informational, it must not fail the run
+            logger.exception('Failed to report progress')
+
+    def _getTrialRows(self):
+        """All trials of the experiment in storage, as dicts in the format of Trial.asdict()"""
+        self._flushStorage()
+        if hasattr(self.storage, 'iterTrialRows'):
+            # one flat query, without loading ORM objects
+            return list(self.storage.iterTrialRows(self.session, self.experiment.id))
+        return [trial.asdict() for trial in self.storage.getTrials(self.session, self.experiment.id)]
+
+    def getParameterImportance(self, trials=None):
+        """Importance of each parameter of the experiment, computed from all of its trials in storage"""
+        if trials is None:
+            trials = self._getTrialRows()
+        return parameterImportance(trials, self.experiment.parameters)
+
+    def _pruneParameters(self):
+        """Once prune_after trials have completed, freeze unimportant parameters in the optimizer"""
+        self.n_completed += 1
+        if self.prune_after is None or self.n_completed != self.prune_after:
+            return
+        trials = self._getTrialRows()
+        importance = self.getParameterImportance(trials)
+        if not importance:
+            return
+        logger.info(f'Parameter importance: {importance}')
+        unimportant = [name for name, value in importance.items() if value < self.prune_threshold]
+        # keep searching at least one parameter
+        if not unimportant or len(unimportant) == len(importance):
+            return
+        incumbent = getIncumbentValues(trials, self.experiment.parameters)
+        self.pruned_parameters = {name: incumbent[name] for name in unimportant}
+        self.optimizer.freezeParameters(self.pruned_parameters)
+        self.run_result['pruned_parameters'] = self.pruned_parameters
+
+    def _flushStorage(self):
+        """Make sure trials saved by write-behind storage are in the database"""
+        if hasattr(self.storage, 'flush'):
+            self.storage.flush()
+
+    def _releaseTrial(self, trial):
+        """Remove a saved trial from the run's session, which would otherwise hold every trial of a long run"""
+        for obj in [trial] + list(trial.parameter_configs):
+            if obj in self.session:
+                self.session.expunge(obj)
+
     def _writeScript(self, template, parameter_configs, file_prefix):
         """
         Format the template with provided parameter configurations and save locally for reference
@@ -93,7 +293,15 @@ class ParslRunner:
         """
         if debug:
             parsl.set_stream_logger()
-        self._dfk = parsl.load(self.parsl_config)
+        if self.executor_cache is not None:
+            self._dfk = self.executor_cache.acquire(self.compute, self.parsl_config)
+        else:
+            self._dfk = parsl.load(self.parsl_config)
+        self.start_time = time.time()
+        # budgets count from here, not from when the policies were created (e.g. before the job was queued)
+        for policy in (self.stopping_policy, getattr(self.optimizer, 'stopping_policy', None)):
+            if policy is not None:
+                policy.start()
 
         logger.info(f'Starting ParslRunner with config\n{self}')
 
@@ -101,6 +309,10 @@ class ParslRunner:
         initialize_flag = True
         result = None
         for idx, parameter_configs in enumerate(self.optimizer):
+            if self._checkStop():
+                break
+            completed = False
+            saved_trial = None
             try:
                 logger.info(f'Writing script with configs {parameter_configs}')
                 command_script_path, command_script_content = self._writeScript(self.command, parameter_configs, 'command')
@@ -121,13 +333,14 @@ class ParslRunner:
                         experiment_dict=self.experiment.asdict(),
                         setup_script_content=setup_script_content,
                         finish_script_content=finish_script_content,
+                        cancel_file=self.cancel_file,
                     )
                     initializing_func_param = {}
                     for key, val in self.obj_func_params.items():
                         initializing_func_param[key] = val
                     initializing_func_param['timeout'] = 300
                     # result = self.obj_func(runConfig, **self.obj_func_params).result()
-                    result = self.obj_func(runConfig, **initializing_func_param).result()
+                    result = self._waitResult(self.obj_func(runConfig, **initializing_func_param))
 
 
                 logger.info(f'Starting trial with script at {command_script_path}')
@@ -136,9 +349,10 @@ class ParslRunner:
                     experiment_dict=self.experiment.asdict(),
                     setup_script_content=setup_script_content,
                     finish_script_content=finish_script_content,
+                    cancel_file=self.cancel_file,
                 )
                 result = None
-                result = self.obj_func(runConfig, **self.obj_func_params).result()
+                result = self._waitResult(self.obj_func(runConfig, **self.obj_func_params))
                 self._validateResult(parameter_configs, result)
                 trial = Trial(
                     outcome=result['obj_output'],
@@ -148,11 +362,18 @@ class ParslRunner:
                     obj_parameters=result['obj_parameters'],
                 )
                 self.storage.saveResult(self.session, trial)
-                self.optimizer.register(trial)
+                saved_trial = trial
+                self._releaseTrial(trial)
+                self._reportProgress(trial)
                 self.run_result['success'] = True and self.run_result['success']
                 flag = flag and self.run_result['success']
                 self.run_result['message'][f'experiment {self.experiment.id} run {self.run_number}, config is {parameter_configs}'] = (f'Successfully completed trials {idx} for experiment')
+                completed = True
 
+            except RunStopped:
+                # the cancelled trial is incomplete, it isn't saved
+                logger.info(f'Cancelled trial with configs {parameter_configs}')
+                break
             except Exception as e:
                 err_traceback = traceback.format_exc()
                 if result is not None and result['stdout'] == 'Timeout': # for timeCommandLimitTime in lib, timeout
@@ -163,30 +384,58 @@ class ParslRunner:
                         experiment_id=self.experiment.id,
                         obj_parameters=result['obj_parameters'],
                     )
-                    self.optimizer.register(trial)
                     logger.exception(f'time out')
                     self.storage.saveResult(self.session, trial)
+                    saved_trial = trial
+                    self._releaseTrial(trial)
+                    self._reportProgress(trial)
                     self.run_result['success'] = False
                     self.run_result['message'][f'experiment {self.experiment.id} run {self.run_number}, config is {parameter_configs}'] = (f'Failed to complete trials {idx}:\nError: {e}\n{err_traceback}')
 
                 else:
                     trial = Trial(
-                        outcome=10000000,
+                        outcome=FAILED_TRIAL_OUTCOME,
                         parameter_configs=parameter_configs,
                         run_number=self.run_number,
                         experiment_id=self.experiment.id,
                         obj_parameters={},
                     )
                     self.storage.saveResult(self.session, trial)
+                    self._releaseTrial(trial)
+                    self._reportProgress(trial)
                     self.run_result['success'] = False
                     self.run_result['message'][f'experiment {self.experiment.id} run {self.run_number}, config is {parameter_configs}'] = (f'Failed to complete trials {idx}:\nError: {e}\n{err_traceback}')
-        
+
+            # outside the trial's try: the trial is already saved, and must not be saved again as failed. Errors
+            # of the optimizer or of stopping policies (e.g. fitting a model) end the run instead
+            if saved_trial is not None:
+                self.optimizer.register(saved_trial)
+            if completed:
+                try:
+                    self._pruneParameters()
+                except Exception:
+                    logger.exception('Failed to prune parameters, continuing to search all of them')
+            if saved_trial is not None and self._updateStoppingPolicy(saved_trial):
+                break
+
+        # trials may still be queued by write-behind storage, the run isn't done until they're written
+        self._flushStorage()
+        self._recordStopDecision()
         logger.info(f'Finished; Run result: {self.run_result}')
     
     def cleanup(self):
-        """Cleanup DFK and parsl"""
+        """Cleanup DFK and parsl, shutting down executors and the blocks they launched (or releasing them to the executor cache)"""
+        if self._dfk is None:
+            return
+        if self.executor_cache is not None:
+            # a cancelled trial's script may still be running on the executors, don't hand them to the next run
+            logger.info('Releasing parsl DFK to the executor cache')
+            self.executor_cache.release(reusable=not self._trial_cancelled)
+            self._dfk = None
+            return
         logger.info('Cleaning up parsl DFK')
         self._dfk.cleanup()
+        self._dfk = None
         parsl.clear()
     
     def getMax(self):
@@ -0,0 +1,18 @@
+from .policies import (StopDecision, StoppingPolicy, RuntimeBudget, WallClockBudget, DollarBudget,
+  NoImprovement, Convergence, ExpectedImprovementThreshold, TargetReached, AnyOf,
+  buildStoppingPolicy, stoppingPolicyFromConfig)
+
+__all__ = [
+  'StopDecision',
+  'StoppingPolicy',
+  'RuntimeBudget',
+  'WallClockBudget',
+  'DollarBudget',
+  'NoImprovement',
+  'Convergence',
+  'ExpectedImprovementThreshold',
+  'TargetReached',
+  'AnyOf',
+  'buildStoppingPolicy',
+  'stoppingPolicyFromConfig',
+]
@@ -0,0 +1,289 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _runningTime(trial):
+    if not trial.obj_parameters:
+        return 0
+    return trial.obj_parameters.get('running_time', 0)
+
+
+class StopDecision():
+    """Why and when a stopping policy decided to stop"""
+    def __init__(self, policy, reason, n_trials):
+        self.policy = policy
+        self.reason = reason
+        self.n_trials = n_trials
+
+    def __repr__(self):
+        return f'StopDecision(policy={self.policy}, reason={self.reason}, n_trials={self.n_trials})'
+
+    def asdict(self):
+        return {
+            'policy': self.policy,
+            'reason': self.reason,
+            'n_trials': self.n_trials,
+        }
+
+
+class StoppingPolicy():
+    """
+    Decides when to stop running trials.
+    update() is called with every new trial (and the optimizer that suggested it) and returns a
+    StopDecision to stop, or None to continue. observe() is called with trials that should not count
+    towards the policy, e.g. trials loaded from previous runs, so the policy knows the best outcome so far.
+    start() is called when the run starts, before its first trial.
+    """
+    def __init__(self):
+        self.n_trials = 0
+
+    def start(self):
+        pass
+
+    def update(self, trial, optimizer=None):
+        self.n_trials += 1
+        reason = self._check(trial, optimizer)
+        if reason is None:
+            return None
+        return StopDecision(type(self).__name__, reason, self.n_trials)
+
+    def observe(self, trial):
+        pass
+
+    def _check(self, trial, optimizer):
+        raise NotImplementedError
+
+
+class RuntimeBudget(StoppingPolicy):
+    """Stop once the summed running time of trials reaches the budget (seconds)"""
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+        self.spent = 0
+
+    @property
+    def remaining(self):
+        return self.seconds - self.spent
+
+    def _check(self, trial, optimizer):
+        self.spent += _runningTime(trial)
+        if self.spent >= self.seconds:
+            return f'Spent {self.spent:.1f}s of trial running time, budget is {self.seconds}s'
+        return None
+
+
+class WallClockBudget(StoppingPolicy):
+    """
+    Stop once the given number of seconds passed since the run started. Policies are created before the
+    run (e.g. when the job is queued), so the clock starts with start(), or on first use if it isn't called.
+    """
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+
+    def _elapsed(self):
+        if self.start_time is None:
+            self.start()
+        return time.time() - self.start_time
+
+    @property
+    def remaining(self):
+        return self.seconds - self._elapsed()
+
+    def _check(self, trial, optimizer):
+        elapsed = self._elapsed()
+        if elapsed >= self.seconds:
+            return f'{elapsed:.1f}s elapsed, wall clock budget is {self.seconds}s'
+        return None
+
+
+class DollarBudget(StoppingPolicy):
+    """Stop once the cost of trials, running time times the hourly price of the compute, reaches the budget"""
+    def __init__(self, dollars, cost_per_hour):
+        super().__init__()
+        self.dollars = dollars
+        self.cost_per_hour = cost_per_hour
+        self.spent = 0
+
+    @property
+    def remaining(self):
+        return (self.dollars - self.spent) / self.cost_per_hour * 3600
+
+    def _check(self, trial, optimizer):
+        self.spent += _runningTime(trial) / 3600 * self.cost_per_hour
+        if self.spent >= self.dollars:
+            return f'Spent ${self.spent:.2f}, budget is ${self.dollars}'
+        return None
+
+
+class NoImprovement(StoppingPolicy):
+    """
+    Stop after `patience` consecutive trials that did not improve the best outcome by more than
+    min_improvement, relative to the magnitude of the best outcome (so it works for negative outcomes)
+    """
+    def __init__(self, patience, min_improvement=0.0):
+        super().__init__()
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.best = None
+        self.steps_without_improvement = 0
+
+    def observe(self, trial):
+        if self.best is None or trial.outcome > self.best:
+            self.best = trial.outcome
+
+    def _check(self, trial, optimizer):
+        if self.best is None or trial.outcome - self.best > self.min_improvement * abs(self.best):
+            self.steps_without_improvement = 0
+        else:
+            self.steps_without_improvement += 1
+        self.observe(trial)
+        if self.steps_without_improvement >= self.patience:
+            return f'No improvement over {self.best} in the last {self.steps_without_improvement} trials'
+        return None
+
+
+class Convergence(StoppingPolicy):
+    """
+    Stop after `steps` consecutive trials landing close to the best outcome, i.e. within a relative distance
+    of (1 - threshold) from it. This is the optimizers' converge_thres/converge_steps criterion: for positive
+    outcomes it matches the previous ratio check outcome / best > threshold, and it also holds for negative ones.
+    """
+    def __init__(self, threshold, steps):
+        super().__init__()
+        self.threshold = threshold
+        self.steps = steps
+        self.best = None
+        self.steps_count = 0
+
+    def observe(self, trial):
+        if self.best is None or trial.outcome > self.best:
+            self.best = trial.outcome
+
+    def _check(self, trial, optimizer):
+        if self.best is not None:
+            distance = (self.best - trial.outcome) / max(abs(self.best), 1e-12)
+            if distance < 1 - self.threshold:
+                self.steps_count += 1
+            else:
+                self.steps_count = 0
+        self.observe(trial)
+        if self.steps_count >= self.steps:
+            return f'{self.steps_count} consecutive trials within {1 - self.threshold:.2%} of the best outcome {self.best}'
+        return None
+
+
+class ExpectedImprovementThreshold(StoppingPolicy):
+    """
+    Stop once the surrogate model expects less than `threshold` improvement from any further trial.
+    The expected improvement is in units of the model's transformed outcomes (standard deviations with
+    the default standardize transform). Ignored for optimizers without a surrogate model.
+    """
+    def __init__(self, threshold, min_trials=1):
+        super().__init__()
+        self.threshold = threshold
+        self.min_trials = min_trials
+
+    def _check(self, trial, optimizer):
+        expected_improvement = getattr(optimizer, 'expectedImprovement', None)
+        if self.n_trials < self.min_trials or expected_improvement is None:
+            return None
+        improvement = expected_improvement()
+        if improvement is not None and improvement < self.threshold:
+            return f'Expected improvement {improvement:.3g} is below {self.threshold}'
+        return None
+
+
+class TargetReached(StoppingPolicy):
+    """Stop once a trial reaches the target outcome"""
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+
+    def _check(self, trial, optimizer):
+        if trial.outcome >= self.target:
+            return f'Outcome {trial.outcome} reached target {self.target}'
+        return None
+
+
+class AnyOf(StoppingPolicy):
+    """Combine policies - stops as soon as one of them decides to stop"""
+    def __init__(self, policies):
+        super().__init__()
+        self.policies = list(policies)
+
+    def update(self, trial, optimizer=None):
+        self.n_trials += 1
+        decision = None
+        # update every policy so that all of them keep track of the trials
+        for policy in self.policies:
+            policy_decision = policy.update(trial, optimizer)
+            if decision is None:
+                decision = policy_decision
+        return decision
+
+    def observe(self, trial):
+        for policy in self.policies:
+            policy.observe(trial)
+
+    def start(self):
+        for policy in self.policies:
+            policy.start()
+
+    @property
+    def remaining(self):
+        """Smallest remaining budget (seconds) of the budget policies, None if there are none"""
+        remaining = [policy.remaining for policy in self.policies if hasattr(policy, 'remaining')]
+        return min(remaining) if remaining else None
+
+
+def buildStoppingPolicy(stopping_policy=None, budget=None, converge_thres=None, converge_steps=None):
+    """
+    Combine a stopping policy with the optimizers' budget (seconds of running time) and
+    converge_thres/converge_steps arguments. Returns None if there is nothing to check.
+    """
+    policies = []
+    if stopping_policy is not None:
+        policies.append(stopping_policy)
+    if budget is not None:
+        policies.append(RuntimeBudget(budget))
+    if converge_thres is not None and converge_steps is not None:
+        policies.append(Convergence(converge_thres, converge_steps))
+    if not policies:
+        return None
+    if len(policies) == 1 and isinstance(policies[0], AnyOf):
+        return policies[0]
+    return AnyOf(policies)
+
+
+def stoppingPolicyFromConfig(config):
+    """
+    Build a stopping policy from a config dict, e.g.
+    {'wall_clock': 3600, 'dollars': 10, 'cost_per_hour': 0.085, 'patience': 5, 'min_improvement': 0.01,
+     'min_expected_improvement': 0.01, 'target': -0.001}
+    Returns None if the config is empty.
+    """
+    if not config:
+        return None
+    policies = []
+    if config.get('wall_clock') is not None:
+        policies.append(WallClockBudget(float(config['wall_clock'])))
+    if config.get('dollars') is not None:
+        if config.get('cost_per_hour') is None:
+            raise Exception('Stopping config with "dollars" also requires "cost_per_hour"')
+        policies.append(DollarBudget(float(config['dollars']), float(config['cost_per_hour'])))
+    if config.get('patience') is not None:
+        policies.append(NoImprovement(int(config['patience']), float(config.get('min_improvement', 0.0))))
+    if config.get('min_expected_improvement') is not None:
+        policies.append(ExpectedImprovementThreshold(float(config['min_expected_improvement'])))
+    if config.get('target') is not None:
+        policies.append(TargetReached(float(config['target'])))
+    if not policies:
+        return None
+    return AnyOf(policies)
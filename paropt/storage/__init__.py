@@ -1,7 +1,9 @@
 from .local_file import LocalFile
 from .relational_db import RelationalDB
+from .sqlite_db import SQLiteDB
 
 __all__ = [
   'LocalFile',
-  'RelationalDB'
+  'RelationalDB',
+  'SQLiteDB'
 ]
\ No newline at end of file
@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+
+from .entities import Trial, ParameterConfig
+from .summaries import summaryValues, updateSummaries
+from .transactions import beginWrite
+
+logger = logging.getLogger(__name__)
+
+# sentinel telling the writer thread to write what's pending and exit
+_STOP = object()
+
+class BatchWriter():
+  """Write-behind writer for trials, used by RelationalDB when created with write_behind=True
+
+  Trials are converted to plain rows when added, so callers can keep using (or drop) the Trial objects,
+  and written by a background thread with its own session: one multi-row insert for the trials and one
+  for their parameter configs, committed once per batch together with the updated summaries. A batch is written when batch_size trials are
+  pending, when flush_interval seconds have passed since the last write, or when flush()/close() is called.
+
+  A batch that fails to write is kept and retried with the next one, waiting retry_backoff seconds after
+  the first failure and twice as long after each next one (flush() and close() retry right away). While it
+  fails, the error is raised by flush() and close(), so a run can't end without its trials being persisted
+  or an error surfacing. After max_retries failed retries the pending trials are dropped, and an error
+  saying so is raised by the next call to add(), flush() or close().
+  """
+  def __init__(self, Session, batch_size=100, flush_interval=1.0, max_retries=5, retry_backoff=1.0):
+    self.Session = Session
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.max_retries = max_retries
+    self.retry_backoff = retry_backoff
+
+    self._queue = queue.Queue()
+    self._pending = []
+    self._error = None # error of the last write, while it failed
+    self._dropped_error = None # set when pending trials are dropped, until raised
+    self._n_failures = 0 # consecutive failed writes of the pending trials
+    self._retry_time = 0 # monotonic time before which the writer thread doesn't retry a failed write
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name='paropt-batch-writer', daemon=True)
+    self._thread.start()
+
+  def add(self, trial):
+    """Queue a trial to be written, never blocks on the database"""
+    if self._closed:
+      raise Exception('Cannot add trial to closed BatchWriter')
+    if self._dropped_error is not None:
+      error, self._dropped_error = self._dropped_error, None
+      raise error
+    self._queue.put(self._trialToRows(trial))
+
+  def flush(self, timeout=None):
+    """Block until every trial added so far is committed, raising the last write error if there was one"""
+    if self._closed:
+      self._raiseError()
+      return
+    done = threading.Event()
+    self._queue.put(done)
+    if not done.wait(timeout):
+      raise Exception(f'Timed out after {timeout}s waiting for trials to be written')
+    self._raiseError()
+
+  def close(self, timeout=None):
+    """Write remaining trials and stop the writer thread"""
+    if self._closed:
+      return
+    self._closed = True
+    self._queue.put(_STOP)
+    self._thread.join(timeout)
+    if self._pending:
+      logger.error(f'BatchWriter closed with {len(self._pending)} unwritten trials')
+    self._raiseError()
+
+  def _raiseError(self):
+    error = self._dropped_error or self._error
+    self._dropped_error = None
+    if error is not None:
+      raise error
+
+  def _trialToRows(self, trial):
+    trial_row = {
+      'experiment_id': trial.experiment_id,
+      'run_number': trial.run_number,
+      'outcome': trial.outcome,
+      'obj_parameters': trial.obj_parameters,
+    }
+    config_rows = [
+      {
+        'parameter_id': config.parameter.id if config.parameter is not None else config.parameter_id,
+        'value': config.value
+      }
+      for config in trial.parameter_configs
+    ]
+    return trial_row, config_rows, summaryValues(None, trial)
+
+  def _run(self):
+    last_write = time.monotonic()
+    while True:
+      now = time.monotonic()
+      timeout = max(self.flush_interval - (now - last_write), self._retry_time - now, 0)
+      try:
+        item = self._queue.get(timeout=timeout)
+      except queue.Empty:
+        item = None
+
+      if item is _STOP:
+        self._write()
+        return
+      if isinstance(item, threading.Event):
+        self._write()
+        last_write = time.monotonic()
+        item.set()
+        continue
+      if item is not None:
+        self._pending.append(item)
+      due = len(self._pending) >= self.batch_size or time.monotonic() - last_write >= self.flush_interval
+      if due and time.monotonic() >= self._retry_time:
+        self._write()
+        last_write = time.monotonic()
+
+  def _write(self):
+    if not self._pending:
+      return
+    batch = self._pending
+    session = self.Session()
+    try:
+      beginWrite(session)
+      trial_ids = self._insertTrials(session, [trial_row for trial_row, _, _ in batch])
+      config_rows = [
+        dict(config_row, trial_id=trial_id)
+        for trial_id, (_, config_rows, _) in zip(trial_ids, batch)
+        for config_row in config_rows
+      ]
+      if config_rows:
+        session.execute(ParameterConfig.__table__.insert().values(config_rows))
+      updateSummaries(session, [
+        dict(summary_values, trial_id=trial_id)
+        for trial_id, (_, _, summary_values) in zip(trial_ids, batch)
+      ])
+      session.commit()
+      logger.info(f'Wrote batch of {len(batch)} trials')
+      self._pending = []
+      self._error = None
+      self._n_failures = 0
+      self._retry_time = 0
+    except Exception as e:
+      session.rollback()
+      self._n_failures += 1
+      if self._n_failures > self.max_retries:
+        logger.exception(f'Failed to write batch of {len(batch)} trials {self._n_failures} times, dropping it')
+        self._dropped_error = Exception(
+          f'Dropped {len(batch)} trials after {self._n_failures} failed attempts to write them: {e}')
+        self._dropped_error.__cause__ = e
+        self._pending = []
+        self._error = None
+        self._n_failures = 0
+        self._retry_time = 0
+      else:
+        delay = self.retry_backoff * 2 ** (self._n_failures - 1)
+        logger.exception(f'Failed to write batch of {len(batch)} trials, will retry in {delay:.1f}s')
+        self._error = e
+        self._retry_time = time.monotonic() + delay
+    finally:
+      session.close()
+
+  def _insertTrials(self, session, trial_rows):
+    """Insert trial rows and return their ids, in order"""
+    table = Trial.__table__
+    if session.bind.dialect.name == 'postgresql':
+      # postgres returns the ids of a multi-row insert in VALUES order
+      result = session.execute(table.insert().values(trial_rows).returning(table.c.id))
+      return [row[0] for row in result]
+    # dialects without RETURNING (e.g. sqlite) insert row by row inside the same transaction
+    return [session.execute(table.insert().values(**trial_row)).inserted_primary_key[0] for trial_row in trial_rows]
@@ -1,12 +1,17 @@
 from .experiment import Experiment
 from .parameter import Parameter, PARAMETER_TYPE_FLOAT, PARAMETER_TYPE_INT
 from .parameter_config import ParameterConfig
-from .trial import Trial
+from .trial import Trial, FAILED_TRIAL_OUTCOME
 from .compute import Compute, EC2Compute, LocalCompute
+from .paropt_info import ParoptInfo
+from .summary import ExperimentSummary, RunSummary
 
 __all__ = [
   'Experiment',
   'Parameter',
   'ParameterConfig',
-  'Trial'
+  'Trial',
+  'ParoptInfo',
+  'ExperimentSummary',
+  'RunSummary'
 ]
\ No newline at end of file
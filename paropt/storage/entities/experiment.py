@@ -19,7 +19,8 @@ class Experiment(ORMBase):
   trials = relationship("Trial")
   compute_id = Column(Integer, ForeignKey('computes.id'))
   compute = relationship("Compute", lazy=False)
-  hash = Column(String)
+  # experiments are looked up by hash in getOrCreateExperiment(), and must be unique on it
+  hash = Column(String, index=True, unique=True)
 
   def __repr__(self):
     return (
@@ -14,7 +14,7 @@ class Parameter(ORMBase):
   type = Column(String(20), nullable=False, default=PARAMETER_TYPE_FLOAT)
   minimum = Column(Integer, nullable=False)
   maximum = Column(Integer, nullable=False)
-  experiment_id = Column(Integer, ForeignKey('experiments.id'))
+  experiment_id = Column(Integer, ForeignKey('experiments.id'), index=True)
   
   def __repr__(self):
     return (
@@ -9,9 +9,9 @@ class ParameterConfig(ORMBase):
   __tablename__ = 'parameterconfigs'
 
   id = Column(Integer, primary_key=True)
-  parameter_id = Column(Integer, ForeignKey('parameters.id'), nullable=False)
-  parameter = relationship("Parameter")
-  trial_id = Column(Integer, ForeignKey('trials.id'), nullable=False)
+  parameter_id = Column(Integer, ForeignKey('parameters.id'), nullable=False, index=True)
+  parameter = relationship("Parameter", lazy='joined')
+  trial_id = Column(Integer, ForeignKey('trials.id'), nullable=False, index=True)
   value = Column(Float, nullable=False)
 
   def __repr__(self):
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String
+
+from .orm_base import ORMBase
+
+class ParoptInfo(ORMBase):
+  """Key/value metadata about the database itself, e.g. the schema version (see storage.migrations)"""
+  __tablename__ = 'paropt_info'
+
+  key = Column(String(50), primary_key=True)
+  value = Column(String, nullable=False)
+
+  def __repr__(self):
+    return f'ParoptInfo(key={self.key}, value={self.value})'
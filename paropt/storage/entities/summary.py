@@ -0,0 +1,79 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey
+from sqlalchemy.types import TIMESTAMP
+from sqlalchemy.sql.expression import func
+from sqlalchemy.dialects.postgresql import JSON
+
+from .orm_base import ORMBase
+from .trial import FAILED_TRIAL_OUTCOME
+
+class SummaryMixin():
+  """Aggregates of trials, updated by the storage with every saved trial so they can be read without scanning trials"""
+  best_trial_id = Column(Integer)
+  best_outcome = Column(Float)
+  best_parameters = Column(JSON)
+  n_trials = Column(Integer, nullable=False, default=0)
+  n_failed = Column(Integer, nullable=False, default=0)
+  # sum of the running_time objective parameter of trials, in seconds
+  total_running_time = Column(Float, nullable=False, default=0.0)
+  # [n_trials, best_outcome] each time the best outcome improved
+  convergence = Column(JSON, nullable=False, default=list)
+  timestamp = Column(TIMESTAMP, server_default=func.now(), onupdate=func.current_timestamp())
+
+  def addTrial(self, trial_id, outcome, parameters, obj_parameters):
+    """Update the summary with a trial, given as values so it works for trials written in bulk"""
+    self.n_trials = (self.n_trials or 0) + 1
+    if outcome == FAILED_TRIAL_OUTCOME:
+      self.n_failed = (self.n_failed or 0) + 1
+      return
+    running_time = (obj_parameters or {}).get('running_time')
+    if running_time is not None:
+      self.total_running_time = (self.total_running_time or 0.0) + running_time
+    if self.best_outcome is None or outcome > self.best_outcome:
+      self.best_trial_id = trial_id
+      self.best_outcome = outcome
+      self.best_parameters = parameters
+      # reassign so the change to the JSON column is detected
+      self.convergence = (self.convergence or []) + [[self.n_trials, outcome]]
+
+  def asdict(self):
+    return {
+      'best_trial_id': self.best_trial_id,
+      'best_outcome': self.best_outcome,
+      'best_parameters': self.best_parameters,
+      'n_trials': self.n_trials,
+      'n_failed': self.n_failed,
+      'total_running_time': self.total_running_time,
+      'convergence': self.convergence,
+      'timestamp': self.timestamp
+    }
+
+class ExperimentSummary(SummaryMixin, ORMBase):
+  __tablename__ = 'experiment_summaries'
+
+  experiment_id = Column(Integer, ForeignKey('experiments.id'), primary_key=True)
+
+  def __repr__(self):
+    return (
+      f'ExperimentSummary('
+      f'experiment_id={self.experiment_id}, n_trials={self.n_trials}, n_failed={self.n_failed}, '
+      f'best_outcome={self.best_outcome}, best_parameters={self.best_parameters})'
+    )
+
+  def asdict(self):
+    return dict(super().asdict(), experiment_id=self.experiment_id)
+
+class RunSummary(SummaryMixin, ORMBase):
+  __tablename__ = 'run_summaries'
+
+  experiment_id = Column(Integer, ForeignKey('experiments.id'), primary_key=True)
+  run_number = Column(Integer, primary_key=True)
+
+  def __repr__(self):
+    return (
+      f'RunSummary('
+      f'experiment_id={self.experiment_id}, run_number={self.run_number}, n_trials={self.n_trials}, '
+      f'n_failed={self.n_failed}, best_outcome={self.best_outcome}, best_parameters={self.best_parameters})'
+    )
+
+  def asdict(self):
+    return dict(super().asdict(), experiment_id=self.experiment_id, run_number=self.run_number)
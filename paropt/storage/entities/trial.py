@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.sql.expression import func
@@ -7,6 +7,9 @@ from sqlalchemy.dialects.postgresql import JSON
 
 from .orm_base import ORMBase
 
+# outcome saved for trials that failed to run
+FAILED_TRIAL_OUTCOME = 10000000
+
 class Trial(ORMBase):
   __tablename__ = 'trials'
 
@@ -14,10 +17,16 @@ class Trial(ORMBase):
   experiment_id = Column(Integer, ForeignKey('experiments.id'), nullable=False)
   run_number = Column(Integer, nullable=False)
   outcome = Column(Float, nullable=False)
-  parameter_configs = relationship('ParameterConfig')
+  # loaded with one extra query per batch of trials (instead of one per trial) along with their parameters
+  parameter_configs = relationship('ParameterConfig', lazy='selectin')
   timestamp = Column(TIMESTAMP, server_default=func.now(), onupdate=func.current_timestamp())
   obj_parameters = Column(JSON, nullable=False)
 
+  __table_args__ = (
+    # trials are listed by experiment, and getLastRunNumber() takes max(run_number) per experiment
+    Index('ix_trials_experiment_id_run_number', 'experiment_id', 'run_number'),
+  )
+
   def __repr__(self):
     return (
       f'Trial('
@@ -28,6 +37,7 @@ class Trial(ORMBase):
 
   def asdict(self):
     return {
+      'id': self.id,
       'experiment_id': self.experiment_id,
       'run_number': self.run_number,
       'outcome': self.outcome,
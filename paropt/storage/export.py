@@ -0,0 +1,200 @@
+"""Export trials as a wide columnar table for analysis, e.g. with pandas
+
+Each row is a trial with columns experiment_id, run_number, timestamp, outcome, one column per parameter
+(named after the parameter) and one column per objective parameter, flattened with '.' and prefixed
+with 'obj.' (e.g. obj.running_time). Trials are streamed from storage and written in row groups, so
+exports don't have to fit in memory.
+
+Requires pyarrow. From the command line:
+  python -m paropt.storage.export --sqlite paropt.db --experiments 1 2 --out trials.parquet
+"""
+import argparse
+import json
+import logging
+import numbers
+import os
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = None
+
+from .entities import Trial, PARAMETER_TYPE_INT
+from .relational_db import RelationalDB
+from .sqlite_db import SQLiteDB
+
+logger = logging.getLogger(__name__)
+
+ROW_GROUP_SIZE = 10000
+OBJ_PARAMETER_PREFIX = 'obj.'
+# file extension to format
+EXPORT_FORMATS = {
+  '.parquet': 'parquet',
+  '.arrow': 'arrow',
+  '.feather': 'arrow',
+}
+
+def _flatten(d, prefix=''):
+  flat = {}
+  for key, value in d.items():
+    if isinstance(value, dict):
+      flat.update(_flatten(value, f'{prefix}{key}.'))
+    else:
+      flat[f'{prefix}{key}'] = value
+  return flat
+
+def _isNumber(value):
+  return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def _objParameterTypes(session, experiment_ids, chunk_size):
+  """First pass over the trials: objective parameter columns and whether all their values are numeric"""
+  numeric = {}
+  rows = session.query(Trial.obj_parameters) \
+    .filter(Trial.experiment_id.in_(experiment_ids)) \
+    .yield_per(chunk_size)
+  for (obj_parameters,) in rows:
+    for key, value in _flatten(obj_parameters or {}).items():
+      if value is not None:
+        numeric[key] = numeric.get(key, True) and _isNumber(value)
+      else:
+        numeric.setdefault(key, True)
+  return numeric
+
+def _buildSchema(parameters, obj_numeric):
+  fields = [
+    pa.field('experiment_id', pa.int64()),
+    pa.field('run_number', pa.int64()),
+    pa.field('timestamp', pa.timestamp('us')),
+    pa.field('outcome', pa.float64()),
+  ]
+  for name, parameter_type in parameters.items():
+    fields.append(pa.field(name, pa.int64() if parameter_type == PARAMETER_TYPE_INT else pa.float64()))
+  for key, is_numeric in sorted(obj_numeric.items()):
+    fields.append(pa.field(f'{OBJ_PARAMETER_PREFIX}{key}', pa.float64() if is_numeric else pa.string()))
+  return pa.schema(fields)
+
+def _trialToRow(trial_dict, parameters, obj_numeric):
+  row = {
+    'experiment_id': trial_dict['experiment_id'],
+    'run_number': trial_dict['run_number'],
+    'timestamp': trial_dict['timestamp'],
+    'outcome': trial_dict['outcome'],
+  }
+  for config in trial_dict['parameter_configs']:
+    value = config['value']
+    row[config['parameter_name']] = int(round(value)) if parameters.get(config['parameter_name']) == PARAMETER_TYPE_INT else value
+  for key, value in _flatten(trial_dict['obj_parameters'] or {}).items():
+    if value is not None and not obj_numeric[key] and not isinstance(value, str):
+      value = json.dumps(value)
+    row[f'{OBJ_PARAMETER_PREFIX}{key}'] = value
+  return row
+
+class _Writer():
+  """Writes record batches to a parquet or arrow IPC file"""
+  def __init__(self, path, schema, export_format):
+    if export_format == 'parquet':
+      self._writer = pq.ParquetWriter(path, schema)
+      self._write = lambda batch: self._writer.write_table(pa.Table.from_batches([batch]))
+    else:
+      self._sink = pa.OSFile(path, 'wb')
+      self._writer = pa.ipc.new_file(self._sink, schema)
+      self._write = self._writer.write_batch
+
+  def write(self, batch):
+    self._write(batch)
+
+  def close(self):
+    self._writer.close()
+    if getattr(self, '_sink', None) is not None:
+      self._sink.close()
+
+def exportTrials(storage, session, experiment_ids, path, export_format=None, row_group_size=ROW_GROUP_SIZE):
+  """Write trials of experiments to a parquet or arrow IPC file
+
+  Parameters
+  ----------
+  storage : RelationalDB
+  session : Session
+    session of the storage
+  experiment_ids : []int
+  path : str
+    file to write
+  export_format : str
+    'parquet' or 'arrow', by default inferred from the extension of path
+  row_group_size : int
+    number of trials held in memory and written at a time
+
+  Returns
+  -------
+  n_trials : int
+    number of trials written
+  """
+  if pa is None:
+    raise Exception('Exporting trials requires pyarrow: pip install pyarrow')
+  if export_format is None:
+    export_format = EXPORT_FORMATS.get(os.path.splitext(path)[1], 'parquet')
+  if export_format not in set(EXPORT_FORMATS.values()):
+    raise Exception(f'Unrecognized export format: {export_format}')
+
+  parameters = {}
+  for experiment_id in experiment_ids:
+    experiment = storage.getExperiment(session, experiment_id)
+    if experiment is None:
+      raise Exception(f'No experiment with id {experiment_id}')
+    for parameter in experiment.parameters:
+      parameters.setdefault(parameter.name, parameter.type)
+  obj_numeric = _objParameterTypes(session, experiment_ids, row_group_size)
+  schema = _buildSchema(parameters, obj_numeric)
+
+  writer = _Writer(path, schema, export_format)
+  n_trials = 0
+  rows = []
+  def writeRows():
+    columns = [[row.get(field.name) for row in rows] for field in schema]
+    writer.write(pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+
+  try:
+    for experiment_id in experiment_ids:
+      for trial_dict in storage.iterTrialRows(session, experiment_id, chunk_size=row_group_size):
+        rows.append(_trialToRow(trial_dict, parameters, obj_numeric))
+        if len(rows) >= row_group_size:
+          writeRows()
+          n_trials += len(rows)
+          rows = []
+    if rows:
+      writeRows()
+      n_trials += len(rows)
+  finally:
+    writer.close()
+  logger.info(f'Exported {n_trials} trials of experiments {experiment_ids} to {path}')
+  return n_trials
+
+def main():
+  parser = argparse.ArgumentParser(description='Export trials of experiments to a parquet or arrow file.')
+  parser.add_argument('--experiments', type=int, nargs='+', required=True, help='ids of experiments to export')
+  parser.add_argument('--out', required=True, help='file to write, .parquet, .arrow or .feather')
+  parser.add_argument('--format', choices=['parquet', 'arrow'], help='by default inferred from the extension of --out')
+  parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+  parser.add_argument('--sqlite', help='path of a SQLiteDB database; otherwise the DB_* arguments are used')
+  parser.add_argument('--dialect', default='postgresql')
+  parser.add_argument('--host', default=os.environ.get('DB_HOST'))
+  parser.add_argument('--user', default=os.environ.get('DB_USER'))
+  parser.add_argument('--password', default=os.environ.get('DB_PASSWORD'))
+  parser.add_argument('--dbname', default=os.environ.get('DB_NAME'))
+  args = parser.parse_args()
+
+  if args.sqlite:
+    storage = SQLiteDB(args.sqlite)
+  else:
+    storage = RelationalDB(args.dialect, args.user, args.password, args.host, args.dbname)
+  session = storage.Session()
+  try:
+    n_trials = exportTrials(storage, session, args.experiments, args.out,
+                            export_format=args.format, row_group_size=args.row_group_size)
+  finally:
+    session.close()
+  print(f'Exported {n_trials} trials to {args.out}')
+
+if __name__ == '__main__':
+  main()
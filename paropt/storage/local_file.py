@@ -1,7 +1,11 @@
+import warnings
+
 from .storage_base import StorageBase
 
 class LocalFile():
+  """Deprecated: doesn't implement the storage interface used by ParslRunner, use SQLiteDB for local storage"""
   def __init__(self, file_path):
+    warnings.warn('LocalFile is deprecated, use SQLiteDB for local storage', DeprecationWarning, stacklevel=2)
     self.file_path = file_path
   
   def getTrials(self, experiment_id):
@@ -0,0 +1,216 @@
+"""Lightweight schema migrations for RelationalDB
+
+create_all() creates missing tables but never alters existing ones, so changes to existing tables
+(new indexes, backfilling summaries of existing trials) are applied here. The version of the applied schema is stored in the
+paropt_info table, and migrate() is a no-op once a database is at SCHEMA_VERSION.
+"""
+import logging
+
+from sqlalchemy import inspect, select, func
+from sqlalchemy.exc import IntegrityError, ProgrammingError, DBAPIError
+
+from .entities.orm_base import ORMBase
+from .entities import ParoptInfo, Experiment, Trial, ExperimentSummary, RunSummary
+from .summaries import summaryValues, updateSummaries
+from .transactions import beginWrite
+
+logger = logging.getLogger(__name__)
+
+# bump when adding a migration step to migrate(), or when the columns used by Experiment.getHash() change:
+# setup is skipped for databases at this version, including the check for outdated hashes
+SCHEMA_VERSION = 2
+SCHEMA_VERSION_KEY = 'schema_version'
+# id of the last experiment rehashed by an unfinished migrateHashes(), absent when no migration is running
+HASH_MIGRATION_KEY = 'hash_migration_last_id'
+HASH_MIGRATION_CHUNK_SIZE = 500
+SUMMARY_BACKFILL_CHUNK_SIZE = 1000
+
+def getInfo(session, key, default=None):
+  info = session.query(ParoptInfo).filter(ParoptInfo.key == key).first()
+  return info.value if info is not None else default
+
+def setInfo(session, key, value):
+  """Set a paropt_info value, the caller commits"""
+  session.merge(ParoptInfo(key=key, value=str(value)))
+
+def getSchemaVersion(session):
+  return int(getInfo(session, SCHEMA_VERSION_KEY, 0))
+
+def _indexNames(engine, table_name):
+  return {index['name'] for index in inspect(engine).get_indexes(table_name)}
+
+def createMissingIndexes(engine):
+  """Create indexes declared on the entities that don't exist in the database yet"""
+  for table in ORMBase.metadata.sorted_tables:
+    existing = _indexNames(engine, table.name)
+    for index in table.indexes:
+      if index.name in existing:
+        continue
+      logger.info(f'Creating index {index.name} on {table.name}')
+      try:
+        index.create(engine)
+      except (IntegrityError, ProgrammingError) as e:
+        if index.name in _indexNames(engine, table.name):
+          # created by another worker migrating at the same time
+          continue
+        if not index.unique:
+          raise
+        # existing rows violate the constraint, e.g. experiments created twice by concurrent workers before
+        # hashes were unique. They have to be merged by hand, the migration is retried on the next start
+        duplicates = _duplicateKeys(engine, index)
+        raise Exception(f'Could not create unique index {index.name} on {table.name}, '
+          f'rows with duplicate {", ".join(column.name for column in index.columns)}: {duplicates}') from e
+
+def _duplicateKeys(engine, index):
+  """Values of the index's columns shared by more than one row"""
+  columns = list(index.columns)
+  query = select(columns).group_by(*columns).having(func.count() > 1)
+  with engine.connect() as connection:
+    return [tuple(row) if len(columns) > 1 else row[0] for row in connection.execute(query)]
+
+def isSchemaCurrent(Session):
+  """
+  True when the database exists at SCHEMA_VERSION with no unfinished hash migration, so setup can be
+  skipped. False if the database or paropt_info table don't exist yet.
+  """
+  session = Session()
+  try:
+    return getSchemaVersion(session) >= SCHEMA_VERSION and getInfo(session, HASH_MIGRATION_KEY) is None
+  except DBAPIError:
+    return False
+  finally:
+    session.rollback()
+    session.close()
+
+def _hashCollisions(session, hashes):
+  """New hashes of experiments (by id) shared with other experiments, as {hash: ids}"""
+  ids_by_hash = {}
+  for experiment_id, hash in hashes.items():
+    ids_by_hash.setdefault(hash, []).append(experiment_id)
+  existing = session.query(Experiment.id, Experiment.hash).filter(Experiment.hash.in_(list(ids_by_hash)))
+  for experiment_id, hash in existing:
+    if experiment_id not in hashes:
+      ids_by_hash[hash].append(experiment_id)
+  return {hash: sorted(ids) for hash, ids in ids_by_hash.items() if len(ids) > 1}
+
+def migrateHashes(Session, chunk_size=HASH_MIGRATION_CHUNK_SIZE):
+  """Update the hashes of all experiments after the columns used by Experiment.getHash() changed
+
+  Experiments are rehashed in chunks of chunk_size ordered by id, each committed with the id of its last
+  experiment in paropt_info. Each chunk is a short transaction, and a migration interrupted by a restart
+  resumes after the last committed chunk instead of starting over. A chunk whose experiments would get the
+  hash of another experiment isn't written, the migration fails listing them.
+  """
+  session = Session()
+  try:
+    last_id = getInfo(session, HASH_MIGRATION_KEY)
+    if last_id is None:
+      test_exp = session.query(Experiment).order_by(Experiment.id).first()
+      if test_exp is None or test_exp.getHash() == test_exp.hash:
+        return
+      logger.info(f'Updating hashes of all experiments ({test_exp.getHash()}, {test_exp.hash})')
+      last_id = 0
+    else:
+      logger.info(f'Resuming update of experiment hashes after experiment {last_id}')
+    last_id = int(last_id)
+
+    n_updated = 0
+    while True:
+      beginWrite(session)
+      # keyset pagination rather than one long-lived cursor, which wouldn't survive the per-chunk commits
+      chunk = session.query(Experiment) \
+        .filter(Experiment.id > last_id) \
+        .order_by(Experiment.id) \
+        .limit(chunk_size) \
+        .all()
+      if not chunk:
+        break
+      # compared before setting any hash, so a collision isn't flushed to the database by the query checking for it
+      hashes = {exp.id: exp.getHash() for exp in chunk}
+      collisions = _hashCollisions(session, hashes)
+      if collisions:
+        raise Exception(f'Experiments would have the same hash after updating hashes, {collisions} (hash: ids). '
+          f'Merge them and set up storage again to resume the update after experiment {last_id}')
+      for exp in chunk:
+        exp.hash = hashes[exp.id]
+      last_id = chunk[-1].id
+      setInfo(session, HASH_MIGRATION_KEY, last_id)
+      session.commit()
+      # drop the chunk from the identity map so memory doesn't grow with the number of experiments
+      session.expunge_all()
+      n_updated += len(chunk)
+      logger.info(f'Updated hashes of {n_updated} experiments')
+
+    session.query(ParoptInfo).filter(ParoptInfo.key == HASH_MIGRATION_KEY).delete()
+    session.commit()
+  except:
+    session.rollback()
+    raise
+  finally:
+    session.close()
+
+def backfillSummaries(Session, chunk_size=SUMMARY_BACKFILL_CHUNK_SIZE):
+  """Build summaries of experiments that don't have one from their trials, committing per experiment"""
+  session = Session()
+  try:
+    experiment_ids = [experiment_id for (experiment_id,) in session.query(Experiment.id) \
+      .outerjoin(ExperimentSummary, ExperimentSummary.experiment_id == Experiment.id) \
+      .filter(ExperimentSummary.experiment_id == None) \
+      .order_by(Experiment.id)]
+    for experiment_id in experiment_ids:
+      beginWrite(session)
+      # run summaries are only written along with the experiment summary, so leftovers are from a failed backfill
+      session.query(RunSummary).filter(RunSummary.experiment_id == experiment_id).delete()
+      last_id = 0
+      while True:
+        trials = session.query(Trial) \
+          .filter(Trial.experiment_id == experiment_id) \
+          .filter(Trial.id > last_id) \
+          .order_by(Trial.id) \
+          .limit(chunk_size) \
+          .all()
+        if not trials:
+          break
+        updateSummaries(session, [summaryValues(trial.id, trial) for trial in trials])
+        last_id = trials[-1].id
+        session.flush()
+        for trial in trials:
+          session.expunge(trial)
+      session.commit()
+      session.expunge_all()
+      logger.info(f'Built summaries of experiment {experiment_id}')
+  except:
+    session.rollback()
+    raise
+  finally:
+    session.close()
+
+def migrate(engine, Session):
+  """Bring an existing database up to SCHEMA_VERSION"""
+  # end the version check's transaction before migrating: the steps use their own connections, which would wait
+  # for it on databases where a transaction holds a lock (SQLite)
+  session = Session()
+  try:
+    version = getSchemaVersion(session)
+  finally:
+    session.rollback()
+    session.close()
+  if version >= SCHEMA_VERSION:
+    return
+
+  logger.info(f'Migrating database schema from version {version} to {SCHEMA_VERSION}')
+  if version < 1:
+    createMissingIndexes(engine)
+  if version < 2:
+    backfillSummaries(Session)
+
+  session = Session()
+  try:
+    beginWrite(session)
+    setInfo(session, SCHEMA_VERSION_KEY, SCHEMA_VERSION)
+    session.commit()
+  except:
+    session.rollback()
+    raise
+  finally:
+    session.close()
@@ -1,30 +1,51 @@
 import os
 import logging
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, event, exc, Column, Integer, String, Float, DateTime
 from sqlalchemy.orm import relationship, sessionmaker, joinedload
 from sqlalchemy_utils import database_exists, create_database
 from sqlalchemy.sql.expression import func
+from sqlalchemy.exc import IntegrityError
 
 from .entities.orm_base import create_all
 from .storage_base import StorageBase
+from .batch_writer import BatchWriter
+from .migrations import migrate, migrateHashes, isSchemaCurrent
+from .summaries import summaryValues, updateSummaries
+from .transactions import beginWrite
 from .entities import (Trial, Parameter, Experiment, ParameterConfig,
-  Compute, EC2Compute, LocalCompute)
+  Compute, EC2Compute, LocalCompute, ExperimentSummary, RunSummary, FAILED_TRIAL_OUTCOME)
 
 logger = logging.getLogger(__name__)
 
 class RelationalDB(StorageBase):
-  def __init__(self, dialect, username, password, host_url, dbname, experiment=None, experiment_id=None):
+  def __init__(self, dialect, username, password, host_url, dbname, experiment=None, experiment_id=None,
+               write_behind=False, batch_size=100, flush_interval=1.0,
+               pool_size=5, max_overflow=10, pool_recycle=3600, pool_pre_ping=True):
+    """
+    When write_behind is True, saveResult() queues trials for a background thread that writes them in
+    batches of up to batch_size trials, at least every flush_interval seconds (see BatchWriter).
+    Call flush() before reading trials that were just saved, and close() when done with the storage.
+
+    pool_size, max_overflow, pool_recycle (seconds) and pool_pre_ping configure the engine's connection
+    pool. A RelationalDB can be kept for the life of a process and shared by many runs, including across
+    fork(): connections opened by the parent process are never reused by a child.
+    """
     self.dialect = dialect
     self.username = username
     self.password = password
     self.host_url = host_url
     self.dbname = dbname
     self.engine_url = f'{dialect}://{username}:{password}@{host_url}/{dbname}'
+    self.pool_size = pool_size
+    self.max_overflow = max_overflow
+    self.pool_recycle = pool_recycle
+    self.pool_pre_ping = pool_pre_ping
 
     self.initialized = False
-    self.engine = create_engine(self.engine_url)
-    self.Session = sessionmaker(bind=self.engine)
+    self.engine = self._createEngine()
+    # objects stay usable after commit without being reloaded, e.g. a saved trial registered with the optimizer
+    self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
 
     self.experiment = experiment
     self.experiment_id = experiment_id
@@ -32,7 +53,49 @@ class RelationalDB(StorageBase):
 
     # setup the database
     self._setup()
+
+    self.write_behind = write_behind
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    # started on first use, per process since the writer thread doesn't survive fork()
+    self.writer = None
+    self._writer_pid = None
   
+  def _createEngine(self):
+    pool_options = {}
+    # sqlite doesn't use a QueuePool, so it has no size
+    if self.dialect != 'sqlite':
+      pool_options = {'pool_size': self.pool_size, 'max_overflow': self.max_overflow}
+    engine = create_engine(
+      self.engine_url,
+      pool_recycle=self.pool_recycle,
+      pool_pre_ping=self.pool_pre_ping,
+      **pool_options)
+    self._guardPid(engine)
+    return engine
+
+  def _guardPid(self, engine):
+    """Invalidate pooled connections inherited from a parent process instead of sharing their sockets"""
+    @event.listens_for(engine, 'connect')
+    def recordPid(dbapi_connection, connection_record):
+      connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkPid(dbapi_connection, connection_record, connection_proxy):
+      if connection_record.info['pid'] != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+          f"Connection record belongs to pid {connection_record.info['pid']}, attempting to check out in pid {os.getpid()}")
+
+  def _getWriter(self):
+    if self.writer is None or self._writer_pid != os.getpid():
+      self.writer = BatchWriter(self.Session, self.batch_size, self.flush_interval)
+      self._writer_pid = os.getpid()
+    return self.writer
+
+  def _hasWriter(self):
+    return self.writer is not None and self._writer_pid == os.getpid()
+
   def getLastRunNumber(self, session, experiment_id):
     if not self.initialized:
       self._setup()
@@ -48,6 +111,11 @@ class RelationalDB(StorageBase):
   def _setup(self):
     # initialize database
     logger.info(f'Setting up db engine')
+    # nothing to create or migrate, e.g. a new worker process on an existing database
+    if isSchemaCurrent(self.Session):
+      self.initialized = True
+      return
+
     # create database if it doesn't exist
     created_db = False
     if not database_exists(self.engine.url):
@@ -58,20 +126,10 @@ class RelationalDB(StorageBase):
     # update hashes of experiments if necessary
     # this should only happen when the columns of the experiment change
     if not created_db:
-      try:
-        session = self.Session()
-        test_exp = session.query(Experiment).first()
-        if test_exp != None and test_exp.getHash() != test_exp.hash:
-          logger.info(f'Updating hashes of all experiments... This may take a minute ({test_exp.getHash()}, {test_exp.hash})')
-          # TODO: replace with more efficient solution (ie generator or something)
-          for exp in session.query(Experiment).all():
-            exp.setHash()
-          session.commit()
-      except:
-        session.rollback()
-        raise
-      finally:
-        session.close()
+      migrateHashes(self.Session)
+
+    # create_all() doesn't alter existing tables, apply changes to them (e.g. new indexes)
+    migrate(self.engine, self.Session)
 
     self.initialized = True
 
@@ -82,22 +140,189 @@ class RelationalDB(StorageBase):
     if not self.initialized:
       self._setup()
 
+    if self.write_behind:
+      logger.debug(f'Queueing trial and parameter configs for database: {trial}')
+      self._getWriter().add(trial)
+      return
+
     logger.info(f'Saving trial and parameter configs to database: {trial}')
+    beginWrite(session)
     session.add(trial)
-    session.commit()
+    try:
+      session.flush()
+      updateSummaries(session, [summaryValues(trial.id, trial)])
+      session.commit()
+    except:
+      session.rollback()
+      raise
+
+  def flush(self):
+    """Block until all saved trials are written to the database. No-op unless write_behind is enabled"""
+    if self._hasWriter():
+      self.writer.flush()
+
+  def close(self):
+    """Write remaining trials and stop the background writer. No-op unless write_behind is enabled"""
+    if self._hasWriter():
+      self.writer.close()
+      self.writer = None
   
   def getTrials(self, session, experiment_id):
     if not self.initialized:
       self._setup()
 
+    # parameter configs and their parameters are loaded with one query per batch of trials
     all_results = session.query(Trial) \
       .filter(Trial.experiment_id == experiment_id) \
-      .join(ParameterConfig, Trial.parameter_configs) \
-      .join(Parameter, ParameterConfig.parameter) \
+      .order_by(Trial.id) \
       .all()
     
     return all_results
-  
+
+  def _filterTrials(self, query, experiment_id, after_id=None, run_number=None, start_time=None, end_time=None,
+                    status=None, min_outcome=None, max_outcome=None):
+    query = query.filter(Trial.experiment_id == experiment_id)
+    if after_id is not None:
+      query = query.filter(Trial.id > after_id)
+    if run_number is not None:
+      query = query.filter(Trial.run_number == run_number)
+    if start_time is not None:
+      query = query.filter(Trial.timestamp >= start_time)
+    if end_time is not None:
+      query = query.filter(Trial.timestamp < end_time)
+    if status == 'failed':
+      query = query.filter(Trial.outcome == FAILED_TRIAL_OUTCOME)
+    elif status == 'succeeded':
+      query = query.filter(Trial.outcome != FAILED_TRIAL_OUTCOME)
+    elif status is not None:
+      raise Exception(f'Unrecognized trial status: {status}')
+    if min_outcome is not None:
+      query = query.filter(Trial.outcome >= min_outcome)
+    if max_outcome is not None:
+      query = query.filter(Trial.outcome <= max_outcome)
+    return query
+
+  def iterTrialRows(self, session, experiment_id, chunk_size=1000, limit=None, **filters):
+    """Stream trials of an experiment as dicts, in the same format as Trial.asdict(), ordered by id
+
+    Uses a single flat query of trial and parameter config columns, read in chunks of chunk_size rows,
+    so memory use doesn't grow with the number of trials and no ORM objects are created.
+
+    Parameters
+    ----------
+    limit : int
+      maximum number of trials
+    filters
+      after_id (only trials with a greater id, e.g. the last id of the previous page), run_number,
+      start_time and end_time (timestamp range, end exclusive), status ('succeeded' or 'failed'),
+      min_outcome and max_outcome (inclusive)
+    """
+    if not self.initialized:
+      self._setup()
+
+    trial_ids = self._filterTrials(session.query(Trial.id), experiment_id, **filters).order_by(Trial.id)
+    if limit is not None:
+      trial_ids = trial_ids.limit(limit)
+    rows = session.query(
+        Trial.id, Trial.experiment_id, Trial.run_number, Trial.outcome, Trial.timestamp, Trial.obj_parameters,
+        Parameter.name, ParameterConfig.value) \
+      .join(ParameterConfig, Trial.parameter_configs) \
+      .join(Parameter, ParameterConfig.parameter) \
+      .filter(Trial.id.in_(trial_ids.subquery())) \
+      .order_by(Trial.id) \
+      .yield_per(chunk_size)
+
+    trial_id, trial_dict = None, None
+    for row in rows:
+      if row.id != trial_id:
+        if trial_dict is not None:
+          yield trial_dict
+        trial_id = row.id
+        trial_dict = {
+          'id': row.id,
+          'experiment_id': row.experiment_id,
+          'run_number': row.run_number,
+          'outcome': row.outcome,
+          'parameter_configs': [],
+          'timestamp': row.timestamp,
+          'obj_parameters': row.obj_parameters
+        }
+      trial_dict['parameter_configs'].append({'parameter_name': row.name, 'value': row.value})
+    if trial_dict is not None:
+      yield trial_dict
+
+  def getTrialsVersion(self, session, experiment_id):
+    """Number of trials of an experiment and the greatest trial id, which change whenever a trial is saved
+    (trials are never updated), e.g. to tell clients whether trials changed since they last fetched them"""
+    if not self.initialized:
+      self._setup()
+    n_trials, max_id = session.query(func.count(Trial.id), func.max(Trial.id)) \
+      .filter(Trial.experiment_id == experiment_id) \
+      .one()
+    return n_trials, max_id
+
+  def getExperimentSummary(self, session, experiment_id):
+    """Summary of all trials of an experiment (best trial, counts, running time, convergence), None without trials"""
+    if not self.initialized:
+      self._setup()
+
+    return session.query(ExperimentSummary) \
+      .filter(ExperimentSummary.experiment_id == experiment_id) \
+      .first()
+
+  def getRunSummaries(self, session, experiment_id):
+    """Summaries of each run of an experiment, ordered by run number"""
+    if not self.initialized:
+      self._setup()
+
+    return session.query(RunSummary) \
+      .filter(RunSummary.experiment_id == experiment_id) \
+      .order_by(RunSummary.run_number) \
+      .all()
+
+  def getRelatedTrials(self, session, experiment):
+    """Get trials of other experiments that tuned the same tool, for warm starting an optimizer
+
+    An experiment is related when it has the same tool_name and its parameters include every
+    parameter of the given experiment (e.g. the same tool run on another instance type or AMI).
+
+    Returns:
+      related([]dict): one dict per related experiment with keys 'experiment_id', 'overlap'
+        (jaccard similarity of parameter names) and 'trials', a list of (params_dict, outcome)
+    """
+    if not self.initialized:
+      self._setup()
+
+    parameter_names = {parameter.name for parameter in experiment.parameters}
+    candidates = session.query(Experiment) \
+      .filter(Experiment.tool_name == experiment.tool_name) \
+      .filter(Experiment.id != experiment.id) \
+      .all()
+
+    related = []
+    for candidate in candidates:
+      candidate_names = {parameter.name for parameter in candidate.parameters}
+      if not parameter_names.issubset(candidate_names):
+        continue
+      trials = session.query(Trial) \
+        .options(joinedload(Trial.parameter_configs).joinedload(ParameterConfig.parameter)) \
+        .filter(Trial.experiment_id == candidate.id) \
+        .filter(Trial.outcome != FAILED_TRIAL_OUTCOME) \
+        .all()
+      if not trials:
+        continue
+      related.append({
+        'experiment_id': candidate.id,
+        'overlap': len(parameter_names) / len(candidate_names),
+        'trials': [
+          ({config.parameter.name: config.value
+            for config in trial.parameter_configs
+            if config.parameter.name in parameter_names}, trial.outcome)
+          for trial in trials
+        ]
+      })
+    return related
+
   def _assertIsInstanceOf(self, instance, clss):
     if not isinstance(instance, clss):
       raise Exception(f'Provided instance must be of type {clss.__name__}')
@@ -130,15 +355,78 @@ class RelationalDB(StorageBase):
     else:
       # create experiment
       logger.info("Creating new experiment:\n{}".format(experiment))
+      beginWrite(session)
       session.add(experiment)
       try:
         session.commit()
+      except IntegrityError:
+        # another worker created the same experiment since we checked, hashes are unique
+        session.rollback()
+        instance = session.query(Experiment) \
+          .filter(Experiment.hash == hash_attr) \
+          .first()
+        if instance is None:
+          raise
+        last_run_number = self.getLastRunNumber(session, instance.id)
+        return instance, last_run_number, False
       except:
         session.rollback()
         raise
       last_run_number = self.getLastRunNumber(session, experiment.id)
       return experiment, last_run_number, True
   
+  def getOrCreateExperiments(self, session, experiments):
+    """Get or create many experiments in one transaction
+
+    Returns
+    -------
+    results : [](Experiment, bool)
+      the stored experiment and whether it was created, in the order of experiments. Experiments with the
+      same hash get the same stored experiment
+    """
+    if not self.initialized:
+      self._setup()
+
+    for experiment in experiments:
+      self._assertIsInstanceOf(experiment, Experiment)
+    hashes = [experiment.getHash() for experiment in experiments]
+    found = {
+      instance.hash: instance
+      for instance in session.query(Experiment).filter(Experiment.hash.in_(set(hashes)))
+    }
+    created = {}
+    for hash_attr, experiment in zip(hashes, experiments):
+      if hash_attr not in found and hash_attr not in created:
+        created[hash_attr] = experiment
+    if created:
+      logger.info(f'Creating {len(created)} new experiments')
+      beginWrite(session)
+      session.add_all(list(created.values()))
+      try:
+        session.commit()
+      except IntegrityError:
+        # another worker created some of them since we checked, get or create them one at a time instead
+        session.rollback()
+        results = []
+        for experiment in experiments:
+          instance, _, was_created = self.getOrCreateExperiment(session, experiment)
+          results.append((instance, was_created))
+        return results
+      except:
+        session.rollback()
+        raise
+
+    results = []
+    returned = set()
+    for hash_attr in hashes:
+      if hash_attr in found:
+        results.append((found[hash_attr], False))
+      else:
+        # only the first experiment with a hash counts as created
+        results.append((created[hash_attr], hash_attr not in returned))
+        returned.add(hash_attr)
+    return results
+
   def getOrCreateCompute(self, session, compute):
     if not self.initialized:
       self._setup()
@@ -162,6 +450,7 @@ class RelationalDB(StorageBase):
     else:
       # create compute
       logger.info("Creating new compute:\n{}".format(compute))
+      beginWrite(session)
       session.add(compute)
       try:
         session.commit()
@@ -0,0 +1,67 @@
+import logging
+
+from sqlalchemy import create_engine, event
+
+from .relational_db import RelationalDB
+from .transactions import WRITE_OPTION
+
+logger = logging.getLogger(__name__)
+
+# applied to every new connection. WAL lets readers run alongside the single writer, and with
+# synchronous=NORMAL a commit only syncs the WAL on checkpoint, which is still safe against
+# application crashes
+PRAGMAS = {
+  'journal_mode': 'WAL',
+  'synchronous': 'NORMAL',
+  'foreign_keys': 'ON',
+  'temp_store': 'MEMORY',
+  'cache_size': -64000, # in KiB when negative
+}
+
+class SQLiteDB(RelationalDB):
+  """Embedded storage for single node use, e.g. running paropt on a laptop or in CI without Postgres
+
+  Uses the same entities and interface as RelationalDB, in a SQLite database file. Several local
+  runners can share the same file: read transactions don't block anyone (WAL), and write transactions
+  (see paropt.storage.transactions) take the write lock when they begin (BEGIN IMMEDIATE), so concurrent
+  writers wait up to busy_timeout milliseconds for each other instead of failing with 'database is locked'
+  when upgrading a read transaction to a write.
+  """
+  def __init__(self, path='paropt.db', experiment=None, experiment_id=None, busy_timeout=30000,
+               write_behind=False, batch_size=100, flush_interval=1.0):
+    self.path = path
+    self.busy_timeout = busy_timeout
+    super().__init__('sqlite', None, None, None, path,
+                     experiment=experiment,
+                     experiment_id=experiment_id,
+                     write_behind=write_behind,
+                     batch_size=batch_size,
+                     flush_interval=flush_interval)
+
+  def __repr__(self):
+    return f'SQLiteDB(path={self.path})'
+
+  def _createEngine(self):
+    self.engine_url = f'sqlite:///{self.path}'
+    # the write-behind thread uses connections created by the runner's thread
+    engine = create_engine(self.engine_url, connect_args={'check_same_thread': False})
+    self._guardPid(engine)
+
+    @event.listens_for(engine, 'connect')
+    def setPragmas(dbapi_connection, connection_record):
+      # disable pysqlite's own transaction handling so BEGIN is emitted by the 'begin' listener below
+      dbapi_connection.isolation_level = None
+      cursor = dbapi_connection.cursor()
+      cursor.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+      for pragma, value in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {pragma} = {value}')
+      cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+      if connection.get_execution_options().get(WRITE_OPTION):
+        connection.execute('BEGIN IMMEDIATE')
+      else:
+        connection.execute('BEGIN')
+
+    return engine
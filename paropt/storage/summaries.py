@@ -0,0 +1,46 @@
+"""Maintenance of ExperimentSummary and RunSummary rows, shared by RelationalDB.saveResult and BatchWriter"""
+from sqlalchemy.exc import IntegrityError
+
+from .entities import ExperimentSummary, RunSummary, ParameterConfig
+
+def summaryValues(trial_id, trial):
+  """Values of a Trial needed to update summaries, taken when it's saved"""
+  return {
+    'trial_id': trial_id,
+    'experiment_id': trial.experiment_id,
+    'run_number': trial.run_number,
+    'outcome': trial.outcome,
+    'obj_parameters': trial.obj_parameters,
+    'parameters': ParameterConfig.configsToDict(trial.parameter_configs),
+  }
+
+def _lockSummary(session, summary_class, keys):
+  # lock the row so concurrent writers of the same experiment don't lose updates
+  return session.query(summary_class).filter_by(**keys).with_for_update().first()
+
+def _getOrCreate(session, summaries, summary_class, **keys):
+  key = (summary_class,) + tuple(sorted(keys.items()))
+  if key not in summaries:
+    summary = _lockSummary(session, summary_class, keys)
+    if summary is None:
+      # a missing row can't be locked, so another writer may insert it first: insert in a savepoint, which is
+      # all that's rolled back when that happens (not the caller's trials), then lock whichever row was inserted
+      try:
+        with session.begin_nested():
+          session.execute(summary_class.__table__.insert().values(**keys))
+      except IntegrityError:
+        pass
+      summary = _lockSummary(session, summary_class, keys)
+    summaries[key] = summary
+  return summaries[key]
+
+def updateSummaries(session, trials):
+  """Add trials, as returned by summaryValues() in the order they were saved, to the summaries of their
+  experiment and run. The caller commits, in the same transaction as the trials"""
+  summaries = {}
+  for values in trials:
+    experiment_summary = _getOrCreate(session, summaries, ExperimentSummary, experiment_id=values['experiment_id'])
+    run_summary = _getOrCreate(session, summaries, RunSummary,
+                               experiment_id=values['experiment_id'], run_number=values['run_number'])
+    for summary in (experiment_summary, run_summary):
+      summary.addTrial(values['trial_id'], values['outcome'], values['parameters'], values['obj_parameters'])
@@ -0,0 +1,14 @@
+"""Write transactions, for databases where the locks a transaction takes depend on how it begins (SQLite)"""
+
+# execution option of the connection a write transaction begins on, see SQLiteDB
+WRITE_OPTION = 'paropt_write'
+
+def beginWrite(session):
+  """End the session's current transaction and begin one that will write
+
+  SQLiteDB begins these with BEGIN IMMEDIATE, taking the write lock up front: a transaction that already read
+  can fail to upgrade to a write when another connection wrote since, and one that only reads shouldn't block
+  writers. Other databases ignore the option. Call this before making changes, pending ones are committed.
+  """
+  session.commit()
+  session.connection(execution_options={WRITE_OPTION: True})
@@ -123,5 +123,9 @@ setup(
     # install_requires=pkgs,
     # dependency_links=new_links,
     # download_url='https://github.com/chaofengwu/paropt',
-    packages=find_packages()
+    packages=find_packages(),
+    extras_require={
+        # paropt.storage.export
+        'export': ['pyarrow'],
+    }
 )
\ No newline at end of file
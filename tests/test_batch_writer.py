@@ -0,0 +1,110 @@
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from paropt.optimizer import RandomSearch
+from paropt.storage import SQLiteDB
+from paropt.storage.batch_writer import BatchWriter
+from paropt.storage.entities import Trial
+
+from test_sqlite_db import _experiment, _trial, _createExperiment
+
+class DatabaseLock():
+  """Holds the write lock of a SQLite database from another connection, so writes to it fail"""
+  def __init__(self, path):
+    self.connection = sqlite3.connect(path, isolation_level=None)
+    self.connection.execute('BEGIN IMMEDIATE')
+
+  def release(self):
+    self.connection.execute('ROLLBACK')
+    self.connection.close()
+
+def _countTrials(storage, experiment):
+  session = storage.Session()
+  try:
+    return len(storage.getTrials(session, experiment.id))
+  finally:
+    session.close()
+
+@pytest.fixture
+def storage(tmp_path):
+  return SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=50)
+
+def test_retried_after_failure(storage):
+  experiment = _createExperiment(storage)
+  writer = BatchWriter(storage.Session, flush_interval=0.01, retry_backoff=0.01)
+  lock = DatabaseLock(storage.path)
+  writer.add(_trial(experiment, 1, 1, 1.0))
+  with pytest.raises(Exception):
+    writer.flush()
+  lock.release()
+  writer.flush()
+  writer.close()
+  assert _countTrials(storage, experiment) == 1
+
+def test_retries_back_off(storage):
+  experiment = _createExperiment(storage)
+  writer = BatchWriter(storage.Session, flush_interval=0.01, retry_backoff=60)
+  lock = DatabaseLock(storage.path)
+  writer.add(_trial(experiment, 1, 1, 1.0))
+  deadline = time.time() + 5
+  while writer._n_failures == 0 and time.time() < deadline:
+    time.sleep(0.01)
+  lock.release()
+  # the writer thread waits retry_backoff before trying again
+  time.sleep(0.2)
+  assert writer._n_failures == 1
+  assert _countTrials(storage, experiment) == 0
+  writer.close()
+  assert _countTrials(storage, experiment) == 1
+
+def test_dropped_after_max_retries(storage):
+  experiment = _createExperiment(storage)
+  writer = BatchWriter(storage.Session, flush_interval=60, max_retries=1, retry_backoff=0.01)
+  lock = DatabaseLock(storage.path)
+  writer.add(_trial(experiment, 1, 1, 1.0))
+  with pytest.raises(Exception):
+    writer.flush()
+  with pytest.raises(Exception, match='Dropped 1 trials'):
+    writer.flush()
+  lock.release()
+  # the error is raised once, later trials are written
+  writer.add(_trial(experiment, 1, 2, 2.0))
+  writer.close()
+  assert _countTrials(storage, experiment) == 1
+
+def test_dropped_error_raised_by_add(storage):
+  experiment = _createExperiment(storage)
+  writer = BatchWriter(storage.Session, flush_interval=0.01, max_retries=1, retry_backoff=0.01)
+  lock = DatabaseLock(storage.path)
+  writer.add(_trial(experiment, 1, 1, 1.0))
+  deadline = time.time() + 5
+  while writer._dropped_error is None and time.time() < deadline:
+    time.sleep(0.01)
+  lock.release()
+  with pytest.raises(Exception, match='Dropped 1 trials'):
+    writer.add(_trial(experiment, 1, 2, 2.0))
+  writer.close()
+
+def test_registered_trials_not_saved_twice(tmp_path):
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'), write_behind=True)
+  experiment = _createExperiment(storage)
+  session = storage.Session()
+  storage.saveResult(session, _trial(experiment, 1, 1, 1.0))
+  storage.flush()
+
+  # like the runner: the optimizer gets the experiment with its trials, then trials are saved and registered
+  stored, _, _ = storage.getOrCreateExperiment(session, _experiment())
+  optimizer = RandomSearch(n_iter=2)
+  optimizer.setExperiment(stored)
+  for i in range(2):
+    trial = _trial(stored, 2, i + 2, float(i))
+    storage.saveResult(session, trial)
+    optimizer.register(trial)
+  session.flush()
+  storage.close()
+  session.close()
+  assert _countTrials(storage, experiment) == 3
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('bayes_opt')
+
+from paropt.optimizer import BayesianOptimizer
+from paropt.optimizer import bayesian_optimizer
+from paropt.storage.entities import Experiment, Parameter, ParameterConfig, Trial, LocalCompute
+
+
+def _experiment(trials):
+    parameters = [Parameter(id=1, name='x', minimum=0, maximum=10), Parameter(id=2, name='y', minimum=0, maximum=10)]
+    experiment = Experiment(id=1, tool_name='tool', parameters=parameters, command_template_string='echo',
+                            compute=LocalCompute(max_threads=1))
+    experiment.trials = [
+        Trial(experiment_id=1, run_number=1, outcome=outcome, obj_parameters={'running_time': 1.0},
+              parameter_configs=[ParameterConfig(parameter=parameter, value=params[parameter.name])
+                                 for parameter in parameters])
+        for params, outcome in trials
+    ]
+    return experiment
+
+
+def test_own_trials_registered_before_related():
+    optimizer = BayesianOptimizer(n_init=0, n_iter=1, warm_start=True)
+    optimizer.setExperiment(_experiment([({'x': 1.0, 'y': 2.0}, -3.0)]))
+    optimizer.setRelatedTrials([{
+        'experiment_id': 2,
+        'overlap': 1.0,
+        # the first point was also run by the experiment itself
+        'trials': [({'x': 1.0, 'y': 2.0}, -5.0), ({'x': 4.0, 'y': 4.0}, -1.0)],
+    }])
+    # as done by the first suggestion after the n_init random ones
+    optimizer.previous_trials_loaded = True
+    optimizer._load()
+
+    assert len(optimizer.history) == 1
+    assert optimizer.getMax()['target'] == -3.0
+    space = optimizer.optimizer._space
+    assert len(space) == 2
+    assert sorted(space.target) == [-3.0, -1.0]
+    assert optimizer.sample_weights == [1.0, 0.5]
+
+
+class StubGP():
+    """Objective model expecting the same improvement everywhere"""
+    def fit(self, params, targets):
+        self.y_max = targets.max()
+
+    def predict(self, x, return_std=False):
+        mean = np.full(len(x), self.y_max + 1.0)
+        return (mean, np.ones(len(x))) if return_std else mean
+
+
+class StubCostModel():
+    """Running time model predicting 1 + x seconds (log seconds, like the real one)"""
+    def __init__(self, scale=1.0):
+        self.scale = scale
+
+    def predict(self, x):
+        return np.log(self.scale * (1.0 + x[:, 0]))
+
+
+# the model's own suggestion first, then the random candidates
+SUGGESTION = [9.0, 9.0]
+CANDIDATES = [[5.0, 5.0], [1.0, 9.0], [8.0, 2.0]]
+
+def _costAwareOptimizer(monkeypatch, cost_scale=1.0, **kwargs):
+    optimizer = BayesianOptimizer(n_init=0, n_iter=3, cost_aware=True, **kwargs)
+    optimizer.setExperiment(_experiment([({'x': 2.0, 'y': 2.0}, -3.0), ({'x': 6.0, 'y': 6.0}, -2.0)]))
+    optimizer.optimizer._gp = StubGP()
+    monkeypatch.setattr(optimizer, '_fitCostModel', lambda: StubCostModel(cost_scale))
+    monkeypatch.setattr(optimizer, '_randomCandidates', lambda: np.array(CANDIDATES))
+    monkeypatch.setattr(bayesian_optimizer, 'acq_max', lambda **kwargs: np.array(SUGGESTION))
+    return optimizer
+
+
+def test_cost_aware_suggestion(monkeypatch):
+    optimizer = _costAwareOptimizer(monkeypatch)
+
+    # with the same expected improvement everywhere, the candidate predicted to run the shortest
+    configs = next(optimizer)
+    assert {config.parameter.name: config.value for config in configs} == {'x': 1.0, 'y': 9.0}
+    assert optimizer.predicted_cost == pytest.approx(2.0)
+
+
+def test_not_cost_aware_without_running_times(monkeypatch):
+    optimizer = _costAwareOptimizer(monkeypatch)
+    optimizer.previous_trials = [trial._replace(obj_parameters={}) for trial in optimizer.previous_trials]
+
+    configs = next(optimizer)
+    assert {config.parameter.name: config.value for config in configs} == {'x': 9.0, 'y': 9.0}
+    assert optimizer.predicted_cost is None
+
+
+def test_stop_on_projected_budget(monkeypatch):
+    # the shortest candidate is predicted to run 20s, more than the 10s budget
+    optimizer = _costAwareOptimizer(monkeypatch, cost_scale=10.0, budget=10)
+    with pytest.raises(StopIteration):
+        next(optimizer)
+    assert optimizer.stop_flag
+    assert optimizer.stop_decision.policy == 'ProjectedBudget'
+    assert optimizer.predicted_cost == pytest.approx(20.0)
+    with pytest.raises(StopIteration):
+        next(optimizer)
+
+    optimizer = _costAwareOptimizer(monkeypatch, cost_scale=10.0, budget=30)
+    assert len(next(optimizer)) == 2
+    assert optimizer.stop_decision is None
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip('bayes_opt')
+
+from paropt.optimizer import CoordinateSearch
+from paropt.storage.entities import Experiment, Parameter, ParameterConfig, Trial, PARAMETER_TYPE_INT
+
+
+def _configsToDict(parameter_configs):
+    return {config.parameter.name: config.value for config in parameter_configs}
+
+
+def test_frozen_parameters_kept_out_of_search():
+    parameters = [
+        Parameter(name='x', minimum=0, maximum=10),
+        Parameter(name='y', minimum=0, maximum=4, type=PARAMETER_TYPE_INT),
+        Parameter(name='z', minimum=0, maximum=5, type=PARAMETER_TYPE_INT),
+    ]
+    optimizer = CoordinateSearch(n_init=1, n_iter=20)
+    optimizer.setExperiment(Experiment(id=1, tool_name='tool', parameters=parameters, command_template_string='echo'))
+    parameter_configs = next(optimizer)
+    optimizer.register(Trial(experiment_id=1, run_number=1, outcome=-1.0, obj_parameters={},
+                             parameter_configs=parameter_configs))
+
+    # a float and an int parameter
+    optimizer.freezeParameters({'x': 3.7, 'y': 2})
+    suggestions = []
+    for _ in range(6):
+        parameter_configs = next(optimizer)
+        optimizer.register(Trial(experiment_id=1, run_number=1, outcome=-2.0, obj_parameters={},
+                                 parameter_configs=parameter_configs))
+        suggestions.append(_configsToDict(parameter_configs))
+
+    assert all(suggestion['x'] == 3.7 and suggestion['y'] == 2 for suggestion in suggestions)
+    # only the remaining parameter is searched, through all of its values
+    assert sorted(suggestion['z'] for suggestion in suggestions) == list(range(6))
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+pytest.importorskip('parsl')
+
+from paropt.runner.parsl import ExecutorCache
+from paropt.runner.parsl import executor_cache
+from paropt.storage.entities import LocalCompute, EC2Compute
+
+
+class FakeDFK():
+    def __init__(self, config):
+        self.config = config
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """parsl.load replaced to return a FakeDFK, records the loaded DFKs"""
+    loaded = []
+
+    def load(config):
+        dfk = FakeDFK(config)
+        loaded.append(dfk)
+        return dfk
+
+    monkeypatch.setattr(executor_cache.parsl, 'load', load)
+    monkeypatch.setattr(executor_cache.parsl, 'clear', lambda: None)
+    return loaded
+
+
+def _wait(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_reuse_for_same_compute(loads):
+    cache = ExecutorCache()
+    dfk = cache.acquire(LocalCompute(max_threads=2), 'config')
+    cache.release()
+    assert cache.acquire(LocalCompute(max_threads=2), 'other config') is dfk
+    cache.release()
+    assert len(loads) == 1
+    assert not dfk.cleaned_up
+    cache.close()
+    assert dfk.cleaned_up
+
+
+def test_replaced_when_compute_changes(loads):
+    cache = ExecutorCache()
+    first = cache.acquire(LocalCompute(max_threads=2), 'local')
+    cache.release()
+    second = cache.acquire(EC2Compute(instance_family='c5', instance_model='c5.large', ami='ami-1'), 'ec2')
+    assert first.cleaned_up
+    assert second is not first
+    assert second.config == 'ec2'
+    cache.release()
+    cache.close()
+
+
+def test_shut_down_after_idle_timeout(loads):
+    cache = ExecutorCache(idle_timeout=0.05)
+    dfk = cache.acquire(LocalCompute(max_threads=2), 'config')
+    cache.release()
+    assert _wait(lambda: dfk.cleaned_up)
+    # the next run loads parsl again
+    assert cache.acquire(LocalCompute(max_threads=2), 'config') is not dfk
+    cache.release()
+    cache.close()
+
+
+def test_acquired_before_idle_timeout_is_kept(loads):
+    cache = ExecutorCache(idle_timeout=0.05)
+    dfk = cache.acquire(LocalCompute(max_threads=2), 'config')
+    cache.release()
+    assert cache.acquire(LocalCompute(max_threads=2), 'config') is dfk
+    time.sleep(0.1)
+    assert not dfk.cleaned_up
+    cache.release()
+    cache.close()
+
+
+def test_not_reused_after_release_not_reusable(loads):
+    cache = ExecutorCache()
+    dfk = cache.acquire(LocalCompute(max_threads=2), 'config')
+    cache.release(reusable=False)
+    assert dfk.cleaned_up
+    assert cache.acquire(LocalCompute(max_threads=2), 'config') is not dfk
+    assert len(loads) == 2
+    cache.release()
+    cache.close()
+
+
+def test_one_run_at_a_time(loads):
+    cache = ExecutorCache()
+    cache.acquire(LocalCompute(max_threads=2), 'config')
+    with pytest.raises(Exception):
+        cache.acquire(LocalCompute(max_threads=2), 'config')
+    cache.release()
+    cache.close()
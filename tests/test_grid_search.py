@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip('bayes_opt')
+
+from paropt.optimizer import GridSearch
+from paropt.storage.entities import Experiment, Parameter, ParameterConfig, Trial
+
+
+def test_get_max_returns_params_dict():
+    parameters = [Parameter(name='x', minimum=0, maximum=10), Parameter(name='y', minimum=0, maximum=4)]
+    optimizer = GridSearch(num_configs_per_param=[2, 2])
+    optimizer.setExperiment(Experiment(id=1, tool_name='tool', parameters=parameters, command_template_string='echo'))
+    for outcome, parameter_configs in zip([-3.0, -1.0, -2.0, -4.0], optimizer):
+        optimizer.register(Trial(experiment_id=1, run_number=1, outcome=outcome, obj_parameters={},
+                                 parameter_configs=parameter_configs))
+    assert optimizer.getMax() == ({'x': 10, 'y': 0}, -1.0)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+from paropt.optimizer import Standardize, LogTransform, RankGaussian, ChainedTransform
+from paropt.optimizer.outcome_transform import Identity, getOutcomeTransform
+
+# negated running times, as the optimizers maximize
+OUTCOMES = [-120.0, -3.5, -0.2, -40.0, -3.5]
+
+def assertSameOrder(outcomes, transformed):
+    outcomes = np.asarray(outcomes)
+    assert np.array_equal(np.sign(np.subtract.outer(outcomes, outcomes)),
+                          np.sign(np.subtract.outer(transformed, transformed)))
+
+@pytest.mark.parametrize('outcome_transform', [Identity(), Standardize(), LogTransform(), RankGaussian(),
+                                               ChainedTransform([LogTransform(), Standardize()])])
+def test_keeps_order(outcome_transform):
+    for outcomes in (OUTCOMES, [-2.0, 0.0, 3.0, 1000.0], [5.0, 0.5, 50.0]):
+        transformed = outcome_transform(outcomes)
+        assert np.all(np.isfinite(transformed))
+        assertSameOrder(outcomes, transformed)
+
+@pytest.mark.parametrize('outcome_transform', [Standardize(), RankGaussian()])
+def test_constant_outcomes(outcome_transform):
+    assert np.array_equal(outcome_transform([-7.0, -7.0, -7.0]), [0.0, 0.0, 0.0])
+    assert np.array_equal(outcome_transform([-7.0]), [0.0])
+
+def test_identity():
+    assert np.array_equal(Identity()(OUTCOMES), OUTCOMES)
+
+def test_standardize():
+    transformed = Standardize()(OUTCOMES)
+    assert transformed.mean() == pytest.approx(0.0)
+    assert transformed.std() == pytest.approx(1.0)
+    # inverse
+    assert np.allclose(transformed * np.std(OUTCOMES) + np.mean(OUTCOMES), OUTCOMES)
+
+def test_log():
+    outcome_transform = LogTransform()
+    # inverses of each case: negative, positive and mixed outcomes
+    assert np.allclose(-np.exp(-outcome_transform(OUTCOMES)), OUTCOMES)
+    assert np.allclose(np.exp(outcome_transform([0.5, 8.0])), [0.5, 8.0])
+    mixed = np.array([-9.0, 0.0, 99.0])
+    transformed = outcome_transform(mixed)
+    assert np.allclose(np.sign(transformed) * np.expm1(np.abs(transformed)), mixed)
+
+def test_rank_gaussian():
+    transformed = RankGaussian()(OUTCOMES)
+    # ties get the same value
+    assert transformed[1] == transformed[4]
+    # distinct outcomes get normal quantiles symmetric around the median
+    assert np.allclose(RankGaussian()([-4.0, -1.0, -2.0, -3.0]), [-1.15034938, 1.15034938, 0.31863936, -0.31863936])
+    # inverse: the rank of each outcome is recovered from its value
+    assert np.array_equal(np.argsort(transformed, kind='mergesort'), np.argsort(OUTCOMES, kind='mergesort'))
+    # outliers don't change the values of the other outcomes
+    outlier = list(OUTCOMES)
+    outlier[0] = -1e9
+    assert np.array_equal(RankGaussian()(outlier), transformed)
+
+def test_chained():
+    transformed = ChainedTransform([LogTransform(), Standardize()])(OUTCOMES)
+    assert np.allclose(transformed, Standardize()(LogTransform()(OUTCOMES)))
+
+def test_get_outcome_transform():
+    assert isinstance(getOutcomeTransform(None), Identity)
+    rank = RankGaussian()
+    assert getOutcomeTransform(rank) is rank
+    assert isinstance(getOutcomeTransform('standardize'), Standardize)
+    chained = getOutcomeTransform('log, standardize')
+    assert [type(outcome_transform) for outcome_transform in chained.transforms] == [LogTransform, Standardize]
+    with pytest.raises(Exception, match='Unknown outcome transform'):
+        getOutcomeTransform('log,exp')
@@ -0,0 +1,105 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('parsl')
+
+from paropt.runner import RunConfig
+from paropt.runner.parsl.lib import timeCommand, waitScript, killScript, ScriptCancelled, CANCELLED_STDOUT
+
+if not os.path.isdir('/proc'):
+    pytest.skip('checks processes in /proc', allow_module_level=True)
+
+def _isRunning(pid):
+    """False once the process exited, also while it's a zombie nobody reaped yet"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # the state follows the command name, which is in parentheses
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+def _groupIsRunning(pgid):
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or not _isRunning(pid):
+            continue
+        try:
+            if os.getpgid(int(pid)) == pgid:
+                return True
+        except ProcessLookupError:
+            pass
+    return False
+
+def _waitForFile(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, f'{path} was not created'
+        time.sleep(0.05)
+    with open(path) as f:
+        return int(f.read())
+
+def _startScript(content):
+    return subprocess.Popen(['bash', '-c', content], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+def test_cancel_time_command(tmp_path, monkeypatch):
+    # scripts are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    pid_file = str(tmp_path / 'pid')
+    cancel_file = str(tmp_path / 'cancel')
+    # a command in the background, which the script's process group includes
+    run_config = RunConfig(
+        command_script_content=f'sleep 60 &\necho $$ > {pid_file}\nwait\n',
+        experiment_dict={},
+        cancel_file=cancel_file)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(timeCommand.func(run_config, timeout=60)))
+    thread.start()
+    pgid = _waitForFile(pid_file)
+    assert _groupIsRunning(pgid)
+    open(cancel_file, 'w').close()
+    thread.join(timeout=30)
+
+    assert not thread.is_alive()
+    assert results[0]['stdout'] == CANCELLED_STDOUT
+    assert results[0]['returncode'] != 0
+    assert not _groupIsRunning(pgid)
+
+def test_wait_script_cancelled(tmp_path):
+    cancel_file = str(tmp_path / 'cancel')
+    proc = _startScript('sleep 60')
+    open(cancel_file, 'w').close()
+    with pytest.raises(ScriptCancelled):
+        waitScript(proc, timeout=60, cancel_file=cancel_file, poll_interval=0.1)
+    assert proc.returncode == -signal.SIGTERM
+    assert not _groupIsRunning(proc.pid)
+
+def test_wait_script_timeout():
+    proc = _startScript('sleep 60')
+    with pytest.raises(subprocess.TimeoutExpired):
+        waitScript(proc, timeout=0.2, poll_interval=0.1)
+    assert not _groupIsRunning(proc.pid)
+
+def test_kill_script_escalates(tmp_path):
+    pid_file = str(tmp_path / 'pid')
+    # ignoring SIGTERM, as do the commands it starts
+    proc = _startScript(f"trap '' TERM\nsleep 60 &\necho $! > {pid_file}\nwait\n")
+    child_pid = _waitForFile(pid_file)
+
+    start_time = time.monotonic()
+    killScript(proc, grace_period=0.5)
+    assert time.monotonic() - start_time >= 0.5
+    assert proc.returncode == -signal.SIGKILL
+    assert not _groupIsRunning(proc.pid)
+    assert not _isRunning(child_pid)
+
+def test_kill_exited_script():
+    proc = _startScript('exit 3')
+    proc.wait()
+    killScript(proc, grace_period=0.5)
+    assert proc.returncode == 3
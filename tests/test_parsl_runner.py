@@ -0,0 +1,96 @@
+import concurrent.futures
+
+import pytest
+
+pytest.importorskip('parsl')
+pytest.importorskip('sqlalchemy')
+
+from paropt.optimizer import RandomSearch
+from paropt.runner import ParslRunner
+from paropt.runner.parsl import parsl_runner
+from paropt.storage import SQLiteDB
+from paropt.stopping import StoppingPolicy, TargetReached
+
+from test_sqlite_db import _experiment
+
+
+class FakeDFK():
+    def cleanup(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_parsl(monkeypatch):
+    """Runs don't start parsl executors, trials are run by fake_objective"""
+    monkeypatch.setattr(parsl_runner.parsl, 'load', lambda config: FakeDFK())
+    monkeypatch.setattr(parsl_runner.parsl, 'clear', lambda: None)
+
+
+def fake_objective(run_config, **kwargs):
+    """Completes right away, the same way timeCmd's result does"""
+    future = concurrent.futures.Future()
+    future.set_result({'returncode': 0, 'stdout': '', 'obj_output': -1.0, 'obj_parameters': {'running_time': 1.0}})
+    return future
+
+
+def _runner(tmp_path, **kwargs):
+    return ParslRunner(obj_func=fake_objective, optimizer=RandomSearch(n_iter=4), obj_func_params={},
+                       experiment=_experiment(), storage=SQLiteDB(str(tmp_path / 'paropt.db')),
+                       logs_root_dir=str(tmp_path), **kwargs)
+
+
+def _savedOutcomes(runner):
+    return [trial.outcome for trial in runner.storage.getTrials(runner.session, runner.experiment.id)]
+
+
+def test_pruning_error_does_not_fail_trial(tmp_path, monkeypatch):
+    def failingImportance(trials, parameters):
+        raise Exception('importance failed')
+    monkeypatch.setattr(parsl_runner, 'parameterImportance', failingImportance)
+
+    runner = _runner(tmp_path, prune_after=2)
+    runner.run()
+    runner.cleanup()
+    assert _savedOutcomes(runner) == [-1.0] * 4
+    assert runner.run_result['success']
+
+
+def test_parameter_importance_from_saved_trials(tmp_path):
+    runner = _runner(tmp_path, prune_after=4)
+    runner.optimizer.n_iter = 6
+    runner.run()
+    runner.cleanup()
+    assert runner.getParameterImportance() == {'x': 1.0}
+    # the only parameter is never pruned
+    assert runner.run_result['pruned_parameters'] == {}
+
+
+class FailingPolicy(StoppingPolicy):
+    def _check(self, trial, optimizer):
+        raise Exception('policy failed')
+
+
+def test_stopping_policy_error_fails_run(tmp_path):
+    runner = _runner(tmp_path, stopping_policy=FailingPolicy())
+    with pytest.raises(Exception, match='policy failed'):
+        runner.run()
+    runner.cleanup()
+    # the trial is saved once, not again as a failed trial
+    assert _savedOutcomes(runner) == [-1.0]
+
+
+def test_optimizer_stopping_policy_error_fails_run(tmp_path):
+    runner = _runner(tmp_path)
+    runner.optimizer.stopping_policy = FailingPolicy()
+    with pytest.raises(Exception, match='policy failed'):
+        runner.run()
+    runner.cleanup()
+    assert _savedOutcomes(runner) == [-1.0]
+
+
+def test_stopping_policy_stops_run(tmp_path):
+    runner = _runner(tmp_path, stopping_policy=TargetReached(-1.0))
+    runner.run()
+    runner.cleanup()
+    assert _savedOutcomes(runner) == [-1.0]
+    assert runner.run_result['stop']['policy'] == 'TargetReached'
@@ -0,0 +1,293 @@
+import concurrent.futures
+import sqlite3
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from paropt.storage import SQLiteDB
+from paropt.storage.entities import Experiment, Parameter, ParameterConfig, Trial, LocalCompute, ExperimentSummary
+from paropt.storage.migrations import (SCHEMA_VERSION_KEY, getSchemaVersion, setInfo, SCHEMA_VERSION, HASH_MIGRATION_KEY,
+  getInfo, migrateHashes, createMissingIndexes)
+
+# fail fast instead of waiting the default 30s when the database is locked
+BUSY_TIMEOUT = 1000
+
+def _experiment():
+  return Experiment(
+    tool_name='tool',
+    parameters=[Parameter(name='x', minimum=0, maximum=10)],
+    command_template_string='echo ${x}',
+    compute=LocalCompute(max_threads=1))
+
+def _trial(experiment, run_number, x, outcome):
+  return Trial(
+    experiment_id=experiment.id,
+    run_number=run_number,
+    outcome=outcome,
+    parameter_configs=[ParameterConfig(parameter=experiment.parameters[0], value=x)],
+    obj_parameters={'running_time': outcome})
+
+def _createExperiment(storage):
+  session = storage.Session()
+  try:
+    experiment, _, _ = storage.getOrCreateExperiment(session, _experiment())
+    return experiment
+  finally:
+    session.close()
+
+def test_open_new_database(tmp_path):
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=BUSY_TIMEOUT)
+  session = storage.Session()
+  try:
+    assert getSchemaVersion(session) == SCHEMA_VERSION
+  finally:
+    session.close()
+
+def test_open_existing_database(tmp_path):
+  path = str(tmp_path / 'paropt.db')
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  experiment = _createExperiment(storage)
+  session = storage.Session()
+  storage.saveResult(session, _trial(experiment, 1, 1, 2.0))
+  session.close()
+
+  # an existing database at a previous version, from before summaries were kept
+  session = storage.Session()
+  session.query(ExperimentSummary).delete()
+  setInfo(session, SCHEMA_VERSION_KEY, 1)
+  session.commit()
+  session.close()
+  storage.engine.dispose()
+
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  session = storage.Session()
+  try:
+    assert getSchemaVersion(session) == SCHEMA_VERSION
+    summary = storage.getExperimentSummary(session, experiment.id)
+    assert summary.n_trials == 1
+    assert summary.best_outcome == 2.0
+  finally:
+    session.close()
+
+  # and once it's current
+  SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+
+def test_migrate_duplicate_hashes(tmp_path):
+  path = str(tmp_path / 'paropt.db')
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  _createExperiment(storage)
+
+  # a database from before hashes were unique, with an experiment created twice by concurrent workers
+  session = storage.Session()
+  session.execute('DROP INDEX ix_experiments_hash')
+  duplicate = _experiment()
+  session.add(duplicate)
+  setInfo(session, SCHEMA_VERSION_KEY, 0)
+  session.commit()
+  session.close()
+
+  with pytest.raises(Exception, match=r"rows with duplicate hash: \['\w+'\]"):
+    createMissingIndexes(storage.engine)
+
+  # the index isn't created as non-unique, the migration is retried once the duplicates are merged
+  connection = sqlite3.connect(path)
+  try:
+    assert connection.execute("SELECT name FROM sqlite_master WHERE name = 'ix_experiments_hash'").fetchall() == []
+    connection.execute('DELETE FROM experiments WHERE id = ?', (duplicate.id,))
+    connection.commit()
+    storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+    assert connection.execute("SELECT sql FROM sqlite_master WHERE name = 'ix_experiments_hash'").fetchall() == \
+      [('CREATE UNIQUE INDEX ix_experiments_hash ON experiments (hash)',)]
+  finally:
+    connection.close()
+  session = storage.Session()
+  try:
+    assert getSchemaVersion(session) == SCHEMA_VERSION
+  finally:
+    session.close()
+
+def test_migrate_hashes_after_collision(tmp_path):
+  path = str(tmp_path / 'paropt.db')
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  session = storage.Session()
+  for tool_name in ('a', 'b', 'c'):
+    experiment = _experiment()
+    experiment.tool_name = tool_name
+    storage.getOrCreateExperiment(session, experiment)
+  session.close()
+
+  # the columns used by hashes changed, and the third experiment is now the same as the first
+  connection = sqlite3.connect(path)
+  connection.execute("UPDATE experiments SET hash = 'outdated-' || id")
+  connection.execute("UPDATE experiments SET tool_name = 'a' WHERE id = 3")
+  connection.commit()
+
+  with pytest.raises(Exception, match=r"\{'\w+': \[1, 3\]\}"):
+    migrateHashes(storage.Session, chunk_size=1)
+  # the chunks before the collision are kept, the third experiment isn't written
+  assert connection.execute('SELECT id, hash FROM experiments WHERE id = 3').fetchall() == [(3, 'outdated-3')]
+  session = storage.Session()
+  try:
+    assert getInfo(session, HASH_MIGRATION_KEY) == '2'
+  finally:
+    session.close()
+
+  # once the duplicate is merged, the update resumes after the last written chunk
+  connection.execute('DELETE FROM parameters WHERE experiment_id = 3')
+  connection.execute('DELETE FROM experiments WHERE id = 3')
+  connection.execute("UPDATE experiments SET hash = 'outdated-' || id WHERE id = 1")
+  connection.commit()
+  connection.close()
+  migrateHashes(storage.Session, chunk_size=1)
+  session = storage.Session()
+  try:
+    assert getInfo(session, HASH_MIGRATION_KEY) is None
+    experiments = session.query(Experiment).order_by(Experiment.id).all()
+    assert [experiment.hash for experiment in experiments] == ['outdated-1', experiments[1].getHash()]
+  finally:
+    session.close()
+
+def test_concurrent_instances(tmp_path):
+  path = str(tmp_path / 'paropt.db')
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  write_behind_storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT, write_behind=True)
+  experiment = _createExperiment(storage)
+
+  # a read transaction left open, like a runner's session between trials, doesn't block the other instance
+  session = storage.Session()
+  storage.getOrCreateExperiment(session, _experiment())
+  other_session = write_behind_storage.Session()
+  other_experiment, _, _ = write_behind_storage.getOrCreateExperiment(other_session, _experiment())
+  write_behind_storage.saveResult(other_session, _trial(other_experiment, 1, 1, 1.0))
+  write_behind_storage.flush()
+  storage.saveResult(session, _trial(experiment, 1, 2, 2.0))
+  write_behind_storage.saveResult(other_session, _trial(other_experiment, 1, 3, 3.0))
+  write_behind_storage.close()
+
+  trials = storage.getTrials(session, experiment.id)
+  assert sorted(trial.outcome for trial in trials) == [1.0, 2.0, 3.0]
+  assert storage.getExperimentSummary(session, experiment.id).n_trials == 3
+  session.close()
+  other_session.close()
+
+def test_concurrent_writers(tmp_path):
+  path = str(tmp_path / 'paropt.db')
+  experiment = _createExperiment(SQLiteDB(path, busy_timeout=BUSY_TIMEOUT))
+  n_trials = 20
+
+  def saveTrials(run_number):
+    storage = SQLiteDB(path, busy_timeout=10000)
+    session = storage.Session()
+    try:
+      stored, _, _ = storage.getOrCreateExperiment(session, _experiment())
+      for i in range(n_trials):
+        # reads between writes, like a runner checking trials for pruning
+        storage.getTrials(session, stored.id)
+        storage.saveResult(session, _trial(stored, run_number, i % 10, float(i)))
+    finally:
+      session.close()
+
+  with concurrent.futures.ThreadPoolExecutor(2) as executor:
+    for future in [executor.submit(saveTrials, run_number) for run_number in (1, 2)]:
+      future.result()
+
+  storage = SQLiteDB(path, busy_timeout=BUSY_TIMEOUT)
+  session = storage.Session()
+  try:
+    assert len(storage.getTrials(session, experiment.id)) == 2 * n_trials
+    assert storage.getExperimentSummary(session, experiment.id).n_trials == 2 * n_trials
+  finally:
+    session.close()
+
+def test_concurrent_runners(tmp_path):
+  pytest.importorskip('parsl')
+  from paropt.runner import ParslRunner
+  from paropt.runner.parsl import timeCmd
+  from paropt.optimizer import RandomSearch
+
+  path = str(tmp_path / 'paropt.db')
+  runners = [
+    ParslRunner(obj_func=timeCmd, optimizer=RandomSearch(n_iter=1), experiment=_experiment(),
+                storage=SQLiteDB(path, busy_timeout=BUSY_TIMEOUT), logs_root_dir=str(tmp_path))
+    for _ in range(2)
+  ]
+  # the first runner's setup doesn't keep the second from saving trials
+  for runner in reversed(runners):
+    runner.storage.saveResult(runner.session, _trial(runner.experiment, runner.run_number, 1, 1.0))
+  assert len(runners[0].storage.getTrials(runners[0].session, runners[0].experiment.id)) == 2
+
+def test_summary_created_concurrently(tmp_path, monkeypatch):
+  from paropt.storage import summaries
+
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=BUSY_TIMEOUT)
+  experiment = _createExperiment(storage)
+  session = storage.Session()
+  other_session = storage.Session()
+  storage.saveResult(other_session, _trial(storage.getExperiment(other_session, experiment.id), 1, 1, 1.0))
+
+  # as if this session looked for the summaries before the other one inserted them
+  lock_summary = summaries._lockSummary
+  missed = set()
+  def lockSummary(session, summary_class, keys):
+    if summary_class not in missed:
+      missed.add(summary_class)
+      return None
+    return lock_summary(session, summary_class, keys)
+  monkeypatch.setattr(summaries, '_lockSummary', lockSummary)
+
+  storage.saveResult(session, _trial(storage.getExperiment(session, experiment.id), 1, 2, 2.0))
+  monkeypatch.setattr(summaries, '_lockSummary', lock_summary)
+  try:
+    assert len(storage.getTrials(session, experiment.id)) == 2
+    summary = storage.getExperimentSummary(session, experiment.id)
+    assert summary.n_trials == 2
+    assert summary.best_outcome == 2.0
+    assert storage.getRunSummaries(session, experiment.id)[0].n_trials == 2
+  finally:
+    session.close()
+    other_session.close()
+
+def _namedExperiment(tool_name):
+  experiment = _experiment()
+  experiment.tool_name = tool_name
+  return experiment
+
+def test_get_or_create_experiments(tmp_path):
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=BUSY_TIMEOUT)
+  existing = _createExperiment(storage)
+  session = storage.Session()
+  try:
+    results = storage.getOrCreateExperiments(session, [
+      _namedExperiment('a'), _experiment(), _namedExperiment('b'), _namedExperiment('a')])
+    assert [(experiment.tool_name, created) for experiment, created in results] == \
+      [('a', True), ('tool', False), ('b', True), ('a', False)]
+    assert results[1][0].id == existing.id
+    assert results[3][0] is results[0][0]
+    assert session.query(Experiment).count() == 3
+    assert storage.getOrCreateExperiments(session, []) == []
+  finally:
+    session.close()
+
+def test_get_or_create_experiments_created_concurrently(tmp_path, monkeypatch):
+  from paropt.storage import relational_db
+
+  storage = SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=BUSY_TIMEOUT)
+  other_storage = SQLiteDB(str(tmp_path / 'paropt.db'), busy_timeout=BUSY_TIMEOUT)
+  # another worker creates one of the experiments after they were looked up, before they're written
+  begin_write = relational_db.beginWrite
+  def beginWrite(session):
+    monkeypatch.setattr(relational_db, 'beginWrite', begin_write)
+    _createExperiment(other_storage)
+    begin_write(session)
+  monkeypatch.setattr(relational_db, 'beginWrite', beginWrite)
+
+  session = storage.Session()
+  try:
+    results = storage.getOrCreateExperiments(session, [_namedExperiment('a'), _experiment()])
+    # the batch is rolled back, and each experiment is got or created on its own
+    assert [(experiment.tool_name, created) for experiment, created in results] == [('a', True), ('tool', False)]
+    assert session.query(Experiment).count() == 2
+    assert session.query(Experiment).filter(Experiment.tool_name == 'a').one().id == results[0][0].id
+  finally:
+    session.close()
@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+import pytest
+
+from paropt.stopping import policies
+from paropt.stopping import WallClockBudget, AnyOf, TargetReached
+
+FakeTrial = namedtuple('FakeTrial', ['outcome', 'obj_parameters'])
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(policies.time, 'time', clock)
+    return clock
+
+def test_wall_clock_starts_with_run(clock):
+    policy = WallClockBudget(60)
+    # e.g. time spent waiting in the queue
+    clock.now += 120
+    policy.start()
+    assert policy.remaining == 60
+    clock.now += 30
+    assert policy.update(FakeTrial(-1, {})) is None
+    assert policy.remaining == 30
+    clock.now += 30
+    assert policy.update(FakeTrial(-1, {})) is not None
+
+def test_wall_clock_starts_on_first_use(clock):
+    policy = WallClockBudget(60)
+    clock.now += 120
+    assert policy.update(FakeTrial(-1, {})) is None
+    clock.now += 10
+    assert policy.remaining == 50
+
+def test_any_of_starts_policies(clock):
+    policy = AnyOf([WallClockBudget(60), TargetReached(0)])
+    clock.now += 120
+    policy.start()
+    clock.now += 10
+    assert policy.remaining == 50
+    assert policy.update(FakeTrial(-1, {})) is None
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from paropt.optimizer.base_optimizer import TrialRecord
+from paropt.optimizer.trial_history import TrialHistory
+from paropt.storage.entities import Parameter, PARAMETER_TYPE_INT, PARAMETER_TYPE_FLOAT
+
+def _history(capacity=2):
+    # out of name order, columns are sorted by name
+    parameters = [
+        Parameter(name='threads', type=PARAMETER_TYPE_INT, minimum=1, maximum=64),
+        Parameter(name='alpha', type=PARAMETER_TYPE_FLOAT, minimum=0, maximum=1),
+    ]
+    return TrialHistory(parameters, experiment_id=7, capacity=capacity)
+
+def _record(threads, alpha, outcome, running_time=None, run_number=1):
+    obj_parameters = {'running_time': running_time} if running_time is not None else {}
+    return TrialRecord(params={'threads': threads, 'alpha': alpha}, outcome=outcome, run_number=run_number,
+                       experiment_id=7, obj_parameters=obj_parameters)
+
+def test_grows_past_capacity():
+    history = _history(capacity=2)
+    records = [_record(threads, 0.5, -float(threads), running_time=float(threads)) for threads in range(1, 12)]
+    for i, record in enumerate(records):
+        assert history.add(record) == i
+
+    assert len(history) == 11
+    assert history.names == ['alpha', 'threads']
+    assert np.array_equal(history.params, [[0.5, threads] for threads in range(1, 12)])
+    assert np.array_equal(history.outcomes, [-float(threads) for threads in range(1, 12)])
+    assert np.array_equal(history.running_times, [float(threads) for threads in range(1, 12)])
+    assert [history.get(row) for row in range(11)] == records
+    assert all(history.find(record.params) == row for row, record in enumerate(records))
+
+def test_find_rounds_int_parameters():
+    history = _history()
+    history.add(_record(4, 0.25, -1.0))
+
+    # integer parameters are rounded the way they're used in scripts, float ones are compared exactly
+    assert history.find({'threads': 4.0, 'alpha': 0.25}) == 0
+    assert history.find({'threads': 3.6, 'alpha': 0.25}) == 0
+    assert history.find({'threads': 4.4, 'alpha': 0.25}) == 0
+    assert history.find({'threads': 4.6, 'alpha': 0.25}) is None
+    assert history.find({'threads': 4, 'alpha': 0.2500001}) is None
+
+def test_add_duplicate_config():
+    history = _history()
+    history.add(_record(4, 0.25, -1.0, run_number=1))
+    assert history.add(_record(4.2, 0.25, -3.0, running_time=3.0, run_number=2)) == 1
+
+    # both are stored, the first one is found
+    assert len(history) == 2
+    assert history.find({'threads': 4, 'alpha': 0.25}) == 0
+    assert history.get(1) == _record(4.2, 0.25, -3.0, running_time=3.0, run_number=2)
+    assert history.get(0).obj_parameters == {}
+    assert np.isnan(history.running_times[0])